@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc.
+
+"""
+Measures how long the IOLoop is blocked by large requests, per executor.
+
+A large XML body (the Shopify sample order, repeated) is parsed and rendered
+into a small summary, the way a PostTranslator would (without the POST), a
+number of times, a few requests at a time. Meanwhile a timer is scheduled
+every few milliseconds, and each time it runs late the IOLoop is counted as
+having been blocked for that long. This is run once with everything inline,
+and once for each of the thread and process pools:
+
+    python etc/benchmarks/executor.py --orders 500 --requests 50
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import optparse
+import os
+import re
+import time
+
+from tornado import gen
+from tornado import httpclient
+from tornado import ioloop
+
+from hooky import executor
+from hooky import utils
+from hooky.translators import base
+from hooky.translators import templates
+
+TEMPLATE = '{{#body.orders.order}}{{email}},{{/body.orders.order}}'
+
+parser = optparse.OptionParser()
+parser.add_option('-o', '--orders', dest='orders', default=500, type=int,
+                  help='Number of orders in each request body')
+parser.add_option('-n', '--requests', dest='requests', default=50, type=int,
+                  help='Number of requests to translate')
+parser.add_option('-c', '--concurrency', dest='concurrency', default=4,
+                  type=int, help='Requests translated at once')
+parser.add_option('-w', '--workers', dest='workers', default=None, type=int,
+                  help='Executor workers (def: one per CPU)')
+parser.add_option('-i', '--interval', dest='interval', default=0.005,
+                  type=float, help='Seconds between IOLoop lag checks')
+
+
+class LagProbe(object):
+    """Measures how late a regularly scheduled timer runs"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.blocked = 0
+        self.worst = 0
+        self._running = False
+
+    def start(self):
+        self._running = True
+        self._schedule()
+
+    def stop(self):
+        # Count a check that is overdue, but never got the chance to run
+        self._running = False
+        self._record()
+
+    def _schedule(self):
+        self._expected = time.time() + self.interval
+        ioloop.IOLoop.current().add_timeout(self._expected, self._check)
+
+    def _check(self):
+        if self._running:
+            self._record()
+            self._schedule()
+
+    def _record(self):
+        lag = max(0, time.time() - self._expected)
+        self.blocked += lag
+        self.worst = max(self.worst, lag)
+
+
+class SummaryTranslator(base.BaseTranslator):
+    """Renders TEMPLATE, like a PostTranslator without the POST"""
+
+    def __init__(self):
+        self._template = templates.parse(TEMPLATE)
+
+    @gen.coroutine
+    def submit(self, request):
+        data = yield self._loadData(request)
+        content = yield self._render(self._template, data, request)
+        raise gen.Return(content)
+
+
+def getBody(orders):
+    """Builds an XML body with the sample Shopify order repeated"""
+    source = open(os.path.join(utils.getRootPath(),
+                               'test_data/sources/shopify.xml')).read()
+    order = re.search(r'<order>.*</order>', source, re.S).group(0)
+    return '<orders>%s</orders>' % (order * orders)
+
+
+@gen.coroutine
+def run(translator, request, options):
+    probe = LagProbe(options.interval)
+    probe.start()
+
+    start = time.time()
+    for i in xrange(0, options.requests, options.concurrency):
+        count = min(options.concurrency, options.requests - i)
+        yield [translator.submit(request) for n in xrange(count)]
+    elapsed = time.time() - start
+
+    probe.stop()
+    raise gen.Return((elapsed, probe.blocked, probe.worst))
+
+
+def main():
+    (options, args) = parser.parse_args()
+
+    body = getBody(options.orders)
+    request = httpclient.HTTPRequest(
+        '/', method='POST', body=body,
+        headers={'Content-Type': 'application/xml'})
+    translator = SummaryTranslator()
+
+    print 'Translating %s requests of %s bytes, %s at a time' % (
+        options.requests, len(body), options.concurrency)
+
+    io_loop = ioloop.IOLoop.instance()
+    for kind in executor.KINDS:
+        executor.configure(kind=kind, workers=options.workers, threshold=0)
+        if executor.getKind() != kind:
+            print '%s: skipped, the futures package is not installed' % kind
+            continue
+
+        elapsed, blocked, worst = io_loop.run_sync(
+            lambda: run(translator, request, options), timeout=600)
+        print ('%s: %.0f requests/s, IOLoop blocked for %.3fs of %.3fs '
+               '(%.0f%%), longest block %.1fms' % (
+                   kind, options.requests / elapsed, blocked, elapsed,
+                   100 * blocked / elapsed, worst * 1000))
+
+    executor.configure()
+
+
+if __name__ == '__main__':
+    main()
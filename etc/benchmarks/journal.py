@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc.
+
+"""
+Measures how many deliveries per second the journal can accept.
+
+Each run appends a number of requests to a fresh journal in concurrent
+batches (as a busy server would see them), and waits for every one of them
+to be committed. Run it once for each fsync policy, on the disk you intend
+to keep the journal on:
+
+    python etc/benchmarks/journal.py --fsync always
+    python etc/benchmarks/journal.py --fsync batch --batch 100
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import optparse
+import shutil
+import tempfile
+import time
+
+from tornado import gen
+from tornado import httpserver
+from tornado import httputil
+from tornado import ioloop
+
+from hooky import journal
+
+parser = optparse.OptionParser()
+parser.add_option('-f', '--fsync', dest='fsync', default='batch',
+                  help='Fsync policy (%s)' % ', '.join(journal.FSYNC_POLICIES))
+parser.add_option('-i', '--interval', dest='interval', default=0, type=float,
+                  help='Fsync interval in seconds')
+parser.add_option('-n', '--requests', dest='requests', default=5000,
+                  type=int, help='Number of requests to journal')
+parser.add_option('-b', '--batch', dest='batch', default=50, type=int,
+                  help='Number of requests arriving at once')
+parser.add_option('-s', '--size', dest='size', default=2048, type=int,
+                  help='Request body size in bytes')
+parser.add_option('-d', '--dir', dest='dir', default=None,
+                  help='Directory to create the journal in (def: $TMPDIR)')
+
+
+@gen.coroutine
+def run(j, options):
+    request = httpserver.HTTPRequest(
+        'POST', '/hook/benchmark',
+        headers=httputil.HTTPHeaders({'Content-Type': 'application/json'}),
+        body='{"data": "%s"}' % ('x' * options.size))
+
+    start = time.time()
+    for i in xrange(0, options.requests, options.batch):
+        futures = [j.append('benchmark', ['Benchmark'], request)[1]
+                   for n in xrange(min(options.batch, options.requests - i))]
+        yield futures
+    raise gen.Return(time.time() - start)
+
+
+def main():
+    (options, args) = parser.parse_args()
+
+    path = tempfile.mkdtemp(dir=options.dir)
+    try:
+        j = journal.Journal(path, fsync=options.fsync,
+                            fsync_interval=options.interval)
+        j.open()
+        elapsed = ioloop.IOLoop.instance().run_sync(lambda: run(j, options))
+        j.close()
+    finally:
+        shutil.rmtree(path)
+
+    commits = journal.JOURNAL_COMMITS.value
+    print 'fsync=%s: %s requests in %.3fs (%.0f/s), %s commits' % (
+        options.fsync, options.requests, elapsed,
+        options.requests / elapsed, commits)
+
+
+if __name__ == '__main__':
+    main()
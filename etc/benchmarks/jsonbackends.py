@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc.
+
+"""
+Measures how fast each JSON backend parses the sample request bodies.
+
+Every JSON file in test_data/sources is parsed through parsers.parseJSON(),
+the way an inbound hook body is, once with each backend that is installed.
+Each sample is also repeated into a larger array, to show how the backends
+compare on big bodies:
+
+    python etc/benchmarks/jsonbackends.py --number 10000 --repeat 500
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import glob
+import optparse
+import os
+import timeit
+
+from hooky import jsonbackend
+from hooky import utils
+from hooky.translators import parsers
+
+parser = optparse.OptionParser()
+parser.add_option('-n', '--number', dest='number', default=10000, type=int,
+                  help='Number of times to parse each sample')
+parser.add_option('-r', '--repeat', dest='repeat', default=500, type=int,
+                  help='Copies of each sample in the large body')
+
+
+def getSamples(repeat):
+    """Returns (name, body) for each sample, and for each large body"""
+    samples = []
+    paths = glob.glob(os.path.join(utils.getRootPath(),
+                                   'test_data/sources/*.json'))
+    for path in sorted(paths):
+        name = os.path.basename(path)
+        body = open(path).read().strip()
+        samples.append((name, body))
+        samples.append(('%s x%s' % (name, repeat),
+                        '[%s]' % ','.join([body] * repeat)))
+    return samples
+
+
+def main():
+    (options, args) = parser.parse_args()
+
+    available = jsonbackend.getAvailable()
+    for backend in jsonbackend.BACKENDS:
+        if backend not in available:
+            print '%s: skipped, it is not installed' % backend
+
+    for name, body in getSamples(options.repeat):
+        # Parse big bodies fewer times, so that each takes about as long
+        number = max(1, options.number * 4096 / len(body))
+        print '%s (%s bytes, parsed %s times):' % (name, len(body), number)
+
+        for backend in available:
+            jsonbackend.configure(backend)
+            elapsed = min(timeit.repeat(lambda: parsers.parseJSON(body),
+                                        repeat=3, number=number))
+            print '  %s: %.0f bodies/s, %.1f MB/s' % (
+                backend, number / elapsed,
+                number * len(body) / elapsed / 1024 / 1024)
+
+    jsonbackend.configure()
+
+
+if __name__ == '__main__':
+    main()
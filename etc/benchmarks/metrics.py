@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc.
+
+
+"""
+Measures what it costs to update each kind of metric.
+
+Every metric update on the request path should cost well under a
+microsecond. Each one is timed here on its own, both held directly (as hot
+paths do) and looked up through labels() every time:
+
+    python etc/benchmarks/metrics.py --number 1000000
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import optparse
+import timeit
+
+parser = optparse.OptionParser()
+parser.add_option('-n', '--number', dest='number', default=1000000,
+                  type=int, help='Number of updates to time')
+
+SETUP = """
+from hooky import metrics
+counter = metrics.Counter('c', 'help', labels=('hook',))
+gauge = metrics.Gauge('g', 'help', labels=('hook',))
+summary = metrics.Summary('s', 'help', labels=('hook',))
+histogram = metrics.Histogram('h', 'help', labels=('hook',))
+child = {'counter': counter, 'gauge': gauge, 'summary': summary,
+         'histogram': histogram}[%r].labels('githubToPost')
+"""
+
+UPDATES = (
+    ('counter', 'child.inc()', "counter.labels('githubToPost').inc()"),
+    ('gauge', 'child.inc()', "gauge.labels('githubToPost').inc()"),
+    ('summary', 'child.observe(0.042)',
+     "summary.labels('githubToPost').observe(0.042)"),
+    ('histogram', 'child.observe(0.042)',
+     "histogram.labels('githubToPost').observe(0.042)"),
+)
+
+
+def main():
+    (options, args) = parser.parse_args()
+
+    for name, held, looked_up in UPDATES:
+        results = []
+        for statement in (held, looked_up):
+            elapsed = min(timeit.repeat(statement, SETUP % name, repeat=3,
+                                        number=options.number))
+            results.append(elapsed / options.number * 1e9)
+        print '%s: %.0fns per update (%.0fns with labels())' % (
+            name, results[0], results[1])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc.
+
+"""
+Measures outbound requests/sec with and without per-host client pools.
+
+A local stand-in for a downstream service is started on a random port. It
+answers every POST after a short delay, like a real remote service would.
+The same burst of requests is then sent to it three ways:
+
+    shared: Tornado's default shared AsyncHTTPClient (10 requests in flight)
+    pooled: A hooky.clients Pool with --max-clients requests in flight
+    curl: As above, using the keep-alive curl backend (if pycurl is here)
+
+    python etc/benchmarks/pooling.py --requests 2000 --max-clients 50
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import optparse
+import time
+
+from tornado import gen
+from tornado import httpclient
+from tornado import ioloop
+from tornado import netutil
+from tornado import web
+from tornado import httpserver
+
+from hooky import clients
+
+parser = optparse.OptionParser()
+parser.add_option('-n', '--requests', dest='requests', default=1000,
+                  type=int, help='Number of requests to send')
+parser.add_option('-c', '--max-clients', dest='max_clients', default=50,
+                  type=int, help='Requests in flight for the pooled client')
+parser.add_option('-d', '--delay', dest='delay', default=0.01, type=float,
+                  help='Seconds the stand-in service takes to respond')
+
+
+class DownstreamHandler(web.RequestHandler):
+    """Stand-in for a remote web hook receiver"""
+
+    def initialize(self, delay):
+        self.delay = delay
+
+    @web.asynchronous
+    def post(self):
+        ioloop.IOLoop.current().add_timeout(time.time() + self.delay,
+                                            lambda: self.finish('OK'))
+
+
+@gen.coroutine
+def burst(fetch, url, count):
+    """Sends count requests at once, returning the elapsed time"""
+    start = time.time()
+    yield [fetch(httpclient.HTTPRequest(url, method='POST', body='{}'))
+           for i in xrange(count)]
+    raise gen.Return(time.time() - start)
+
+
+def main():
+    (options, args) = parser.parse_args()
+
+    sockets = netutil.bind_sockets(0, '127.0.0.1')
+    port = sockets[0].getsockname()[1]
+    app = web.Application([(r'/', DownstreamHandler,
+                            {'delay': options.delay})])
+    server = httpserver.HTTPServer(app)
+    server.add_sockets(sockets)
+    url = 'http://127.0.0.1:%s/' % port
+
+    io_loop = ioloop.IOLoop.instance()
+    runs = [('shared', 'simple',
+             lambda: httpclient.AsyncHTTPClient().fetch)]
+    for name in ('simple', 'curl'):
+        if clients._getClientClass(name) is None:
+            print '%s: skipped, pycurl is not installed' % name
+            continue
+        runs.append(('pooled (%s)' % name, name,
+                     lambda: clients.getPool(url, options.max_clients).fetch))
+
+    for name, backend, getFetch in runs:
+        clients.configure(backend=backend)
+        fetch = getFetch()
+        elapsed = io_loop.run_sync(
+            lambda: burst(fetch, url, options.requests), timeout=600)
+        print '%s: %s requests in %.3fs (%.0f/s)' % (
+            name, options.requests, elapsed, options.requests / elapsed)
+
+    print 'Pool stats: %s' % clients.stats()
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
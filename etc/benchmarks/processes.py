@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc.
+
+"""
+Measures how inbound hooks/sec scales with the number of worker processes.
+
+For each process count, Hooky is started with --processes set to it, and a
+hook that runs the TestTranslator (which parses the body and renders a
+template, so is all CPU work) is hit with the Github sample payload for a
+while. The load comes from several client processes of its own, so that the
+client is not the bottleneck. Run it on a box with a few idle cores:
+
+    python etc/benchmarks/processes.py --processes 1,2,4 --clients 4
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import multiprocessing
+import optparse
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from tornado import gen
+from tornado import httpclient
+from tornado import ioloop
+from tornado import netutil
+from tornado import process
+
+from hooky import utils
+
+CONFIG = """
+[general]
+templates: %s
+
+[benchmark]
+type: hook
+translators: TestTranslator
+
+[TestTranslator]
+type: translator
+translator: hooky.translators.base.TestTranslator
+"""
+
+parser = optparse.OptionParser()
+parser.add_option('-P', '--processes', dest='processes', default=None,
+                  help='Comma separated worker process counts to try '
+                       '(def: 1, 2, 4 ... up to the number of CPUs)')
+parser.add_option('-c', '--clients', dest='clients', default=None, type=int,
+                  help='Number of client processes generating load '
+                       '(def: the number of CPUs)')
+parser.add_option('-k', '--concurrency', dest='concurrency', default=20,
+                  type=int, help='Requests in flight per client process')
+parser.add_option('-t', '--time', dest='time', default=10, type=float,
+                  help='Seconds to run each process count for')
+
+
+@gen.coroutine
+def hammer(url, body, concurrency, deadline):
+    """Keeps concurrency requests in flight until deadline, counting them"""
+    client = httpclient.AsyncHTTPClient(max_clients=concurrency)
+    counts = {'ok': 0, 'failed': 0}
+
+    @gen.coroutine
+    def loop():
+        while time.time() < deadline:
+            try:
+                yield client.fetch(url, method='POST', body=body,
+                                   headers={'Content-Type':
+                                            'application/json'})
+                counts['ok'] += 1
+            except httpclient.HTTPError:
+                counts['failed'] += 1
+
+    yield [loop() for i in xrange(concurrency)]
+    raise gen.Return(counts)
+
+
+def runClient(args):
+    """Entry point for each client process"""
+    url, body, concurrency, deadline = args
+    io_loop = ioloop.IOLoop()
+    return io_loop.run_sync(
+        lambda: hammer(url, body, concurrency, deadline), timeout=None)
+
+
+def waitForPort(port, timeout=10):
+    """Waits for the server to start accepting connections"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return
+        except socket.error:
+            time.sleep(0.1)
+    raise Exception('Hooky did not start listening on port %s' % port)
+
+
+def main():
+    (options, args) = parser.parse_args()
+
+    cpus = process.cpu_count()
+    if options.processes:
+        counts = [int(n) for n in options.processes.split(',')]
+    else:
+        counts = [n for n in (1, 2, 4, 8, 16, 32) if n <= cpus] or [1]
+    clients = options.clients or cpus
+
+    path = tempfile.mkdtemp()
+    config = os.path.join(path, 'config.ini')
+    with open(config, 'w') as f:
+        f.write(CONFIG % path)
+
+    body = open(os.path.join(utils.getRootPath(),
+                             'test_data/sources/github.json')).read()
+
+    # Grab a free port to run Hooky on
+    sock = netutil.bind_sockets(0, '127.0.0.1')[0]
+    port = sock.getsockname()[1]
+    sock.close()
+    url = 'http://127.0.0.1:%s/hook/benchmark' % port
+
+    pool = multiprocessing.Pool(clients)
+    baseline = None
+    try:
+        for count in counts:
+            server = subprocess.Popen(
+                [sys.executable, '-m', 'hooky.runserver', '-c', config,
+                 '-p', str(port), '-P', str(count), '-l', 'error'])
+            try:
+                waitForPort(port)
+                deadline = time.time() + options.time
+                results = pool.map(runClient, [
+                    (url, body, options.concurrency, deadline)] * clients)
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait()
+
+            ok = sum(r['ok'] for r in results)
+            failed = sum(r['failed'] for r in results)
+            rate = ok / options.time
+            baseline = baseline or rate
+            print '%s processes: %.0f hooks/s (%.2fx), %s failed' % (
+                count, rate, rate / baseline, failed)
+    finally:
+        pool.terminate()
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc.
+
+"""
+Measures FileConfig.getRoute() latency against the number of hooks.
+
+A config file is written out for each hook count, and a hook in the middle
+of it is looked up over and over. With the routing table the lookup time
+should stay flat, however many hooks there are.
+
+    python etc/benchmarks/routing.py --hooks 10,1000,10000 --lookups 10000
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import optparse
+import os
+import shutil
+import tempfile
+import timeit
+
+from hooky.config import file
+
+parser = optparse.OptionParser()
+parser.add_option('--hooks', dest='hooks', default='10,1000,10000',
+                  help='Comma separated hook counts to try')
+parser.add_option('-n', '--lookups', dest='lookups', default=10000,
+                  type=int, help='Number of getRoute() calls to time')
+
+
+def buildConfig(dirname, count):
+    """Writes out and loads a config file with `count` hooks"""
+    filename = os.path.join(dirname, 'config_%s.ini' % count)
+    fh = open(filename, 'w')
+    fh.write('[general]\ntemplates: templates\n\n'
+             '[TestTranslator]\ntype: translator\n'
+             'translator: hooky.translators.base.TestTranslator\n\n')
+    for i in xrange(count):
+        fh.write('[hook%s]\ntype: hook\n'
+                 'translators: TestTranslator\n\n' % i)
+    fh.close()
+    return file.FileConfig(filename)
+
+
+def main():
+    (options, args) = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for count in [int(c) for c in options.hooks.split(',')]:
+            config = buildConfig(tmpdir, count)
+            name = 'hook%s' % (count / 2)
+            timer = timeit.Timer(lambda: config.getRoute(name))
+            elapsed = min(timer.repeat(repeat=5, number=options.lookups))
+            print '%s hooks: %s lookups in %.3fs (%.2fus each)' % (
+                count, options.lookups, elapsed,
+                elapsed / options.lookups * 1000000)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc.
+
+"""
+Circuit breakers for outbound destinations.
+
+Each destination URL gets a CircuitBreaker. While the destination is healthy
+the breaker is 'closed' and calls go through as normal. After a number of
+failures in a row it 'opens', and calls fail immediately rather than waiting
+on a service that is known to be down. Once the cool-down period has passed
+it goes 'half-open' and lets a single call through to test the water: if it
+succeeds the breaker closes again, otherwise it re-opens for another
+cool-down period.
+
+    from hooky import breaker
+
+    circuit = breaker.getBreaker(url)
+    if not circuit.allow():
+        raise breaker.BreakerOpenException(circuit)
+    ...
+    circuit.success()  # or circuit.failure()
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import logging
+import time
+
+from hooky import metrics
+
+log = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+# Defaults used when not overridden in the translator config section
+DEFAULT_THRESHOLD = 5
+DEFAULT_COOLDOWN = 30
+
+BREAKER_STATE = metrics.gauge(
+    'hooky_breaker_open', 'Whether each circuit breaker is open (1) or not',
+    labels=('url',))
+BREAKER_TRIPS = metrics.counter(
+    'hooky_breaker_trips_total', 'Times each circuit breaker opened',
+    labels=('url',))
+BREAKER_REJECTED = metrics.counter(
+    'hooky_breaker_rejected_total', 'Calls failed fast by an open breaker',
+    labels=('url',))
+
+
+class BreakerOpenException(Exception):
+    """Raised in place of a call that an open breaker did not allow"""
+
+    def __init__(self, breaker):
+        Exception.__init__(self, 'Circuit breaker for %s is %s' %
+                           (breaker.name, breaker.state))
+        self.breaker = breaker
+
+
+class CircuitBreaker(object):
+    """Tracks the health of a single destination."""
+
+    def __init__(self, name, threshold=DEFAULT_THRESHOLD,
+                 cooldown=DEFAULT_COOLDOWN):
+        """Creates a closed breaker.
+
+        args:
+            name: String name of the destination (usually its URL)
+            threshold: Number of failures in a row that open the breaker
+            cooldown: Seconds to stay open before letting a call through
+        """
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = None
+
+        # Whether the single half-open test call is still outstanding
+        self._probing = False
+
+    def allow(self):
+        """Returns True if a call may be made right now.
+
+        A call that is allowed must be followed by a call to success() or
+        failure() once its outcome is known.
+        """
+        if self.state == CLOSED:
+            return True
+
+        if self.state == OPEN:
+            if time.time() - self.opened < self.cooldown:
+                BREAKER_REJECTED.labels(self.name).inc()
+                return False
+            log.info('Circuit breaker for %s is half-open' % self.name)
+            self.state = HALF_OPEN
+
+        # Half-open: let exactly one call through
+        if self._probing:
+            BREAKER_REJECTED.labels(self.name).inc()
+            return False
+
+        self._probing = True
+        return True
+
+    def success(self):
+        """Records a successful call, closing the breaker"""
+        if self.state != CLOSED:
+            log.info('Circuit breaker for %s is closed' % self.name)
+            BREAKER_STATE.labels(self.name).set(0)
+
+        self.state = CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def failure(self):
+        """Records a failed call, opening the breaker if needed"""
+        self.failures += 1
+        self._probing = False
+
+        if self.state == HALF_OPEN or self.failures >= self.threshold:
+            if self.state != OPEN:
+                log.warning('Circuit breaker for %s opened after %s '
+                            'failures' % (self.name, self.failures))
+                BREAKER_TRIPS.labels(self.name).inc()
+                BREAKER_STATE.labels(self.name).set(1)
+            self.state = OPEN
+            self.opened = time.time()
+
+    def __repr__(self):
+        return '<CircuitBreaker %s (%s)>' % (self.name, self.state)
+
+
+class PendingChanges(object):
+    """Breaker changes held back while a new config is checked.
+
+    See holdChanges(). Nothing here touches the breakers in use until
+    apply() is called.
+    """
+
+    def __init__(self):
+        # Name -> CircuitBreaker, for destinations with no breaker yet
+        self.breakers = {}
+
+        # Name -> (threshold, cooldown), for existing breakers
+        self.settings = {}
+
+    def getBreaker(self, name, threshold, cooldown):
+        """Records a getBreaker() call. See getBreaker()."""
+        try:
+            breaker = _breakers[name]
+        except KeyError:
+            pass
+        else:
+            self.settings[name] = (threshold, cooldown)
+            return breaker
+
+        try:
+            breaker = self.breakers[name]
+        except KeyError:
+            breaker = self.breakers[name] = CircuitBreaker(name, threshold,
+                                                           cooldown)
+        breaker.threshold = threshold
+        breaker.cooldown = cooldown
+        return breaker
+
+    def apply(self):
+        """Adds the new breakers, and changes the settings of existing ones"""
+        for name, breaker in self.breakers.items():
+            _breakers.setdefault(name, breaker)
+        for name, (threshold, cooldown) in self.settings.items():
+            _update(_breakers[name], threshold, cooldown)
+
+
+# Destination name -> CircuitBreaker
+_breakers = {}
+
+# The PendingChanges being collected, if any. See holdChanges().
+_pending = None
+
+
+def getBreaker(name, threshold=DEFAULT_THRESHOLD, cooldown=DEFAULT_COOLDOWN):
+    """Returns the CircuitBreaker for a destination, creating it if needed.
+
+    Every Translator calling the same destination shares its breaker. The
+    settings of whichever one asked for it last are used, so that a config
+    reload that changes them takes effect. The breaker's state is kept.
+
+    While changes are held (see holdChanges()), new breakers and new
+    settings are only recorded, and existing breakers are returned as is.
+
+    args:
+        name: String name of the destination (usually its URL)
+        threshold: See CircuitBreaker
+        cooldown: See CircuitBreaker
+
+    returns:
+        A CircuitBreaker object
+    """
+    if _pending is not None:
+        return _pending.getBreaker(name, threshold, cooldown)
+
+    try:
+        breaker = _breakers[name]
+    except KeyError:
+        breaker = _breakers[name] = CircuitBreaker(name, threshold, cooldown)
+        return breaker
+
+    _update(breaker, threshold, cooldown)
+    return breaker
+
+
+def _update(breaker, threshold, cooldown):
+    """Changes the settings of a breaker, keeping its state"""
+    if (breaker.threshold, breaker.cooldown) != (threshold, cooldown):
+        log.info('Circuit breaker for %s now opens after %s failures, for '
+                 '%ss' % (breaker.name, threshold, cooldown))
+        breaker.threshold = threshold
+        breaker.cooldown = cooldown
+
+
+def holdChanges():
+    """Holds back changes to the breakers until releaseChanges() is called.
+
+    Used while a new config is checked (by building its Translators), so
+    that a config that is then rejected changes nothing:
+
+        changes = breaker.holdChanges()
+        try:
+            ...build the Translators...
+        finally:
+            breaker.releaseChanges()
+        changes.apply()
+
+    returns:
+        The PendingChanges object that getBreaker() calls are recorded in
+    """
+    global _pending
+    _pending = PendingChanges()
+    return _pending
+
+
+def releaseChanges():
+    """Stops holding changes back. They are only made by apply()."""
+    global _pending
+    _pending = None
+
+
+def getBreakers():
+    """Returns a list of every CircuitBreaker, sorted by name"""
+    return [_breakers[name] for name in sorted(_breakers)]
+
+
+def clearBreakers():
+    """Forgets every CircuitBreaker, closing them all"""
+    _breakers.clear()
@@ -0,0 +1,251 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc.
+
+"""
+Outbound HTTP clients, pooled per destination host.
+
+Tornado's default AsyncHTTPClient is a single, shared client with a global
+limit of 10 requests in flight. One slow downstream service can fill all 10
+slots and hold up outbound hooks to every other service behind it.
+
+Instead, each destination (scheme, host and port) gets its own Pool with its
+own client and its own limit:
+
+    from hooky import clients
+
+    response = yield clients.getPool(url).fetch(request)
+
+Two client backends are available, picked with configure():
+
+    simple: Tornado's pure-Python client. Always available, but opens a new
+            connection for every request.
+    curl: Tornado's libcurl based client. Requires pycurl, and keeps
+          connections to each host alive between requests.
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import functools
+import logging
+import time
+import urlparse
+import weakref
+
+from tornado import ioloop
+from tornado import simple_httpclient
+
+from hooky import metrics
+
+log = logging.getLogger(__name__)
+
+BACKENDS = ('simple', 'curl')
+
+# Defaults used when not overridden in the [general] config section
+DEFAULT_BACKEND = 'simple'
+DEFAULT_MAX_CLIENTS = 10
+
+POOL_REQUESTS = metrics.counter(
+    'hooky_http_pool_requests_total', 'Outbound requests made by each pool',
+    labels=('host',))
+POOL_ACTIVE = metrics.gauge(
+    'hooky_http_pool_active', 'Outbound requests in flight in each pool',
+    labels=('host',))
+POOL_WAITING = metrics.gauge(
+    'hooky_http_pool_waiting', 'Outbound requests waiting for a free slot',
+    labels=('host',))
+POOL_SIZE = metrics.gauge(
+    'hooky_http_pool_size', 'Maximum outbound requests in flight per pool',
+    labels=('host',))
+POOL_FETCH_SECONDS = metrics.histogram(
+    'hooky_http_fetch_seconds', 'Outbound request latency (including time '
+    'waiting for a free slot)', labels=('host',))
+
+# The settings new Pools are created with. See configure().
+_settings = {'backend': DEFAULT_BACKEND, 'max_clients': DEFAULT_MAX_CLIENTS}
+
+# IOLoop -> {(host, max_clients): Pool}. Clients are bound to the IOLoop
+# they were built on, so each IOLoop gets its own set of pools.
+_pools = weakref.WeakKeyDictionary()
+
+
+def configure(backend=DEFAULT_BACKEND, max_clients=DEFAULT_MAX_CLIENTS):
+    """Sets the backend and default size used for new Pools.
+
+    Existing Pools are closed and thrown away, so this should be called
+    before any outbound requests are made.
+
+    args:
+        backend: One of BACKENDS
+        max_clients: Default number of requests in flight per host
+
+    raises:
+        ValueError if the backend is unknown
+    """
+    if backend not in BACKENDS:
+        raise ValueError('Invalid http_client "%s", must be one of %s' %
+                         (backend, BACKENDS))
+
+    if backend == 'curl' and _getClientClass('curl') is None:
+        log.warning('pycurl is not installed, using the simple HTTP client '
+                    'instead. Outbound connections will not be kept alive.')
+        backend = 'simple'
+
+    _settings['backend'] = backend
+    _settings['max_clients'] = int(max_clients)
+    for pools in _pools.values():
+        for pool in pools.values():
+            pool.close()
+    _pools.clear()
+
+
+def getPool(url, max_clients=None):
+    """Returns the Pool for the host that a URL points at.
+
+    args:
+        url: The full URL being requested
+        max_clients: Number of requests in flight for this host (def: the
+                     configured default)
+
+    returns:
+        A Pool object
+    """
+    if not max_clients:
+        max_clients = _settings['max_clients']
+
+    io_loop = ioloop.IOLoop.current()
+    pools = _pools.setdefault(io_loop, {})
+    key = (getHost(url), int(max_clients))
+    try:
+        return pools[key]
+    except KeyError:
+        pool = pools[key] = Pool(key[0], key[1], _settings['backend'],
+                                 io_loop)
+        return pool
+
+
+def getHost(url):
+    """Returns the scheme://host:port that a URL points at"""
+    parsed = urlparse.urlsplit(url)
+    port = parsed.port or {'https': 443}.get(parsed.scheme, 80)
+    return '%s://%s:%s' % (parsed.scheme, parsed.hostname, port)
+
+
+def stats():
+    """Returns a list of stats dictionaries, one per Pool"""
+    return [pool.stats()
+            for pools in _pools.values() for pool in pools.values()]
+
+
+def _getClientClass(backend):
+    """Returns the AsyncHTTPClient class for a backend, or None"""
+    if backend == 'curl':
+        try:
+            from tornado import curl_httpclient
+        except ImportError:
+            return None
+        return curl_httpclient.CurlAsyncHTTPClient
+
+    return simple_httpclient.SimpleAsyncHTTPClient
+
+
+class Pool(object):
+    """An HTTP client dedicated to a single destination host."""
+
+    def __init__(self, host, max_clients, backend, io_loop):
+        """Builds the client.
+
+        args:
+            host: The scheme://host:port string this pool is for
+            max_clients: Maximum number of requests in flight at once
+            backend: One of BACKENDS
+            io_loop: The IOLoop the client runs on
+        """
+        self.host = host
+        self.max_clients = max_clients
+        self.backend = backend
+
+        # force_instance keeps Tornado from handing back its shared,
+        # per-IOLoop client.
+        client_class = _getClientClass(backend)
+        self.client = client_class(io_loop, force_instance=True,
+                                   max_clients=max_clients)
+
+        self.requests = 0
+        self.active = 0
+        self._last = (0, 0)
+
+        self._requests = POOL_REQUESTS.labels(host)
+        self._active = POOL_ACTIVE.labels(host)
+        self._waiting = POOL_WAITING.labels(host)
+        self._latency = POOL_FETCH_SECONDS.labels(host)
+        POOL_SIZE.labels(host).set(max_clients)
+
+        log.debug('Created %s HTTP client pool for %s (max_clients=%s)' %
+                  (backend, host, max_clients))
+
+    def fetch(self, request):
+        """Fetches a request. See AsyncHTTPClient.fetch().
+
+        args:
+            request: A tornado HTTPRequest object
+
+        returns:
+            A Future that resolves to the HTTPResponse
+        """
+        self.requests += 1
+        self.active += 1
+        self._requests.inc()
+        self._update()
+
+        future = self.client.fetch(request)
+        future.add_done_callback(functools.partial(self._finished,
+                                                   time.time()))
+        return future
+
+    def close(self):
+        """Closes the client, and the connections it holds open"""
+        self.client.close()
+        log.debug('Closed HTTP client pool for %s' % self.host)
+
+    @property
+    def waiting(self):
+        """Number of requests waiting for a free slot in the pool"""
+        return max(0, self.active - self.max_clients)
+
+    def stats(self):
+        """Returns a dictionary describing the pool utilization"""
+        return {'host': self.host,
+                'backend': self.backend,
+                'max_clients': self.max_clients,
+                'active': min(self.active, self.max_clients),
+                'waiting': self.waiting,
+                'requests': self.requests}
+
+    def _finished(self, start, future):
+        self._latency.observe(time.time() - start)
+        self.active -= 1
+        self._update()
+
+    def _update(self):
+        # Several pools may share a host (with different sizes), so the
+        # gauges are moved by our change rather than set outright.
+        active = min(self.active, self.max_clients)
+        waiting = self.waiting
+        self._active.inc(active - self._last[0])
+        self._waiting.inc(waiting - self._last[1])
+        self._last = (active, waiting)
+
+    def __repr__(self):
+        return '<Pool %s (%s/%s)>' % (self.host, self.active,
+                                      self.max_clients)
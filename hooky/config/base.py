@@ -34,10 +34,88 @@ class ConfigException(Exception):
     """Raised when the Configuration data is invalid for some reason"""
 
 
+class TranslatorSpec(object):
+    """A pre-resolved description of a single Translator definition.
+
+    Holds the Translator class reference and the keyword arguments that will
+    be passed to it, so that building a Translator for an inbound request
+    does not require walking the configuration backend again.
+
+    Translator classes that set the 'reentrant' class attribute to True are
+    only instantiated once per TranslatorSpec, and that single instance is
+    handed out for every request for the lifetime of the config. All other
+    Translators get a brand new instance on every call to build().
+    """
+
+    def __init__(self, name, cls, kwargs):
+        """Stores the resolved Translator definition.
+
+        args:
+            name: String representing the name of the translator
+            cls: The Translator class reference
+            kwargs: Dictionary of keyword arguments for the class
+        """
+        self.name = name
+        self.cls = cls
+        self.kwargs = kwargs
+        self._instance = None
+
+    def build(self):
+        """Returns a Translator object.
+
+        returns:
+            The shared Translator instance if the class is reentrant,
+            otherwise a freshly built Translator object.
+        """
+        if not getattr(self.cls, 'reentrant', False):
+            return self.cls(**self.kwargs)
+
+        if self._instance is None:
+            log.debug('Building shared %s instance' % self.name)
+            self._instance = self.cls(**self.kwargs)
+
+        return self._instance
+
+    def __repr__(self):
+        return '<TranslatorSpec %s (%s)>' % (self.name, self.cls.__name__)
+
+
+class HookRoute(object):
+    """A pre-built, read-only routing entry for a single hook.
+
+    HookRoute objects are built once when the configuration is loaded and
+    are never modified afterwards. A new routing table is built (and swapped
+    in as a whole) rather than editing an existing one.
+    """
+
+    def __init__(self, name, options, translators):
+        """Stores the hook definition.
+
+        args:
+            name: String representing the name of the hook
+            options: Dictionary of hook options (minus 'translators')
+            translators: Tuple of TranslatorSpec objects
+        """
+        self.name = name
+        self.options = options
+        self.translators = translators
+
+    def getTranslators(self):
+        """Returns a list of fully built Translator objects for this hook."""
+        return [spec.build() for spec in self.translators]
+
+    def __repr__(self):
+        return '<HookRoute %s -> %s>' % (self.name, list(self.translators))
+
+
 class BaseConfig(object):
     """Abstract object that defines the public methods for a Config object"""
     abstract = True
 
+    # Routing table of hook name -> HookRoute. This is built once by
+    # _buildRoutes() and then only ever read from.
+    _routes = None
+
     def getGeneral(self):
         """Returns the global Hooky configuration parameters.
 
@@ -67,9 +145,97 @@ class BaseConfig(object):
         returns:
             A dictionary object that looks something like:
                 { 'translators': [ <GithubTranslator>, <FooBarTranslator> ] }
+
+        raises:
+            ConfigException if the supplied name does not exist
+        """
+        route = self.getRoute(name)
+        config = dict(route.options)
+        config['translators'] = route.getTranslators()
+        return config
+
+    def reload(self):
+        """Re-reads the configuration, swapping it in if it is valid.
+
+        raises:
+            ConfigException if the new configuration is invalid
         """
         raise NotImplementedError('Not implemented. Use one of my subclasses.')
 
+    def hasChanged(self):
+        """Returns True if the configuration source has changed.
+
+        Config backends that can't tell always return False, in which case
+        the configuration is only reloaded on request (SIGHUP).
+        """
+        return False
+
+    def getRoute(self, name):
+        """Returns the pre-built HookRoute object for the supplied hook name.
+
+        This is the method used on the request path. It is a single lookup
+        in the routing table that was built when the config was loaded.
+
+        args:
+            name: String representing the name of the hook
+
+        returns:
+            A HookRoute object
+
+        raises:
+            ConfigException if the supplied name does not exist
+        """
+        if self._routes is None:
+            self._routes = self._buildRoutes()
+
+        try:
+            return self._routes[name]
+        except KeyError:
+            raise ConfigException('Hook "%s" does not exist in config' % name)
+
+    def _getHookDefinition(self, name):
+        """Returns the raw configuration for a single hook.
+
+        args:
+            name: String representing the name of the hook
+
+        returns:
+            A dictionary object that looks something like:
+                { 'type': 'hook',
+                  'translators': [ 'TranslatorA', 'TranslatorB' ],
+                }
+
+        raises:
+            ConfigException if the supplied name does not exist
+        """
+        raise NotImplementedError('Not implemented. Use one of my subclasses.')
+
+    def _buildRoutes(self):
+        """Builds the hook routing table from the configuration backend.
+
+        Walks every configured hook once and resolves each of its Translator
+        definitions into a TranslatorSpec. Translator definitions shared by
+        several hooks are only resolved once.
+
+        returns:
+            A dictionary of hook name -> HookRoute objects
+        """
+        specs = {}
+        routes = {}
+
+        for name in self.getHookList():
+            options = self._getHookDefinition(name)
+            translators = []
+            for definition in options.pop('translators', []):
+                if definition not in specs:
+                    specs[definition] = self._getTranslatorSpec(definition)
+                translators.append(specs[definition])
+
+            routes[name] = HookRoute(name, options, tuple(translators))
+
+        log.debug('Built routes for %s hooks' % len(routes))
+        return routes
+
     def _getTranslatorConfig(self, name):
         """Returns a Translator configuration.
 
@@ -100,6 +266,24 @@ class BaseConfig(object):
             A Translator object built with the config parameters returned by
             self._getTranslatorConfig().
         """
+        return self._getTranslatorSpec(name).build()
+
+    def _getTranslatorSpec(self, name):
+        """Returns a TranslatorSpec object.
+
+        Resolves the Translator class and its keyword arguments without
+        actually instantiating the Translator.
+
+        args:
+            name: String representing the name of the translator
+
+        returns:
+            A TranslatorSpec object built with the config parameters returned
+            by self._getTranslatorConfig().
+
+        raises:
+            ConfigException if the Translator class cannot be found
+        """
         # Get the configuration for a supplied Translator definition.
         config = self._getTranslatorConfig(name)
         class_string = config['translator']
@@ -116,13 +300,15 @@ class BaseConfig(object):
         del config['type']
         del config['translator']
 
-        # Now instantiate the class and return it.
+        # Now resolve the class and return the spec.
         try:
-            return utils.strToClass(class_string)(**config)
-        except AttributeError:
+            cls = utils.strToClass(class_string)
+        except (AttributeError, ImportError):
             raise ConfigException('Unable to convert "%s" to a proper object'
                                   % class_string)
 
+        return TranslatorSpec(name, cls, config)
+
     def _getTranslators(self, translators):
         """Returns a list of fully instantiated Translator objects.
 
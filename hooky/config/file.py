@@ -15,9 +15,15 @@
 """
 The FileConfig module uses ConfigParser as its backend for reading
 and returning configuration results. The configuration is loaded up
-once and is never re-read. Accesses to the public methods are very
-fast and reliable because they rely entirely on the objects already
-loaded into memory.
+once, and only re-read when reload() is called. Accesses to the public
+methods are very fast and reliable because they rely entirely on the
+objects already loaded into memory -- the hook routing table in
+particular is built once at load time.
+
+reload() builds a complete new snapshot of the config (parser, templates
+and routing table) on the side, and only swaps it in if the whole thing
+is valid. Requests that are already running hold on to the HookRoute they
+started with, so they finish against the old snapshot.
 
 Detailed config file explanations can be found in config.ini.example.
 
@@ -73,12 +79,15 @@ In the example config above, you would need to have the following files:
 
 __author__ = 'Matt Wise (wise@wiredgeek.net)'
 
+import copy
 import os
 import logging
 
 from ConfigParser import SafeConfigParser
 from ConfigParser import NoSectionError
 
+from hooky import breaker
+from hooky import utils
 from hooky.config import base
 
 
@@ -104,6 +113,15 @@ class FileConfig(base.BaseConfig):
         # _getTemplate() method. This prevents re-reads of templates.
         self._templates = {}
 
+        # Modification times of the config file and every template we have
+        # looked for (None if it didn't exist), so that changes to them can
+        # be spotted by hasChanged().
+        self._mtimes = {}
+
+        # Modification times of the files as of the last reload, if it
+        # failed. See hasChanged().
+        self._failed_mtimes = None
+
         # ConfigParser does not return any failures if there is no config
         # file read in ... it just returns an empty list. If the list is
         # empty, bail.
@@ -112,6 +130,105 @@ class FileConfig(base.BaseConfig):
         except IndexError:
             raise base.ConfigException('No configuration files found: %s' %
                                        config)
+        self._mtimes[self._config] = _getMTime(self._config)
+
+        # Build the hook routing table now, so that no configuration parsing
+        # happens while handling requests.
+        self._routes = self._buildRoutes()
+
+    def hasChanged(self):
+        """Returns True if the config file or any template has changed.
+
+        This only stat()s the files, it doesn't read them. After a reload
+        that failed, only changes made since then count, so that the same
+        broken files aren't reloaded over and over.
+        """
+        mtimes = self._failed_mtimes
+        if mtimes is None:
+            mtimes = self._mtimes
+
+        for filename, mtime in mtimes.items():
+            if _getMTime(filename) != mtime:
+                return True
+
+        return False
+
+    def reload(self):
+        """Re-reads the config file and any changed templates.
+
+        A new snapshot of the configuration is built and validated (every
+        Translator is built once) before anything is changed. If anything is
+        wrong with it, the current configuration is left untouched. Only the
+        templates that have changed on disk are read in again.
+
+        raises:
+            ConfigException if the new configuration is invalid
+        """
+        log.info('Reloading configuration from %s' % self._config)
+        utils.clearClassCache()
+
+        snapshot = copy.copy(self)
+        snapshot._parser = SafeConfigParser()
+        snapshot._mtimes = {self._config: _getMTime(self._config)}
+
+        # Building the Translators would change the shared circuit breakers
+        # right away, so those changes wait until the snapshot is in use.
+        changes = breaker.holdChanges()
+        try:
+            routes = self._loadSnapshot(snapshot)
+        except base.ConfigException:
+            # Remember what the files looked like, so that we only try again
+            # once one of them changes. The templates we hold are still the
+            # old ones, so _mtimes itself is left alone.
+            failed = dict((filename, _getMTime(filename))
+                          for filename in self._mtimes)
+            failed.update(snapshot._mtimes)
+            self._failed_mtimes = failed
+            raise
+        finally:
+            breaker.releaseChanges()
+
+        # Everything checks out, swap the new snapshot in
+        self._parser = snapshot._parser
+        self._templates = snapshot._templates
+        self._mtimes = snapshot._mtimes
+        self._failed_mtimes = None
+        self._routes = routes
+        changes.apply()
+        log.info('Reloaded configuration with %s hooks' % len(routes))
+
+    def _loadSnapshot(self, snapshot):
+        """Reads the config into a snapshot, and builds its routes.
+
+        args:
+            snapshot: A copy of this object, with a fresh parser
+
+        returns:
+            The snapshot's routing table, with every Translator built once
+
+        raises:
+            ConfigException if the new configuration is invalid
+        """
+        if not snapshot._parser.read(self._config):
+            raise base.ConfigException('No configuration files found: %s' %
+                                       self._config)
+
+        # Keep the templates that haven't changed (or appeared) on disk
+        snapshot._templates = {}
+        for filename, mtime in self._mtimes.items():
+            if filename in self._templates and _getMTime(filename) == mtime:
+                snapshot._templates[filename] = self._templates[filename]
+                snapshot._mtimes[filename] = mtime
+
+        routes = snapshot._buildRoutes()
+        for route in routes.values():
+            for spec in route.translators:
+                try:
+                    spec.build()
+                except Exception, e:
+                    raise base.ConfigException(
+                        'Unable to build translator %s: %s' % (spec.name, e))
+        return routes
 
     def getGeneral(self):
         """Returns the global Hooky configuration parameters.
@@ -151,27 +268,23 @@ class FileConfig(base.BaseConfig):
 
         return hooks
 
-    def getHookConfig(self, name):
-        """Returns configuration parameters for the supplied hook name.
-
-        Returns both the Hook configuration data as well as a list of
-        fully configured Translator objects associated with that hook.
+    def _getHookDefinition(self, name):
+        """Returns the raw configuration for a single hook.
 
         args:
             name: String representing the name of the hook
 
         returns:
             A dictionary object that looks something like:
-                { 'translators': [ <PostTranslator>] ,
+                { 'translators': [ 'GithubToHttpbinPost' ],
                   'type': 'hook',
-                  'url': 'http://httpbin.org',
                 }
 
         raises:
             ConfigException if the supplied name does not exist
         """
         # If the requested config section doesn't exist, bail.
-        if name not in self.getHookList():
+        if self._getSectionType(name) != 'hook':
             raise base.ConfigException('Hook "%s" does not exist in config' %
                                        name)
 
@@ -182,17 +295,31 @@ class FileConfig(base.BaseConfig):
         # add the values
         for option in self._parser.options(name):
             if option == 'translators':
-                # Handle Translators specially. We actually will create full
-                # Translator objects and pass references back in a list.
+                # Handle Translators specially. We return the list of
+                # Translator definition names rather than the raw string.
                 translator_string = self._parser.get(name, option)
-                translator_list = map(str.strip, translator_string.split(','))
-                config[option] = self._getTranslators(translator_list)
+                config[option] = map(str.strip, translator_string.split(','))
             else:
                 # Check if the option is meant to be a Bool or not.
                 config[option] = self._toBool(self._parser.get(name, option))
 
         return config
 
+    def _getSectionType(self, name):
+        """Returns the 'type' option of a config section.
+
+        args:
+            name: String representing the name of the section
+
+        returns:
+            The 'type' string, or None if the section (or option) is missing
+        """
+        if (self._parser.has_section(name) and
+                self._parser.has_option(name, 'type')):
+            return self._parser.get(name, 'type')
+
+        return None
+
     def _getTranslatorList(self):
         """Returns a list of the configured translator names.
 
@@ -221,7 +348,7 @@ class FileConfig(base.BaseConfig):
                   'template': '<some template here>',
                 }
         """
-        if name not in self._getTranslatorList():
+        if self._getSectionType(name) != 'translator':
             raise base.ConfigException('Translator "%s" does not exist '
                                        'in config' % name)
 
@@ -283,6 +410,9 @@ class FileConfig(base.BaseConfig):
             ConfigException if the template does not exist
         """
         if not filename in self._templates:
+            # Grab the modification time first, so that a change made while
+            # we're reading the file is still noticed later.
+            self._mtimes[filename] = _getMTime(filename)
             try:
                 fh = open(filename, 'r')
             except IOError:
@@ -295,3 +425,11 @@ class FileConfig(base.BaseConfig):
                 del fh
 
         return self._templates[filename]
+
+
+def _getMTime(filename):
+    """Returns the modification time of a file, or None if it is missing"""
+    try:
+        return os.stat(filename).st_mtime
+    except OSError:
+        return None
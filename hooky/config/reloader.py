@@ -0,0 +1,115 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc.
+
+"""
+Reloads a Config object while the service is running.
+
+A reload is triggered either by a SIGHUP, or (if an interval is set) by the
+config backend reporting that its source has changed. Either way the reload
+itself runs as a normal IOLoop callback, never from inside a signal handler
+or in the middle of a request.
+
+If the new configuration is invalid, the error is logged and the current
+configuration is kept.
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import logging
+import signal
+
+from tornado import ioloop
+
+from hooky import metrics
+from hooky.config import base
+
+log = logging.getLogger(__name__)
+
+CONFIG_RELOADS = metrics.counter(
+    'hooky_config_reloads_total', 'Configuration reloads, by result',
+    labels=('result',))
+
+
+class ConfigReloader(object):
+    """Watches a Config object, and reloads it when asked to."""
+
+    def __init__(self, config, interval=0, io_loop=None, callback=None):
+        """Sets up the reloader. Call start() to begin watching.
+
+        args:
+            config: A hooky.config.base.BaseConfig conforming object
+            interval: Seconds between checks for changes (def: 0, only
+                      reload on SIGHUP)
+            io_loop: The IOLoop to run on (def: IOLoop.instance())
+            callback: Called with the old and new [general] settings after
+                      each successful reload, to apply any that changed
+        """
+        self.config = config
+        self.callback = callback
+        self.interval = float(interval)
+        self.io_loop = io_loop or ioloop.IOLoop.instance()
+        self._checker = None
+
+    def start(self):
+        """Starts checking for changes every interval seconds"""
+        if self.interval > 0:
+            self._checker = ioloop.PeriodicCallback(
+                self.check, self.interval * 1000, io_loop=self.io_loop)
+            self._checker.start()
+
+    def stop(self):
+        """Stops checking for changes"""
+        if self._checker is not None:
+            self._checker.stop()
+            self._checker = None
+
+    def installSignalHandler(self):
+        """Reloads the configuration whenever we get a SIGHUP"""
+        signal.signal(signal.SIGHUP, self._handleSignal)
+
+    def check(self):
+        """Reloads the configuration if it has changed"""
+        if self.config.hasChanged():
+            self.reload()
+
+    def reload(self):
+        """Reloads the configuration.
+
+        returns:
+            True if the new configuration was swapped in, False if it was
+            invalid and the old one kept.
+        """
+        general = self.config.getGeneral()
+        try:
+            self.config.reload()
+        except NotImplementedError:
+            log.warning('%s does not support reloading' %
+                        self.config.__class__.__name__)
+            return False
+        except base.ConfigException, e:
+            log.error('Keeping the current configuration, the new one is '
+                      'invalid: %s' % e)
+            CONFIG_RELOADS.labels('failed').inc()
+            return False
+
+        CONFIG_RELOADS.labels('success').inc()
+        if self.callback is not None:
+            self.callback(general, self.config.getGeneral())
+        return True
+
+    def _handleSignal(self, signum, frame):
+        # Signal handlers can interrupt anything, so just hand the actual
+        # work off to the IOLoop.
+        log.info('Received SIGHUP, scheduling a configuration reload')
+        self.io_loop.add_callback_from_signal(self.reload)
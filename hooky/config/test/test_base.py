@@ -84,3 +84,45 @@ class TestBaseConfig(unittest.TestCase):
         # and validate the results against expected_translators.
         self.assertEquals(expected_translators,
                           self.config._getTranslators(['a', 'b']))
+
+    def testBuildRoutes(self):
+        """Tests that _buildRoutes() resolves shared translators once"""
+        self.config.getHookList = mock.Mock(return_value=['a', 'b'])
+        self.config._getHookDefinition = mock.Mock(
+            side_effect=lambda name: {'type': 'hook',
+                                      'translators': ['shared']})
+        spec = ConfigBase.TranslatorSpec(
+            'shared', TranslatorsBase.TestTranslator, {})
+        self.config._getTranslatorSpec = mock.Mock(return_value=spec)
+
+        routes = self.config._buildRoutes()
+        self.assertEquals(['a', 'b'], sorted(routes.keys()))
+        self.assertEquals((spec,), routes['a'].translators)
+        self.assertEquals({'type': 'hook'}, routes['a'].options)
+        self.config._getTranslatorSpec.assert_called_once_with('shared')
+
+    def testGetRoute(self):
+        """Tests that getRoute() returns routes and rejects unknown hooks"""
+        route = ConfigBase.HookRoute('a', {'type': 'hook'}, ())
+        self.config._buildRoutes = mock.Mock(return_value={'a': route})
+
+        self.assertEquals(route, self.config.getRoute('a'))
+        self.assertRaises(ConfigBase.ConfigException,
+                          self.config.getRoute, 'missing')
+
+        # The routing table must only be built once
+        self.assertEquals(1, self.config._buildRoutes.call_count)
+
+    def testTranslatorSpecBuild(self):
+        """Tests that reentrant translators are only built once"""
+        shared = ConfigBase.TranslatorSpec(
+            'shared', TranslatorsBase.TestTranslator, {})
+        self.assertTrue(shared.build() is shared.build())
+
+        # Non-reentrant translators get a new object on every build()
+        class PerRequestTranslator(TranslatorsBase.TestTranslator):
+            reentrant = False
+
+        per_request = ConfigBase.TranslatorSpec(
+            'per_request', PerRequestTranslator, {})
+        self.assertFalse(per_request.build() is per_request.build())
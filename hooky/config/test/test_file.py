@@ -1,5 +1,11 @@
+import os
+import shutil
+import tempfile
+
+import mock
 from tornado.testing import unittest
 
+from hooky import breaker
 from hooky import utils
 from hooky.translators import base as TranslatorsBase
 from hooky.translators import web
@@ -132,3 +138,188 @@ class TestFileConfig(unittest.TestCase):
         self.assertTrue(isinstance(translators[0], web.PostTranslator))
         self.assertTrue(isinstance(translators[1],
                                    TranslatorsBase.TestTranslator))
+
+    def testGetRoute(self):
+        """Test the getRoute() method"""
+        route = self.config.getRoute('githubToPost')
+        self.assertEquals('githubToPost', route.name)
+        self.assertEquals({'type': 'hook'}, route.options)
+        self.assertEquals(['GithubToHttpbinPost'],
+                          [spec.name for spec in route.translators])
+        self.assertTrue(isinstance(route.getTranslators()[0],
+                                   web.PostTranslator))
+
+        self.assertRaises(ConfigBase.ConfigException,
+                          self.config.getRoute,
+                          'GithubToHttpbinPost')
+
+
+class TestFileConfigRouting(unittest.TestCase):
+    """Tests the hook routing table that getRoute() uses.
+
+    See etc/benchmarks/routing.py for the lookup times.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _buildConfig(self, count):
+        """Writes out and loads a config file with `count` hooks"""
+        filename = os.path.join(self.tmpdir, 'config_%s.ini' % count)
+        fh = open(filename, 'w')
+        fh.write('[general]\ntemplates: templates\n\n'
+                 '[TestTranslator]\ntype: translator\n'
+                 'translator: hooky.translators.base.TestTranslator\n\n')
+        for i in xrange(count):
+            fh.write('[hook%s]\ntype: hook\n'
+                     'translators: TestTranslator\n\n' % i)
+        fh.close()
+        return file.FileConfig(filename)
+
+    def testRouteLookupIsFlat(self):
+        """getRoute() must not scan the config sections"""
+        config = self._buildConfig(100)
+
+        # Every route is built up front, so a lookup never goes back to the
+        # parsed config file
+        parser = mock.Mock(wraps=config._parser)
+        config._parser = parser
+        with mock.patch.object(config, '_buildRoutes') as build:
+            route = config.getRoute('hook50')
+            self.assertRaises(ConfigBase.ConfigException,
+                              config.getRoute, 'hook100')
+
+        self.assertEquals('hook50', route.name)
+        self.assertEquals([], parser.method_calls)
+        self.assertFalse(build.called)
+
+
+class TestFileConfigReload(unittest.TestCase):
+    """Tests reloading a FileConfig while its in use."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.tmpdir, 'templates'))
+        self.filename = os.path.join(self.tmpdir, 'config.ini')
+        self._writeTemplate('PostA', 'a')
+        self._writeTemplate('PostB', 'b')
+        self._writeConfig(['one'])
+        self.config = file.FileConfig(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _touch(self, filename):
+        """Moves a files mtime on, so the change is seen right away"""
+        mtime = os.stat(filename).st_mtime + 10
+        os.utime(filename, (mtime, mtime))
+
+    def _writeTemplate(self, name, content):
+        filename = os.path.join(self.tmpdir, 'templates', '%s.tmpl' % name)
+        existed = os.path.exists(filename)
+        open(filename, 'w').write(content)
+        if existed:
+            self._touch(filename)
+
+    def _writeConfig(self, hooks, translator='hooky.translators.web.'
+                                             'PostTranslator', threshold=5):
+        fh = open(self.filename, 'w')
+        fh.write('[general]\ntemplates: templates\n\n')
+        for name in ('PostA', 'PostB'):
+            fh.write('[%s]\ntype: translator\ntranslator: %s\n'
+                     'url: http://localhost/%s\n'
+                     'content_type: application/json\n'
+                     'breaker_threshold: %s\n\n' %
+                     (name, translator, name, threshold))
+        for hook in hooks:
+            fh.write('[%s]\ntype: hook\ntranslators: PostA, PostB\n\n' %
+                     hook)
+        fh.close()
+        if hasattr(self, 'config'):
+            self._touch(self.filename)
+
+    def testReload(self):
+        """Test that a reload swaps in a new routing table"""
+        route = self.config.getRoute('one')
+        self.assertFalse(self.config.hasChanged())
+
+        self._writeConfig(['one', 'two'])
+        self.assertTrue(self.config.hasChanged())
+        self.config.reload()
+        self.assertFalse(self.config.hasChanged())
+
+        self.assertEquals(['one', 'two'], sorted(self.config.getHookList()))
+        self.assertTrue(self.config.getRoute('two'))
+
+        # The old route is left alone for any requests still using it
+        self.assertFalse(route is self.config.getRoute('one'))
+        self.assertEquals(['PostA', 'PostB'],
+                          [spec.name for spec in route.translators])
+
+    def testReloadInvalid(self):
+        """Test that an invalid config is never swapped in"""
+        route = self.config.getRoute('one')
+        self._writeConfig(['one', 'two'], translator='hooky.missing.Class')
+
+        self.assertRaises(ConfigBase.ConfigException, self.config.reload)
+        self.assertTrue(route is self.config.getRoute('one'))
+        self.assertRaises(ConfigBase.ConfigException,
+                          self.config.getRoute, 'two')
+
+        # The broken config isn't tried again until it changes
+        self.assertFalse(self.config.hasChanged())
+        self._writeConfig(['one', 'two'])
+        self.assertTrue(self.config.hasChanged())
+        self.config.reload()
+        self.assertTrue(self.config.getRoute('two'))
+        self.assertFalse(self.config.hasChanged())
+
+    def testReloadInvalidBreakers(self):
+        """Test that an invalid config doesn't change the circuit breakers"""
+        circuit = breaker.getBreaker('http://localhost/PostA')
+        self.addCleanup(breaker.clearBreakers)
+
+        # PostA builds fine, but PostB (with a template that is missing)
+        # doesn't, so the whole config is rejected.
+        os.remove(os.path.join(self.tmpdir, 'templates', 'PostB.tmpl'))
+        self._writeConfig(['one'], threshold=2)
+        self.assertRaises(ConfigBase.ConfigException, self.config.reload)
+        self.assertEquals(5, circuit.threshold)
+
+        self._writeTemplate('PostB', 'b')
+        self.config.reload()
+        self.assertEquals(2, circuit.threshold)
+        self.assertTrue(circuit is breaker.getBreaker('http://localhost/PostA',
+                                                      threshold=2))
+
+    def testReloadTemplates(self):
+        """Test that only changed templates are read in again"""
+        template_a = os.path.join(self.tmpdir, 'templates', 'PostA.tmpl')
+        template_b = os.path.join(self.tmpdir, 'templates', 'PostB.tmpl')
+        unchanged = self.config._templates[template_b]
+
+        self._writeTemplate('PostA', 'new a')
+        self.assertTrue(self.config.hasChanged())
+        self.config.reload()
+
+        self.assertEquals('new a', self.config._templates[template_a])
+        self.assertTrue(unchanged is self.config._templates[template_b])
+        translator = self.config.getRoute('one').getTranslators()[0]
+        self.assertEquals('new a', translator.template)
+
+    def testNewTemplate(self):
+        """Test that a template appearing counts as a change"""
+        fh = open(self.filename, 'a')
+        fh.write('[PostC]\ntype: translator\n'
+                 'translator: hooky.translators.base.TestTranslator\n\n'
+                 '[three]\ntype: hook\ntranslators: PostC\n')
+        fh.close()
+        self._touch(self.filename)
+        self.config.reload()
+        self.assertFalse(self.config.hasChanged())
+
+        self._writeTemplate('PostC', 'c')
+        self.assertTrue(self.config.hasChanged())
@@ -0,0 +1,63 @@
+import mock
+
+from tornado import testing
+
+from hooky.config import base
+from hooky.config import reloader
+
+
+class TestConfigReloader(testing.AsyncTestCase):
+    def setUp(self):
+        super(TestConfigReloader, self).setUp()
+        self.config = mock.Mock()
+        self.reloader = reloader.ConfigReloader(self.config, interval=0.01,
+                                                io_loop=self.io_loop)
+
+    def testCheck(self):
+        """Test that the config is only reloaded if it has changed"""
+        self.config.hasChanged.return_value = False
+        self.reloader.check()
+        self.assertFalse(self.config.reload.called)
+
+        self.config.hasChanged.return_value = True
+        self.reloader.check()
+        self.assertTrue(self.config.reload.called)
+
+    def testReloadFailure(self):
+        """Test that a bad config is reported rather than raised"""
+        self.config.reload.side_effect = base.ConfigException('Bad')
+        self.assertFalse(self.reloader.reload())
+
+        self.config.reload.side_effect = NotImplementedError()
+        self.assertFalse(self.reloader.reload())
+
+        self.config.reload.side_effect = None
+        self.assertTrue(self.reloader.reload())
+
+    def testStart(self):
+        """Test that changes are checked for on an interval"""
+        self.config.hasChanged.return_value = True
+        self.config.reload.side_effect = lambda: self.stop()
+        self.reloader.start()
+        self.wait()
+        self.reloader.stop()
+
+    def testSignal(self):
+        """Test that a SIGHUP schedules a reload on the IOLoop"""
+        self.config.reload.side_effect = lambda: self.stop()
+        self.reloader._handleSignal(1, None)
+        self.assertFalse(self.config.reload.called)
+        self.wait()
+
+    def testCallback(self):
+        """Test that the callback gets the [general] settings, on success"""
+        callback = mock.Mock()
+        self.reloader.callback = callback
+        self.config.getGeneral.side_effect = [{'a': 1}, {'a': 2}, {'a': 2}]
+
+        self.assertTrue(self.reloader.reload())
+        callback.assert_called_once_with({'a': 1}, {'a': 2})
+
+        self.config.reload.side_effect = base.ConfigException('Bad')
+        self.assertFalse(self.reloader.reload())
+        self.assertEquals(1, callback.call_count)
@@ -0,0 +1,481 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc.
+
+"""
+Delivers inbound webhooks to the Translators configured for their hook.
+
+dispatch() hands a single request to every Translator of a hook at once and
+collects their results. It is used directly by the HookHandler for normal
+(synchronous) hooks, where the sender waits for the results.
+
+Hooks configured with 'mode: async' are instead put on a DeliveryQueue. The
+sender immediately gets a 202 response, and a bounded pool of workers on the
+IOLoop drains the queue in the background.
+
+A DeliveryQueue can optionally be backed by a hooky.journal.Journal. Queued
+requests are then written to disk before they are dispatched (and before the
+sender gets its 202), and are replayed if Hooky is restarted before all of
+their Translators have finished with them. A Translator that fails to
+deliver a journaled request is retried a few times, with a growing delay in
+between. Once it is out of retries, or if its result says that the failure
+is not worth retrying, the request is moved to the journal's dead-letter
+file instead.
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import collections
+import logging
+import time
+
+from tornado import concurrent
+from tornado import gen
+from tornado import ioloop
+
+from hooky import metrics
+from hooky import monitor
+from hooky import retry
+from hooky import utils
+from hooky.config.base import ConfigException
+from hooky.config.base import HookRoute
+from hooky.translators import context
+
+log = logging.getLogger(__name__)
+
+# Default number of queued deliveries worked on at once.
+DEFAULT_WORKERS = 10
+
+# Defaults for retrying failed journaled deliveries: the number of retries,
+# and the seconds to wait before the first one (doubling up to the cap).
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 1
+RETRY_CAP = 60
+
+QUEUE_DEPTH = metrics.gauge(
+    'hooky_queue_depth', 'Deliveries waiting in the queue')
+QUEUE_BUSY = metrics.gauge(
+    'hooky_queue_workers_busy', 'Queue workers currently delivering')
+QUEUE_ENQUEUED = metrics.counter(
+    'hooky_queue_enqueued_total', 'Deliveries accepted into the queue')
+QUEUE_REJECTED = metrics.counter(
+    'hooky_queue_rejected_total', 'Deliveries rejected by a full queue')
+QUEUE_DELIVERED = metrics.counter(
+    'hooky_queue_delivered_total', 'Deliveries drained from the queue')
+QUEUE_RETRIES = metrics.counter(
+    'hooky_queue_retries_total', 'Failed journaled deliveries scheduled for '
+    'a retry')
+QUEUE_WAIT = metrics.summary(
+    'hooky_queue_wait_seconds', 'Time deliveries spent waiting in the queue')
+TRANSLATOR_SECONDS = metrics.histogram(
+    'hooky_translator_seconds', 'Time taken by each translator of each hook',
+    labels=('hook', 'translator'))
+TRANSLATOR_RESULTS = metrics.counter(
+    'hooky_translator_results_total', 'Translator results, by outcome',
+    labels=('hook', 'translator', 'result'))
+
+
+class QueueFullException(Exception):
+    """Raised when a delivery is put on a DeliveryQueue that is full"""
+
+
+@gen.coroutine
+def dispatch(route, request, on_result=None):
+    """Submits a request to every Translator of a hook concurrently.
+
+    The 'concurrency' and 'timeout' options of the hook are honored. See
+    hooky.web.hook.HookHandler for details.
+
+    args:
+        route: A hooky.config.base.HookRoute object
+        request: A hooky.translators.context.RequestContext object
+        on_result: Optional function called with (index, result) as soon as
+                   each individual Translator finishes
+
+    returns:
+        A list of result dictionaries, one per Translator (in the order they
+        are configured). Each has a Boolean 'success' and a 'message' key:
+
+        [ {'success': True, 'message': 'OK' }, ... ]
+
+        Failures that are not worth retrying also have 'retryable' set to
+        False.
+    """
+    translators = route.getTranslators()
+    concurrency = int(route.options.get('concurrency', 0))
+    timeout = float(route.options.get('timeout', 0))
+
+    # Hand the Translators out to a limited number of workers. Each
+    # worker only picks up the next Translator once its last one is
+    # done, which caps the number running at once.
+    pending = list(enumerate(translators))
+    results = [None] * len(translators)
+
+    @gen.coroutine
+    def worker():
+        while pending:
+            index, translator = pending.pop(0)
+            name = route.translators[index].name
+            start = time.time()
+
+            # Blame anything the translator does that blocks the IOLoop on
+            # it. The StackContext can't be held open across the yield.
+            with monitor.activity(route.name, name):
+                future = _submit(translator, request, timeout)
+            results[index] = yield future
+
+            TRANSLATOR_SECONDS.labels(route.name, name).observe(
+                time.time() - start)
+            TRANSLATOR_RESULTS.labels(
+                route.name, name,
+                'success' if results[index]['success'] else 'failure').inc()
+
+            if on_result is not None:
+                on_result(index, results[index])
+
+    workers = len(translators)
+    if concurrency > 0:
+        workers = min(concurrency, workers)
+    yield [worker() for i in xrange(workers)]
+
+    raise gen.Return(results)
+
+
+@gen.coroutine
+def _submit(translator, request, timeout):
+    """Submits a request to a single Translator.
+
+    args:
+        translator: A Translator object
+        request: The RequestContext to submit
+        timeout: Seconds to wait for the Translator, or 0 for no limit
+
+    returns:
+        A result dictionary. See dispatch().
+    """
+    try:
+        future = translator.submit(request)
+        if timeout > 0:
+            future = utils.withTimeout(future, timeout)
+        response = yield future
+    except utils.TimeoutError, e:
+        log.error('Translator %s failed: %s' % (translator, e))
+        raise gen.Return({'success': False, 'message': str(e)})
+    except Exception, e:
+        # Most likely a bug, or a request it can't handle. Either way, trying
+        # again won't help.
+        log.exception('Translator %s raised an exception' % translator)
+        raise gen.Return({'success': False,
+                          'message': 'Internal error: %s' % e,
+                          'retryable': False})
+
+    log.debug('Translator response: %s' % response)
+    try:
+        result = {'success': bool(response['success']),
+                  'message': response['message']}
+    except (KeyError, TypeError), e:
+        log.error('Translator returned invalid results: %s' % e)
+        raise gen.Return({'success': False,
+                          'message': 'Invalid translator results',
+                          'retryable': False})
+
+    if not result['success'] and response.get('retryable', True) is False:
+        result['retryable'] = False
+
+    raise gen.Return(result)
+
+
+class Delivery(object):
+    """A single request waiting to be dispatched to a hook."""
+
+    def __init__(self, route, request):
+        """Records the delivery and when it was queued.
+
+        args:
+            route: A hooky.config.base.HookRoute object
+            request: A hooky.translators.context.RequestContext object
+        """
+        self.route = route
+        self.request = request
+        self.queued = time.time()
+
+        # Id of the journal Record for this delivery, if its journaled
+        self.id = None
+
+        # Number of times it has been tried, including this time
+        self.attempts = 1
+
+    def __repr__(self):
+        return '<Delivery %s queued at %s>' % (self.route.name, self.queued)
+
+
+class DeliveryQueue(object):
+    """An in-memory queue of Deliveries drained by a bounded worker pool.
+
+    Workers are coroutines on the IOLoop. They are started as deliveries
+    arrive (up to the configured limit) and exit once the queue is empty,
+    so an idle queue costs nothing.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, size=0, journal=None,
+                 retries=DEFAULT_RETRIES,
+                 retry_backoff=DEFAULT_RETRY_BACKOFF, io_loop=None):
+        """Creates an empty queue.
+
+        args:
+            workers: Maximum number of deliveries being dispatched at once
+            size: Maximum number of waiting deliveries (def: 0, unlimited)
+            journal: An opened hooky.journal.Journal object to record
+                     deliveries in (def: None, deliveries are not durable)
+            retries: Number of times a Translator that failed to deliver a
+                     journaled request is retried
+            retry_backoff: Seconds to wait before the first retry. The wait
+                           doubles with each retry after that.
+            io_loop: The IOLoop to run on (def: the current IOLoop at the
+                     time each delivery is queued)
+        """
+        self.workers = workers
+        self.size = size
+        self.journal = journal
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.io_loop = io_loop
+        self._queue = collections.deque()
+        self._running = 0
+
+        # Deliveries waiting on the journal before they are queued up
+        self._committing = 0
+
+        # Futures waiting for the queue to be idle. See join().
+        self._waiters = []
+
+    @classmethod
+    def instance(cls):
+        """Returns a global DeliveryQueue instance with default settings."""
+        if not hasattr(cls, '_instance'):
+            cls._instance = cls()
+        return cls._instance
+
+    def put(self, route, request):
+        """Queues a request for delivery to a hook.
+
+        args:
+            route: A hooky.config.base.HookRoute object
+            request: A hooky.translators.context.RequestContext object
+
+        returns:
+            A Future that resolves to the queued Delivery object once it has
+            been accepted (and journaled, if the queue has a journal).
+
+        raises:
+            QueueFullException if the queue is already at its maximum size
+        """
+        # Deliveries still waiting on the journal will be queued too
+        if self.size and len(self._queue) + self._committing >= self.size:
+            QUEUE_REJECTED.inc()
+            raise QueueFullException('Delivery queue is full (%s)' %
+                                     self.size)
+
+        delivery = Delivery(route, request)
+        result = concurrent.TracebackFuture()
+
+        if self.journal is None:
+            self._enqueue(delivery)
+            result.set_result(delivery)
+            return result
+
+        # Only queue the delivery up once it is safely on disk.
+        names = [spec.name for spec in route.translators]
+        record, committed = self.journal.append(route.name, names, request)
+        delivery.id = record.id
+
+        def onCommitted(future):
+            self._committing -= 1
+            if future.exception() is not None:
+                result.set_exception(future.exception())
+                self._checkIdle()
+                return
+            self._enqueue(delivery)
+            result.set_result(delivery)
+
+        self._committing += 1
+        committed.add_done_callback(onCommitted)
+        return result
+
+    def join(self):
+        """Waits for every delivery put on the queue to be delivered.
+
+        returns:
+            A Future that resolves once the queue is empty and no deliveries
+            are in progress
+        """
+        future = concurrent.TracebackFuture()
+        if self.idle:
+            future.set_result(None)
+        else:
+            self._waiters.append(future)
+        return future
+
+    def replay(self, config, records):
+        """Queues up deliveries recovered from the journal.
+
+        args:
+            config: A hooky.config.base.BaseConfig conforming object
+            records: List of hooky.journal.Record objects, as returned by
+                     Journal.open()
+        """
+        for record in records:
+            try:
+                route = config.getRoute(record.hook)
+            except ConfigException, e:
+                log.error('Dropping journaled delivery %s: %s' % (record, e))
+                route = HookRoute(record.hook, {}, ())
+
+            # Only deliver to the Translators that hadn't finished with the
+            # request. Any that have since been removed from the hook are
+            # acknowledged right away, so they aren't replayed forever.
+            specs = tuple(spec for spec in route.translators
+                          if spec.name in record.translators)
+            for name in set(record.translators) - set(s.name for s in specs):
+                log.warning('Translator %s no longer configured for %s' %
+                            (name, record))
+                self.journal.ack(record.id, name)
+
+            if not specs:
+                continue
+
+            delivery = Delivery(HookRoute(route.name, route.options, specs),
+                                context.RequestContext(record.toRequest(),
+                                                       route.name))
+            delivery.id = record.id
+            log.info('Replaying journaled delivery %s' % record)
+            self._enqueue(delivery)
+
+    def _enqueue(self, delivery):
+        """Adds a Delivery to the queue, and starts a worker if needed"""
+        self._queue.append(delivery)
+        QUEUE_ENQUEUED.inc()
+        QUEUE_DEPTH.inc()
+
+        # Start a new worker if we're below our limit. This is scheduled on
+        # the IOLoop rather than started here, so that the caller is never
+        # held up by the delivery itself.
+        if self._running < self.workers:
+            self._running += 1
+            io_loop = self.io_loop or ioloop.IOLoop.current()
+            io_loop.add_callback(self._worker)
+
+    def __len__(self):
+        return len(self._queue)
+
+    @property
+    def busy(self):
+        """Number of workers currently running"""
+        return self._running
+
+    @property
+    def idle(self):
+        """Whether every delivery put on the queue has been delivered"""
+        return not (self._queue or self._running or self._committing)
+
+    def _checkIdle(self):
+        """Wakes up anything waiting in join() if the queue is idle"""
+        if self.idle:
+            waiters, self._waiters = self._waiters, []
+            for future in waiters:
+                future.set_result(None)
+
+    @gen.coroutine
+    def _worker(self):
+        """Delivers queued requests until the queue is empty"""
+        try:
+            while self._queue:
+                delivery = self._queue.popleft()
+                QUEUE_DEPTH.dec()
+                QUEUE_WAIT.observe(time.time() - delivery.queued)
+
+                QUEUE_BUSY.inc()
+                try:
+                    yield self._deliver(delivery)
+                finally:
+                    QUEUE_BUSY.dec()
+                    QUEUE_DELIVERED.inc()
+        finally:
+            self._running -= 1
+            self._checkIdle()
+
+    @gen.coroutine
+    def _deliver(self, delivery):
+        """Dispatches a single Delivery, logging any failures.
+
+        args:
+            delivery: A Delivery object
+
+        returns:
+            The list of results returned by dispatch()
+        """
+        def onResult(index, result):
+            # Record that this Translator is done with the delivery once it
+            # has succeeded, or once it is given up on.
+            if self.journal is None or delivery.id is None:
+                return
+            name = delivery.route.translators[index].name
+            if result['success']:
+                self.journal.ack(delivery.id, name)
+            elif (result.get('retryable', True) and
+                    delivery.attempts <= self.retries):
+                self._retry(delivery, index)
+            else:
+                self.journal.deadLetter(delivery.id, delivery.route.name,
+                                        name, delivery.request,
+                                        result['message'])
+
+        try:
+            results = yield dispatch(delivery.route, delivery.request,
+                                     on_result=onResult)
+        except Exception:
+            log.exception('Delivery %s failed' % delivery)
+            raise gen.Return(None)
+
+        failed = [r for r in results if not r['success']]
+        if failed:
+            log.error('Delivery %s failed: %s' % (delivery, failed))
+        else:
+            log.debug('Delivery %s succeeded' % delivery)
+
+        raise gen.Return(results)
+
+    def _retry(self, delivery, index):
+        """Schedules a failed delivery to one Translator to be tried again.
+
+        Waiting retries don't hold up join(). They are in the journal, so are
+        replayed if Hooky is stopped before they run.
+
+        args:
+            delivery: The Delivery that failed
+            index: Index of the Translator that failed, in its route
+        """
+        route = delivery.route
+        again = Delivery(HookRoute(route.name, route.options,
+                                   (route.translators[index],)),
+                         delivery.request)
+        again.id = delivery.id
+        again.attempts = delivery.attempts + 1
+
+        delay = retry.backoff(delivery.attempts, self.retry_backoff,
+                              RETRY_CAP)
+        log.warning('Delivery %s to %s failed, retrying in %.2fs' %
+                    (delivery, route.translators[index].name, delay))
+        QUEUE_RETRIES.inc()
+        retry.RetryScheduler.instance().schedule(
+            delay, lambda: self._enqueue(again))
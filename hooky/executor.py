@@ -0,0 +1,187 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc.
+
+"""
+Runs CPU heavy work (body parsing, template rendering) off the IOLoop.
+
+Parsing a large XML body or rendering a big template can take long enough
+to hold up every other request on the IOLoop. Work on requests at least
+'threshold' bytes in size can instead be handed to a pool of threads or
+processes, while the IOLoop carries on with everything else:
+
+    from hooky import executor
+
+    data = yield executor.run(len(body), parsers.parse, body, content_type)
+
+Small requests are still handled inline, where they are cheaper than the
+trip through a pool. Three kinds of executor are available, picked with
+configure():
+
+    none: Everything runs inline on the IOLoop (the default).
+    thread: A pool of threads. The IOLoop stays responsive while the work
+            runs, although Python only runs one thread at a time.
+    process: A pool of processes, so the work can use other cores. Only
+             work whose function and arguments can be pickled is sent to
+             it, anything else is run inline.
+
+Both pools need the 'futures' package on Python 2.
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import logging
+import sys
+import time
+
+from tornado import concurrent
+from tornado import ioloop
+from tornado import process
+
+from hooky import metrics
+
+log = logging.getLogger(__name__)
+
+KINDS = ('none', 'thread', 'process')
+
+# Defaults used when not overridden in the [general] config section
+DEFAULT_KIND = 'none'
+DEFAULT_THRESHOLD = 65536
+
+OFFLOADED = metrics.counter(
+    'hooky_executor_tasks_total', 'Tasks run off the IOLoop, by function',
+    labels=('task',))
+OFFLOADED_SECONDS = metrics.summary(
+    'hooky_executor_seconds', 'Time taken by tasks run off the IOLoop',
+    labels=('task',))
+
+# The settings work is offloaded with. See configure().
+_settings = {'kind': DEFAULT_KIND, 'threshold': DEFAULT_THRESHOLD}
+
+# The running pool, if any
+_pool = None
+
+
+def configure(kind=DEFAULT_KIND, workers=None, threshold=DEFAULT_THRESHOLD):
+    """Sets up the executor that large requests are offloaded to.
+
+    Any existing pool is shut down, after the work already given to it is
+    finished.
+
+    args:
+        kind: One of KINDS
+        workers: Number of threads or processes (def: one per CPU)
+        threshold: Requests of at least this many bytes are offloaded
+
+    raises:
+        ValueError if the kind is unknown
+    """
+    global _pool
+
+    if kind not in KINDS:
+        raise ValueError('Invalid executor "%s", must be one of %s' %
+                         (kind, KINDS))
+
+    if kind != 'none' and _getPoolClass(kind) is None:
+        log.warning('The futures package is not installed, running all '
+                    'parsing and rendering on the IOLoop instead.')
+        kind = 'none'
+
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+        _pool = None
+
+    if kind != 'none':
+        workers = int(workers or process.cpu_count())
+        _pool = _getPoolClass(kind)(workers)
+        log.debug('Offloading requests of %s bytes or more to %s %s '
+                  'workers' % (threshold, workers, kind))
+
+    _settings['kind'] = kind
+    _settings['threshold'] = int(threshold)
+
+
+def getKind():
+    """Returns the kind of executor in use, one of KINDS"""
+    return _settings['kind']
+
+
+def willOffload(size, picklable=True):
+    """Returns True if work for a request of this size would be offloaded.
+
+    args:
+        size: Size of the request, in bytes
+        picklable: See run()
+    """
+    if _pool is None or size < _settings['threshold']:
+        return False
+
+    return picklable or _settings['kind'] != 'process'
+
+
+def run(size, fn, *args, **kwargs):
+    """Runs fn(*args), offloading it if size is over the threshold.
+
+    args:
+        size: Size of the request the work is for, in bytes
+        fn: The function to call
+        args: Arguments to call it with
+        picklable: (keyword only) Whether fn and args can be sent to another
+                   process (def: True). If not, and the executor is a
+                   process pool, fn is run inline.
+
+    returns:
+        A Future that resolves to the return value of fn (or raises its
+        exception). Work run inline is already finished when this returns.
+    """
+    picklable = kwargs.pop('picklable', True)
+
+    if not willOffload(size, picklable):
+        return _runInline(fn, *args)
+
+    name = getattr(fn, '__name__', str(fn))
+    OFFLOADED.labels(name).inc()
+    log.debug('Offloading %s for a %s byte request' % (name, size))
+
+    future = concurrent.TracebackFuture()
+    start = time.time()
+
+    def done(pool_future):
+        OFFLOADED_SECONDS.labels(name).observe(time.time() - start)
+        concurrent.chain_future(pool_future, future)
+
+    # add_future() hands the result back to the IOLoop thread
+    ioloop.IOLoop.current().add_future(_pool.submit(fn, *args), done)
+    return future
+
+
+def _runInline(fn, *args):
+    """Calls fn(*args) right away, returning a finished Future"""
+    future = concurrent.TracebackFuture()
+    try:
+        future.set_result(fn(*args))
+    except Exception:
+        future.set_exc_info(sys.exc_info())
+    return future
+
+
+def _getPoolClass(kind):
+    """Returns the concurrent.futures Executor class for a kind, or None"""
+    try:
+        from concurrent import futures
+    except ImportError:
+        return None
+
+    if kind == 'process':
+        return futures.ProcessPoolExecutor
+    return futures.ThreadPoolExecutor
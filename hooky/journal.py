@@ -0,0 +1,605 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc.
+
+"""
+Durable, append-only journal of queued webhook deliveries.
+
+When a journal is configured, every request accepted by the DeliveryQueue is
+written to disk before it is dispatched, and an acknowledgement is written as
+each of its Translators finishes with it. If the Hooky process dies, any
+delivery that was not fully acknowledged is replayed when it starts back up.
+
+The journal is a directory of numbered segment files. Each line in a segment
+is one record:
+
+    E {"id": 1, "hook": "githubToPost", ...}     a queued delivery
+    A 1 GithubToHttpbinPost                      a Translator finished
+
+New records always go to the newest segment. Once a segment grows past the
+configured size a new one is started, and older segments are deleted as soon
+as every delivery in them has been acknowledged. Deliveries that are still
+unacknowledged when a new segment is started are copied into it from any
+segment before the one just finished, so a single old delivery never keeps
+a string of segments on disk.
+
+Deliveries that can't be delivered at all are written to a dead-letter file
+in the same directory (see deadLetter()), and then acknowledged.
+
+Writes are group-committed: records written during the same pass through the
+IOLoop (or the same fsync_interval) are written and fsync()'d together, and
+whoever is waiting on them is told once the data is on disk. The fsync policy
+is one of:
+
+    always: fsync() after every record
+    batch: fsync() once per group of records (the default)
+    never: leave it to the operating system to flush to disk
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import base64
+import glob
+import logging
+import os
+import time
+
+from tornado import concurrent
+from tornado import httpserver
+from tornado import httputil
+from tornado import ioloop
+
+from hooky import jsonbackend
+from hooky import metrics
+
+log = logging.getLogger(__name__)
+
+FSYNC_POLICIES = ('always', 'batch', 'never')
+
+# Defaults used when not overridden in the [general] config section
+DEFAULT_FSYNC = 'batch'
+DEFAULT_FSYNC_INTERVAL = 0
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+
+SEGMENT_PATTERN = 'segment-%012d.log'
+DEAD_LETTER_FILE = 'dead-letter.log'
+
+JOURNAL_RECORDS = metrics.counter(
+    'hooky_journal_records_total', 'Records written to the journal')
+JOURNAL_COMMITS = metrics.counter(
+    'hooky_journal_commits_total', 'Group commits written to the journal')
+JOURNAL_COMMIT_TIME = metrics.summary(
+    'hooky_journal_commit_seconds', 'Time spent writing (and syncing) commits')
+JOURNAL_PENDING = metrics.gauge(
+    'hooky_journal_pending', 'Journaled deliveries not yet acknowledged')
+JOURNAL_COPIED = metrics.counter(
+    'hooky_journal_copied_total', 'Unacknowledged records copied forward '
+    'into a new segment')
+JOURNAL_DEAD_LETTERS = metrics.counter(
+    'hooky_journal_dead_letters_total', 'Deliveries written to the '
+    'dead-letter file')
+
+
+class JournalException(Exception):
+    """Raised when the journal cannot be opened or written to"""
+
+
+class Record(object):
+    """A single journaled delivery."""
+
+    def __init__(self, id, hook, translators, request):
+        """Builds the record.
+
+        args:
+            id: Integer id of the record, unique within the journal
+            hook: String name of the hook
+            translators: List of Translator names still to be delivered to
+            request: Dictionary describing the request. See fromRequest().
+        """
+        self.id = id
+        self.hook = hook
+        self.translators = translators
+        self.request = request
+
+    @classmethod
+    def fromRequest(cls, id, hook, translators, request):
+        """Builds a record from an HTTPRequest (or RequestContext) object"""
+        headers = getattr(request, 'headers', None) or {}
+        if hasattr(headers, 'get_all'):
+            headers = headers.get_all()
+        else:
+            headers = headers.items()
+
+        return cls(id, hook, list(translators), {
+            'method': request.method,
+            'uri': _text(request.uri),
+            'version': getattr(request, 'version', 'HTTP/1.0'),
+            'remote_ip': getattr(request, 'remote_ip', None),
+            'headers': [(_text(k), _text(v)) for k, v in headers],
+            'body': base64.b64encode(request.body or ''),
+        })
+
+    def toRequest(self):
+        """Rebuilds the original HTTPRequest object from this record"""
+        headers = httputil.HTTPHeaders()
+        for name, value in self.request['headers']:
+            headers.add(_bytes(name), _bytes(value))
+
+        body = base64.b64decode(self.request['body'])
+        request = httpserver.HTTPRequest(
+            method=str(self.request['method']),
+            uri=_bytes(self.request['uri']),
+            version=str(self.request['version']),
+            headers=headers,
+            body=body)
+        request.remote_ip = self.request['remote_ip']
+
+        # Form arguments in the body are normally parsed by the HTTP server
+        # itself, so we have to do that here.
+        httputil.parse_body_arguments(headers.get('Content-Type', ''), body,
+                                      request.arguments, request.files)
+        return request
+
+    def toLine(self):
+        """Serializes the record into a single journal line"""
+        return 'E %s\n' % jsonbackend.dumps({'id': self.id,
+                                             'hook': self.hook,
+                                             'translators': self.translators,
+                                             'request': self.request})
+
+    @classmethod
+    def fromLine(cls, data):
+        """Builds a record from the JSON part of a journal line"""
+        data = jsonbackend.loads(data)
+        return cls(data['id'], data['hook'], data['translators'],
+                   data['request'])
+
+    def __repr__(self):
+        return '<Record %s for %s>' % (self.id, self.hook)
+
+
+class Journal(object):
+    """A segmented, append-only journal stored in a single directory."""
+
+    def __init__(self, path, fsync=DEFAULT_FSYNC,
+                 fsync_interval=DEFAULT_FSYNC_INTERVAL,
+                 segment_bytes=DEFAULT_SEGMENT_BYTES, io_loop=None):
+        """Creates the journal object. Call open() before using it.
+
+        args:
+            path: Directory to keep the journal segments in
+            fsync: One of FSYNC_POLICIES
+            fsync_interval: Seconds to wait collecting records before a group
+                            commit. 0 commits once per IOLoop iteration.
+            segment_bytes: Size at which a new segment file is started
+            io_loop: The IOLoop to schedule commits on (def: current)
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise JournalException('Invalid fsync policy "%s", must be one '
+                                   'of %s' % (fsync, FSYNC_POLICIES))
+
+        self.path = path
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.segment_bytes = segment_bytes
+        self.io_loop = io_loop
+
+        # The segment being written to: its number, file handle and size
+        self._segment = None
+        self._fh = None
+        self._size = 0
+
+        # Segment number -> set of unacknowledged record ids in it
+        self._segments = {}
+
+        # Record id -> (segment number, set of unacknowledged translators)
+        self._pending = {}
+
+        self._next_id = 1
+
+        # Lines waiting for the next group commit, and the Futures of the
+        # callers waiting on them.
+        self._buffer = []
+        self._waiters = []
+        self._scheduled = False
+
+    def open(self):
+        """Opens the journal, returning any records left unacknowledged.
+
+        Existing segments are read, the unacknowledged records in them are
+        copied into a brand new segment, and the old segments are deleted.
+
+        returns:
+            A list of Record objects that still need to be delivered
+        """
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError, e:
+                raise JournalException('Unable to create journal %s: %s' %
+                                       (self.path, e))
+
+        old_segments = sorted(glob.glob(os.path.join(self.path,
+                                                     'segment-*.log')))
+        records = self._read(old_segments)
+
+        # Start a fresh segment after the newest one we found.
+        last = 0
+        if old_segments:
+            last = int(os.path.basename(old_segments[-1])[8:-4])
+        self._openSegment(last + 1)
+
+        # Copy the unacknowledged records over, and commit them right away
+        # (the IOLoop may not even be running yet), then drop the old files.
+        for record in records:
+            self._append(record)
+        self._commit(force_sync=True)
+
+        for filename in old_segments:
+            os.remove(filename)
+
+        log.info('Opened journal %s with %s unacknowledged records' %
+                 (self.path, len(records)))
+        return records
+
+    def adopt(self, path):
+        """Takes over the unacknowledged records of another journal.
+
+        Used for journals that no running process owns any more (such as
+        the journal of a worker that is no longer started). The records are
+        copied into this journal under new ids, and the other journal's
+        segments (and its directory, if that leaves it empty) are deleted.
+        Call open() first.
+
+        args:
+            path: Directory of the other journal
+
+        returns:
+            A list of the adopted Record objects, to be delivered
+        """
+        segments = sorted(glob.glob(os.path.join(path, 'segment-*.log')))
+        if not segments:
+            return []
+
+        records = []
+        for old in self._read(segments):
+            record = Record(self._next_id, old.hook, old.translators,
+                            old.request)
+            self._next_id += 1
+            self._append(record)
+            records.append(record)
+        self._commit(force_sync=True)
+
+        for filename in segments:
+            os.remove(filename)
+        try:
+            os.rmdir(path)
+        except OSError:
+            # Not empty, it holds other journals too
+            pass
+
+        log.info('Adopted %s unacknowledged records from journal %s' %
+                 (len(records), path))
+        return records
+
+    def close(self):
+        """Commits anything outstanding and closes the journal"""
+        self._commit()
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def append(self, hook, translators, request):
+        """Journals a new delivery.
+
+        args:
+            hook: String name of the hook
+            translators: List of Translator names the request is for
+            request: The HTTPRequest (or RequestContext) object
+
+        returns:
+            A (Record, Future) tuple. The Future resolves once the record is
+            committed to the journal.
+        """
+        record = Record.fromRequest(self._next_id, hook, translators,
+                                    request)
+        self._next_id += 1
+        return record, self._append(record)
+
+    def ack(self, id, translator):
+        """Records that a Translator has finished with a delivery.
+
+        args:
+            id: Integer id of the Record
+            translator: String name of the Translator
+
+        returns:
+            A Future that resolves once the ack is committed
+        """
+        future = self._write('A %s %s\n' % (id, translator))
+
+        try:
+            segment, translators = self._pending[id]
+        except KeyError:
+            log.warning('Ack for unknown journal record %s' % id)
+            return future
+
+        translators.discard(translator)
+        if not translators:
+            self._release(id, segment)
+
+        return future
+
+    def deadLetter(self, id, hook, translator, request, message):
+        """Gives up on a delivery, moving it to the dead-letter file.
+
+        The request is appended to the dead-letter file (and synced), so it
+        can be looked at or resent by hand, and is then acknowledged.
+
+        args:
+            id: Integer id of the Record
+            hook: String name of the hook
+            translator: String name of the Translator that gave up on it
+            request: The HTTPRequest (or RequestContext) object
+            message: Why it was given up on
+
+        returns:
+            A Future that resolves once the ack is committed
+        """
+        record = Record.fromRequest(id, hook, [translator], request)
+        line = jsonbackend.dumps({'id': id,
+                                  'hook': hook,
+                                  'translator': translator,
+                                  'message': message,
+                                  'time': time.time(),
+                                  'request': record.request})
+        filename = os.path.join(self.path, DEAD_LETTER_FILE)
+        try:
+            with open(filename, 'ab') as fh:
+                fh.write('%s\n' % line)
+                fh.flush()
+                if self.fsync != 'never':
+                    os.fsync(fh.fileno())
+        except (IOError, OSError), e:
+            # Leave it in the journal, it is replayed on the next start
+            log.error('Unable to write to %s: %s' % (filename, e))
+            future = concurrent.TracebackFuture()
+            future.set_exception(JournalException(e))
+            return future
+
+        JOURNAL_DEAD_LETTERS.inc()
+        log.error('Moved delivery %s of %s for %s to %s: %s' %
+                  (id, hook, translator, filename, message))
+        return self.ack(id, translator)
+
+    def __len__(self):
+        """Number of unacknowledged records"""
+        return len(self._pending)
+
+    def _append(self, record):
+        """Writes a record, and starts tracking it as pending"""
+        self._pending[record.id] = (self._segment, set(record.translators))
+        self._segments[self._segment].add(record.id)
+        JOURNAL_PENDING.set(len(self._pending))
+        return self._write(record.toLine())
+
+    def _release(self, id, segment):
+        """Stops tracking a fully acknowledged record.
+
+        args:
+            id: Integer id of the Record
+            segment: Number of the segment the Record was written to
+        """
+        del self._pending[id]
+        JOURNAL_PENDING.set(len(self._pending))
+
+        self._segments[segment].discard(id)
+        self._compact()
+
+    def _compact(self):
+        """Deletes the oldest segments once all of their records are done.
+
+        An ack is always written after the record it belongs to, so it may
+        sit in a later segment than the record does. Deleting segments
+        strictly oldest first means that we never lose an ack for a record
+        that is still around.
+        """
+        for number in sorted(self._segments):
+            if number == self._segment or self._segments[number]:
+                break
+            del self._segments[number]
+            self._removeSegment(number)
+
+    def _write(self, line):
+        """Queues a line up for the next group commit.
+
+        returns:
+            A Future that resolves once the line is committed
+        """
+        future = concurrent.TracebackFuture()
+        self._buffer.append(line)
+        self._waiters.append(future)
+        JOURNAL_RECORDS.inc()
+
+        if self.fsync == 'always':
+            self._commit()
+        elif not self._scheduled:
+            self._scheduled = True
+            io_loop = self.io_loop or ioloop.IOLoop.current()
+            if self.fsync_interval > 0:
+                io_loop.add_timeout(time.time() + self.fsync_interval,
+                                    self._commit)
+            else:
+                io_loop.add_callback(self._commit)
+
+        return future
+
+    def _commit(self, force_sync=False):
+        """Writes out (and possibly syncs) everything in the buffer"""
+        self._scheduled = False
+        if not self._waiters:
+            return
+
+        buffer, self._buffer = self._buffer, []
+        waiters, self._waiters = self._waiters, []
+
+        start = time.time()
+        try:
+            data = ''.join(buffer)
+            self._fh.write(data)
+            self._fh.flush()
+            if self.fsync != 'never' or force_sync:
+                os.fsync(self._fh.fileno())
+        except (IOError, OSError), e:
+            log.error('Unable to write to journal %s: %s' % (self.path, e))
+            for future in waiters:
+                future.set_exception(JournalException(e))
+            return
+
+        JOURNAL_COMMITS.inc()
+        JOURNAL_COMMIT_TIME.observe(time.time() - start)
+
+        self._size += len(data)
+        if self._size >= self.segment_bytes:
+            self._openSegment(self._segment + 1)
+            self._copyForward()
+
+        for future in waiters:
+            future.set_result(None)
+
+    def _openSegment(self, number):
+        """Closes the current segment, and starts writing a new one"""
+        if self._fh is not None:
+            self._fh.close()
+
+        filename = os.path.join(self.path, SEGMENT_PATTERN % number)
+        log.debug('Starting journal segment %s' % filename)
+        self._fh = open(filename, 'ab')
+        self._segment = number
+        self._segments[number] = set()
+        self._size = 0
+
+        # The old segment may already be finished with
+        self._compact()
+
+    def _copyForward(self):
+        """Copies unacknowledged records out of old segments.
+
+        Every record still pending in a segment older than the one just
+        finished is written into the new segment (with only the Translators
+        still to be delivered to), synced, and then tracked there, so that
+        the old segments can be deleted. Records in the segment just finished
+        are usually still being delivered, so are left where they are until
+        the next new segment.
+        """
+        previous = self._segment - 1
+        old = [number for number in sorted(self._segments)
+               if number < previous and self._segments[number]]
+        if not old:
+            return
+
+        filenames = [os.path.join(self.path, SEGMENT_PATTERN % number)
+                     for number in old]
+        lines = []
+        moved = []
+        for record in self._readRecords(filenames):
+            if record.id not in self._pending:
+                continue
+            segment, translators = self._pending[record.id]
+            if segment not in old:
+                continue
+            record.translators = [name for name in record.translators
+                                  if name in translators]
+            lines.append(record.toLine())
+            moved.append((record.id, segment))
+
+        try:
+            data = ''.join(lines)
+            self._fh.write(data)
+            self._fh.flush()
+            if self.fsync != 'never':
+                os.fsync(self._fh.fileno())
+        except (IOError, OSError), e:
+            log.error('Unable to copy records into a new segment of %s: %s'
+                      % (self.path, e))
+            return
+
+        self._size += len(data)
+        for id, segment in moved:
+            self._segments[segment].discard(id)
+            self._segments[self._segment].add(id)
+            self._pending[id] = (self._segment, self._pending[id][1])
+        JOURNAL_COPIED.inc(len(moved))
+        log.debug('Copied %s unacknowledged records forward into segment %s'
+                  % (len(moved), self._segment))
+
+        self._compact()
+
+    def _removeSegment(self, number):
+        """Deletes a segment file"""
+        filename = os.path.join(self.path, SEGMENT_PATTERN % number)
+        log.debug('Removing fully acknowledged segment %s' % filename)
+        try:
+            os.remove(filename)
+        except OSError, e:
+            log.warning('Unable to remove %s: %s' % (filename, e))
+
+    def _read(self, filenames):
+        """Reads segments, returning the unacknowledged records in order.
+
+        Also moves the next record id past every id found, so that ids are
+        never reused.
+        """
+        records = self._readRecords(filenames)
+        for record in records:
+            self._next_id = max(self._next_id, record.id + 1)
+        return [record for record in records if record.translators]
+
+    def _readRecords(self, filenames):
+        """Reads segments, returning every record in them in order.
+
+        Each record only lists the Translators that no ack was found for in
+        the segments read.
+        """
+        records = {}
+        for filename in filenames:
+            for line in open(filename, 'rb'):
+                try:
+                    kind, data = line.rstrip('\n').split(' ', 1)
+                    if kind == 'E':
+                        record = Record.fromLine(data)
+                        records[record.id] = record
+                    elif kind == 'A':
+                        id, translator = data.split(' ', 1)
+                        record = records.get(int(id))
+                        if record and translator in record.translators:
+                            record.translators.remove(translator)
+                except (ValueError, KeyError), e:
+                    # Most likely the tail of a segment that was being
+                    # written when the process died.
+                    log.warning('Skipping bad journal line in %s: %s' %
+                                (filename, e))
+
+        return sorted(records.values(), key=lambda r: r.id)
+
+
+def _text(value):
+    """Converts a byte string to unicode, without losing any bytes"""
+    if isinstance(value, unicode):
+        return value
+    return value.decode('latin-1')
+
+
+def _bytes(value):
+    """Reverses _text()"""
+    return value.encode('latin-1')
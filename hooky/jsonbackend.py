@@ -0,0 +1,170 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc.
+
+"""
+Encodes and decodes JSON with whichever library is configured.
+
+The standard library's json module is written mostly in Python, and other
+libraries parse the same documents several times faster. Hooky parses JSON
+bodies (and writes its journal) through loads() and dumps() here, which use
+the library picked with configure():
+
+    stdlib: The json module (the default)
+    ujson: The ujson package
+    orjson: The orjson package (Python 3 only)
+    simplejson: The simplejson package
+
+If the library asked for is not installed, the stdlib is used instead.
+Whichever library is used, loads() raises a ValueError for a bad document,
+and dumps() returns a str.
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+BACKENDS = ('stdlib', 'ujson', 'orjson', 'simplejson')
+
+# Defaults used when not overridden in the [general] config section
+DEFAULT_BACKEND = 'stdlib'
+
+
+def _stdlib():
+    return json.loads, json.dumps
+
+
+def _ujson():
+    import ujson
+
+    def loads(data):
+        # Older versions round floats unless told not to
+        try:
+            return ujson.loads(data, precise_float=True)
+        except TypeError:
+            return ujson.loads(data)
+
+    def dumps(obj):
+        # Like the stdlib, don't escape '/'
+        try:
+            return ujson.dumps(obj, escape_forward_slashes=False)
+        except TypeError:
+            return ujson.dumps(obj)
+
+    return loads, dumps
+
+
+def _orjson():
+    import orjson
+
+    def dumps(obj):
+        # orjson only ever returns UTF-8 bytes
+        return orjson.dumps(obj).decode('utf-8')
+
+    return orjson.loads, dumps
+
+
+def _simplejson():
+    import simplejson
+    return simplejson.loads, simplejson.dumps
+
+
+_loaders = {
+    'stdlib': _stdlib,
+    'ujson': _ujson,
+    'orjson': _orjson,
+    'simplejson': _simplejson,
+}
+
+# The backend in use, and its functions. See configure().
+_settings = {'backend': DEFAULT_BACKEND}
+_functions = {'loads': json.loads, 'dumps': json.dumps}
+
+
+def configure(backend=DEFAULT_BACKEND):
+    """Picks the library that JSON is encoded and decoded with.
+
+    args:
+        backend: One of BACKENDS
+
+    raises:
+        ValueError if the backend is unknown
+    """
+    if backend not in BACKENDS:
+        raise ValueError('Invalid JSON backend "%s", must be one of %s' %
+                         (backend, BACKENDS))
+
+    try:
+        loads, dumps = _loaders[backend]()
+    except ImportError:
+        log.warning('The %s package is not installed, using the standard '
+                    'json module instead.' % backend)
+        backend = 'stdlib'
+        loads, dumps = _stdlib()
+
+    log.debug('Using the %s JSON backend' % backend)
+    _settings['backend'] = backend
+    _functions['loads'] = loads
+    _functions['dumps'] = dumps
+
+
+def getBackend():
+    """Returns the backend in use, one of BACKENDS"""
+    return _settings['backend']
+
+
+def getAvailable():
+    """Returns the BACKENDS whose libraries are installed"""
+    available = []
+    for backend in BACKENDS:
+        try:
+            _loaders[backend]()
+        except ImportError:
+            continue
+        available.append(backend)
+    return available
+
+
+def loads(data):
+    """Decodes a JSON document.
+
+    args:
+        data: The JSON string
+
+    returns:
+        The decoded object
+
+    raises:
+        ValueError if the document is not valid JSON (TypeError if it is not
+        a string at all)
+    """
+    return _functions['loads'](data)
+
+
+def dumps(obj):
+    """Encodes an object as JSON.
+
+    args:
+        obj: Any JSON serializable object
+
+    returns:
+        The JSON str
+
+    raises:
+        TypeError (or ValueError, depending on the backend) if the object
+        can't be serialized
+    """
+    return _functions['dumps'](obj)
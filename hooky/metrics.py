@@ -0,0 +1,376 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc.
+
+"""
+In-process metrics for the Hooky service.
+
+Metrics are registered once (usually at module import time) and then
+updated from the request path:
+
+    from hooky import metrics
+
+    REQUESTS = metrics.counter('hooky_requests_total',
+                               'Inbound requests', labels=('hook',))
+
+    REQUESTS.labels('githubToPost').inc()
+
+Metrics with no labels can be updated directly (QUEUED.inc()). Looking up a
+labelled child is a dict hit, so callers on hot paths may hold on to the
+child object returned by labels() and update it directly.
+
+Everything here runs on the single IOLoop thread, so no locking is done.
+
+Histograms count observations into a fixed set of buckets, so observing a
+value is a binary search and two additions, and memory use never grows:
+
+    LATENCY = metrics.histogram('hooky_request_seconds', 'Request latency',
+                                labels=('hook',))
+
+    LATENCY.labels('githubToPost').observe(0.025)
+
+expose() renders every registered metric in the Prometheus text format.
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import collections
+import logging
+
+# Imported by name to save an attribute lookup in HistogramValue.observe()
+from bisect import bisect_left
+
+log = logging.getLogger(__name__)
+
+
+class CounterValue(object):
+    """A single, only ever increasing, value"""
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class GaugeValue(object):
+    """A single value that can go up and down"""
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class SummaryValue(object):
+    """Keeps the count, sum and maximum of a series of observations"""
+    __slots__ = ('count', 'sum', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+
+class HistogramValue(object):
+    """Counts a series of observations into fixed buckets"""
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        """Creates an empty histogram.
+
+        args:
+            buckets: Sorted tuple of bucket upper bounds. Values larger than
+                     the last one land in an implicit '+Inf' bucket.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        # Buckets are inclusive of their upper bound (le="..."), hence left.
+        # This is on every hot path, so the total count is left for the
+        # reader to add up.
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        """Total number of observations"""
+        return sum(self.counts)
+
+    def cumulative(self):
+        """Returns a list of (upper bound, observations <= bound) tuples"""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (INF,), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Metric(object):
+    """A named metric, made up of one value per set of label values."""
+
+    # Prometheus metric type, and the class used to hold each value
+    type = None
+    value_class = None
+
+    def __init__(self, name, help, labels=()):
+        """Creates the metric.
+
+        args:
+            name: String name of the metric
+            help: String description of the metric
+            labels: Tuple of label names
+        """
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._children = {}
+
+        # Metrics without labels only ever have the one value.
+        if not self.labelnames:
+            self._children[()] = self._newValue()
+
+    def labels(self, *values):
+        """Returns the value object for the supplied label values.
+
+        args:
+            values: One value per label name, in order
+
+        returns:
+            A value object (eg. CounterValue)
+        """
+        try:
+            return self._children[values]
+        except KeyError:
+            pass
+
+        if len(values) != len(self.labelnames):
+            raise ValueError('%s expects labels %s, got %s' %
+                             (self.name, self.labelnames, values))
+
+        child = self._children[values] = self._newValue()
+        return child
+
+    def children(self):
+        """Returns a list of (label values, value object) tuples"""
+        return sorted(self._children.items())
+
+    def _newValue(self):
+        """Returns a new, empty value object"""
+        return self.value_class()
+
+    def __getattr__(self, name):
+        # Pass inc(), set(), observe(), etc. through to the single value of
+        # metrics that have no labels.
+        if name.startswith('_') or self.labelnames:
+            raise AttributeError(name)
+        return getattr(self._children[()], name)
+
+
+class Counter(Metric):
+    type = 'counter'
+    value_class = CounterValue
+
+
+class Gauge(Metric):
+    type = 'gauge'
+    value_class = GaugeValue
+
+
+class Summary(Metric):
+    type = 'summary'
+    value_class = SummaryValue
+
+
+class Histogram(Metric):
+    type = 'histogram'
+    value_class = HistogramValue
+
+    def __init__(self, name, help, labels=(), buckets=None):
+        """Creates the metric.
+
+        args:
+            name: See Metric
+            help: See Metric
+            labels: See Metric
+            buckets: Sequence of bucket upper bounds (def: DEFAULT_BUCKETS)
+        """
+        self.buckets = tuple(sorted(buckets or DEFAULT_BUCKETS))
+        Metric.__init__(self, name, help, labels)
+
+    def _newValue(self):
+        return HistogramValue(self.buckets)
+
+
+class Registry(object):
+    """A collection of uniquely named metrics."""
+
+    def __init__(self):
+        self._metrics = collections.OrderedDict()
+
+    def register(self, metric):
+        """Adds a metric to the registry.
+
+        If a metric of the same name and type is already registered, that
+        one is returned instead, so that modules can safely declare the
+        metrics they use.
+
+        args:
+            metric: A Metric object
+
+        returns:
+            The registered Metric object
+        """
+        existing = self._metrics.get(metric.name)
+        if existing is None:
+            self._metrics[metric.name] = metric
+            return metric
+
+        if (type(existing) is not type(metric) or
+                existing.labelnames != metric.labelnames or
+                getattr(existing, 'buckets', None) !=
+                getattr(metric, 'buckets', None)):
+            raise ValueError('Metric %s is already registered as a %s' %
+                             (metric.name, existing.type))
+
+        return existing
+
+    def get(self, name):
+        """Returns the named Metric object, or None"""
+        return self._metrics.get(name)
+
+    def collect(self):
+        """Returns a list of all registered Metric objects"""
+        return self._metrics.values()
+
+
+# Default registry used by the whole service.
+REGISTRY = Registry()
+
+INF = float('inf')
+
+# Default histogram buckets, in seconds. Suits request and call latencies.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Histogram buckets for sizes, in bytes. 256 bytes to 16MB.
+BYTE_BUCKETS = tuple(256 * 4 ** i for i in xrange(9))
+
+
+def counter(name, help, labels=()):
+    """Registers (or returns the existing) Counter in the default registry"""
+    return REGISTRY.register(Counter(name, help, labels))
+
+
+def gauge(name, help, labels=()):
+    """Registers (or returns the existing) Gauge in the default registry"""
+    return REGISTRY.register(Gauge(name, help, labels))
+
+
+def summary(name, help, labels=()):
+    """Registers (or returns the existing) Summary in the default registry"""
+    return REGISTRY.register(Summary(name, help, labels))
+
+
+def histogram(name, help, labels=(), buckets=None):
+    """Registers (or returns the existing) Histogram in the default registry"""
+    return REGISTRY.register(Histogram(name, help, labels, buckets))
+
+
+def expose(registry=REGISTRY):
+    """Renders every metric in the Prometheus text exposition format.
+
+    args:
+        registry: The Registry to render (def: the default registry)
+
+    returns:
+        A string, in version 0.0.4 of the Prometheus text format
+    """
+    lines = []
+    for metric in registry.collect():
+        lines.append('# HELP %s %s' % (metric.name, _escape(metric.help)))
+        lines.append('# TYPE %s %s' % (metric.name, metric.type))
+
+        # Summaries also keep the largest value seen, which the text format
+        # has no place for. It goes in a gauge of its own, after this one.
+        maxes = []
+        for values, child in metric.children():
+            labels = zip(metric.labelnames, values)
+            if metric.type == 'histogram':
+                for bound, count in child.cumulative():
+                    lines.append(_sample(metric.name + '_bucket',
+                                         labels + [('le', bound)], count))
+            if metric.type in ('histogram', 'summary'):
+                lines.append(_sample(metric.name + '_count', labels,
+                                     child.count))
+                lines.append(_sample(metric.name + '_sum', labels,
+                                     child.sum))
+            else:
+                lines.append(_sample(metric.name, labels, child.value))
+            if metric.type == 'summary':
+                maxes.append(_sample(metric.name + '_max', labels,
+                                     child.max))
+
+        if maxes:
+            lines.append('# HELP %s_max Largest value of %s' %
+                         (metric.name, metric.name))
+            lines.append('# TYPE %s_max gauge' % metric.name)
+            lines.extend(maxes)
+
+    return '\n'.join(lines) + '\n'
+
+
+def _sample(name, labels, value):
+    """Renders a single sample line"""
+    if labels:
+        name = '%s{%s}' % (name, ','.join(
+            '%s="%s"' % (label, _escape(_format(label_value), quote=True))
+            for label, label_value in labels))
+    return '%s %s' % (name, _format(value))
+
+
+def _format(value):
+    """Formats a label or sample value the way Prometheus expects"""
+    if isinstance(value, float):
+        if value == INF:
+            return '+Inf'
+        return repr(value)
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+def _escape(string, quote=False):
+    """Escapes a help string, or (with quote) a label value"""
+    string = string.replace('\\', '\\\\').replace('\n', '\\n')
+    if quote:
+        string = string.replace('"', '\\"')
+    return string
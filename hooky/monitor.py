@@ -0,0 +1,251 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc.
+
+"""
+Keeps an eye on the health of the IOLoop itself.
+
+Everything Hooky does runs on a single IOLoop, so anything that holds it up
+(parsing a huge body, say) delays every other request too. The LagMonitor
+schedules a timer every 'interval' seconds and measures how late it runs.
+That delay is how long a callback scheduled at the same time would have
+waited for the IOLoop, and is recorded in the hooky_ioloop_lag_seconds
+histogram. The last 'window' seconds of measurements are also kept, and
+their percentiles published as the hooky_ioloop_lag_window_seconds gauges.
+
+The SlowCallbackMonitor finds out what is holding the IOLoop up. It uses
+the IOLoop's blocking signal, so costs nothing until a single pass of the
+IOLoop takes longer than 'threshold' seconds. The work that is running at
+that point is logged (with its stack), and counted against the hook and
+translator it was for in hooky_ioloop_slow_callbacks_total. Code is tagged
+with its hook and translator by running it in an activity():
+
+    with monitor.activity(hook, translator):
+        future = translator.submit(request)
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import collections
+import functools
+import logging
+import signal
+import time
+import traceback
+
+from tornado import ioloop
+from tornado import stack_context
+
+from hooky import metrics
+
+log = logging.getLogger(__name__)
+
+# Defaults used when not overridden in the [general] config section
+DEFAULT_INTERVAL = 1.0
+DEFAULT_WINDOW = 300
+DEFAULT_THRESHOLD = 0.25
+
+# Percentiles of the recent lag published by the LagMonitor
+QUANTILES = (0.5, 0.9, 0.99, 1.0)
+
+# Number of stack frames logged for a slow callback
+STACK_DEPTH = 10
+
+IOLOOP_LAG = metrics.histogram(
+    'hooky_ioloop_lag_seconds', 'How late timers on the IOLoop run')
+IOLOOP_LAG_WINDOW = metrics.gauge(
+    'hooky_ioloop_lag_window_seconds',
+    'Percentiles of the IOLoop lag over the recent window',
+    labels=('quantile',))
+SLOW_CALLBACKS = metrics.counter(
+    'hooky_ioloop_slow_callbacks_total',
+    'Times the IOLoop was blocked past the threshold, by what blocked it',
+    labels=('hook', 'translator'))
+SLOW_CALLBACK_SECONDS = metrics.histogram(
+    'hooky_ioloop_slow_callback_seconds',
+    'How long the IOLoop was blocked, each time it passed the threshold')
+
+# The (hook, translator) whose code is running right now. See activity().
+_activity = (None, None)
+
+
+class _Activity(object):
+    """Context manager that marks the code running in it as a hook's"""
+
+    def __init__(self, hook, translator):
+        self.hook = hook
+        self.translator = translator
+
+    def __enter__(self):
+        global _activity
+        self._previous = _activity
+        _activity = (self.hook, self.translator)
+
+    def __exit__(self, type, value, tb):
+        global _activity
+        _activity = self._previous
+
+
+def activity(hook, translator=None):
+    """Returns a StackContext that tags code as work for a hook.
+
+    The code run within it, and every callback it schedules on the IOLoop,
+    is blamed on the hook (and translator) if it blocks the IOLoop.
+
+    args:
+        hook: Name of the hook
+        translator: Name of the translator (optional)
+    """
+    return stack_context.StackContext(
+        functools.partial(_Activity, hook, translator))
+
+
+def getActivity():
+    """Returns the (hook, translator) of the code running right now.
+
+    Either can be None, if the code is not running in an activity().
+    """
+    return _activity
+
+
+def getPercentiles(values, quantiles=QUANTILES):
+    """Returns the given percentiles of some values.
+
+    args:
+        values: A list of numbers
+        quantiles: Percentiles to return, each from 0 to 1
+
+    returns:
+        A dict of each quantile to its value (nearest rank), or an empty
+        dict if there are no values.
+    """
+    if not values:
+        return {}
+
+    values = sorted(values)
+    last = len(values) - 1
+    return dict((q, values[int(round(q * last))]) for q in quantiles)
+
+
+class LagMonitor(object):
+    """Measures how late the IOLoop runs a regularly scheduled timer."""
+
+    def __init__(self, interval=DEFAULT_INTERVAL, window=DEFAULT_WINDOW,
+                 io_loop=None):
+        """Sets up the monitor. Call start() to begin measuring.
+
+        args:
+            interval: Seconds between measurements (0 disables the monitor)
+            window: Seconds of measurements to work the percentiles out over
+            io_loop: The IOLoop to watch (def: IOLoop.instance())
+        """
+        self.interval = float(interval)
+        self.io_loop = io_loop or ioloop.IOLoop.instance()
+        self._timeout = None
+        self._expected = None
+
+        size = 1
+        if self.interval > 0:
+            size = max(1, int(float(window) / self.interval))
+        self.recent = collections.deque(maxlen=size)
+
+    def getPercentiles(self):
+        """Returns percentiles of the lag over the recent window.
+
+        returns:
+            A dict of each of QUANTILES to the lag in seconds
+        """
+        return getPercentiles(self.recent)
+
+    def start(self):
+        """Starts measuring"""
+        if self.interval > 0 and self._timeout is None:
+            self._schedule()
+
+    def stop(self):
+        """Stops measuring"""
+        if self._timeout is not None:
+            self.io_loop.remove_timeout(self._timeout)
+            self._timeout = None
+
+    def _schedule(self):
+        self._expected = self.io_loop.time() + self.interval
+        self._timeout = self.io_loop.add_timeout(self._expected, self._check)
+
+    def _check(self):
+        lag = max(0, self.io_loop.time() - self._expected)
+        IOLOOP_LAG.observe(lag)
+
+        self.recent.append(lag)
+        for quantile, value in self.getPercentiles().iteritems():
+            IOLOOP_LAG_WINDOW.labels(str(quantile)).set(value)
+
+        self._schedule()
+
+
+class SlowCallbackMonitor(object):
+    """Reports whatever blocks the IOLoop for too long."""
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, io_loop=None):
+        """Sets up the monitor. Call start() to arm it.
+
+        Only one can be running at a time, and only on the main thread (it
+        relies on SIGALRM).
+
+        args:
+            threshold: Seconds a pass of the IOLoop can take before it is
+                       reported (0 disables the monitor)
+            io_loop: The IOLoop to watch (def: IOLoop.instance())
+        """
+        self.threshold = float(threshold)
+        self.io_loop = io_loop or ioloop.IOLoop.instance()
+        self.running = False
+
+        # (started, hook, translator, stack) of the block being reported
+        self._blocked = None
+
+    def start(self):
+        """Starts watching for slow callbacks"""
+        if self.threshold > 0 and hasattr(signal, 'setitimer'):
+            self.io_loop.set_blocking_signal_threshold(
+                self.threshold, self._onBlocked)
+            self.running = True
+
+    def stop(self):
+        """Stops watching"""
+        if self.running:
+            self.io_loop.set_blocking_signal_threshold(None, None)
+            self.running = False
+
+    def _onBlocked(self, signum, frame):
+        # Runs in a signal handler, while the slow callback is still going.
+        # Note what it is, and report it once the IOLoop is free again.
+        if self._blocked is not None:
+            return
+
+        hook, translator = getActivity()
+        stack = traceback.extract_stack(frame)[-STACK_DEPTH:]
+        self._blocked = (time.time() - self.threshold, hook, translator,
+                         stack)
+        self.io_loop.add_callback_from_signal(self._report)
+
+    def _report(self):
+        started, hook, translator, stack = self._blocked
+        self._blocked = None
+        duration = time.time() - started
+
+        SLOW_CALLBACKS.labels(hook or '', translator or '').inc()
+        SLOW_CALLBACK_SECONDS.observe(duration)
+        log.warning('IOLoop blocked for %.3fs (hook: %s, translator: %s) '
+                    'in:\n%s' % (duration, hook, translator,
+                                 ''.join(traceback.format_list(stack))))
@@ -0,0 +1,172 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc.
+
+"""
+Schedules retries of failed outbound calls.
+
+All pending retries live in a single heap, ordered by when they are due.
+Only the earliest of them has a timeout registered with the IOLoop, so
+scheduling a retry costs O(log n) no matter how many are already waiting,
+and nothing sits in memory for a retry besides its heap entry.
+
+    from hooky import retry
+
+    delay = retry.backoff(attempt, base=0.5, cap=60, jitter=1.0)
+    retry.RetryScheduler.instance().schedule(delay, callback)
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import heapq
+import itertools
+import logging
+import random
+import time
+
+from tornado import ioloop
+
+from hooky import metrics
+
+log = logging.getLogger(__name__)
+
+RETRY_PENDING = metrics.gauge(
+    'hooky_retry_pending', 'Retries waiting to be run')
+
+
+def backoff(attempt, base, cap, jitter=1.0):
+    """Returns how long to wait before retrying a failed call.
+
+    The delay doubles with each attempt, up to the cap. Jitter then takes a
+    random fraction off of it, so that calls that failed together don't all
+    retry together. A jitter of 1.0 picks anywhere between 0 and the full
+    delay, 0 disables it entirely.
+
+    args:
+        attempt: Number of attempts made so far (1 after the first failure)
+        base: Seconds to wait after the first failure
+        cap: Maximum number of seconds to wait
+        jitter: Fraction (0-1) of the delay that is randomized
+
+    returns:
+        Float number of seconds to wait
+    """
+    delay = min(cap, base * (2 ** (attempt - 1)))
+    return delay * (1 - jitter * random.random())
+
+
+class RetryScheduler(object):
+    """Runs callbacks after a delay, off of a single IOLoop timeout."""
+
+    def __init__(self, io_loop=None):
+        """Creates an empty scheduler.
+
+        args:
+            io_loop: The IOLoop to run on (def: the current IOLoop at the
+                     time the first retry is scheduled)
+        """
+        self.io_loop = io_loop
+
+        # Heap of [deadline, sequence, callback] entries. The sequence
+        # number keeps entries with the same deadline in order, and stops
+        # the callbacks themselves from ever being compared.
+        self._heap = []
+        self._sequence = itertools.count()
+        self._pending = 0
+
+        # The IOLoop timeout for the entry at the top of the heap
+        self._timeout = None
+        self._timeout_loop = None
+        self._deadline = None
+
+    @classmethod
+    def instance(cls):
+        """Returns a global RetryScheduler instance."""
+        if not hasattr(cls, '_instance'):
+            cls._instance = cls()
+        return cls._instance
+
+    def schedule(self, delay, callback):
+        """Runs callback after delay seconds.
+
+        args:
+            delay: Float number of seconds to wait
+            callback: Function to call, with no arguments
+
+        returns:
+            A handle that can be passed to cancel()
+        """
+        entry = [time.time() + delay, next(self._sequence), callback]
+        heapq.heappush(self._heap, entry)
+        self._pending += 1
+        RETRY_PENDING.inc()
+
+        if self._deadline is None or entry[0] < self._deadline:
+            self._reschedule()
+
+        return entry
+
+    def cancel(self, handle):
+        """Cancels a scheduled callback.
+
+        The entry is left in the heap (removing it would be O(n)) but will
+        be skipped over when it comes due.
+
+        args:
+            handle: A handle returned by schedule()
+        """
+        if handle[2] is not None:
+            handle[2] = None
+            self._pending -= 1
+            RETRY_PENDING.dec()
+
+    def __len__(self):
+        """Number of callbacks waiting to be run"""
+        return self._pending
+
+    def _reschedule(self):
+        """Points the IOLoop timeout at the earliest entry in the heap"""
+        if self._timeout is not None:
+            self._timeout_loop.remove_timeout(self._timeout)
+            self._timeout = self._deadline = None
+
+        # Throw away cancelled entries sitting at the top
+        while self._heap and self._heap[0][2] is None:
+            heapq.heappop(self._heap)
+
+        if not self._heap:
+            return
+
+        self._deadline = self._heap[0][0]
+        self._timeout_loop = self.io_loop or ioloop.IOLoop.current()
+        self._timeout = self._timeout_loop.add_timeout(self._deadline,
+                                                       self._run)
+
+    def _run(self):
+        """Runs every callback that is due, then waits for the next one"""
+        self._timeout = self._deadline = None
+
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            callback = heapq.heappop(self._heap)[2]
+            if callback is None:
+                continue
+
+            self._pending -= 1
+            RETRY_PENDING.dec()
+            try:
+                callback()
+            except Exception:
+                log.exception('Retry callback %s failed' % callback)
+
+        self._reschedule()
@@ -21,10 +21,16 @@ options are documented more thoroughly in the README file.
 
 __author__ = 'Matt Wise (matt@nextdoor.com)'
 
+from tornado import httpserver
 from tornado import ioloop
+from tornado import netutil
 import optparse
 
+from hooky import monitor
+from hooky import shutdown
+from hooky import supervisor
 from hooky import utils
+from hooky.config import reloader
 from hooky.web import app
 
 from version import __version__ as VERSION
@@ -55,6 +61,10 @@ parser.add_option('-l', '--level', dest="level",
 parser.add_option('-s', '--syslog', dest='syslog',
                   default=None,
                   help='Log to syslog. Supply facility name. (ie "local0")')
+parser.add_option('-P', '--processes', dest='processes',
+                  default=1, type='int',
+                  help='Number of worker processes, 0 for one per CPU '
+                       '(def: 1)')
 (options, args) = parser.parse_args()
 
 
@@ -84,9 +94,43 @@ def main():
     log.debug('Building config object...')
     cfg = getConfigObject(options.config_module, options.config_file)
 
-    # Build the HTTP service listening to the port supplied
-    server = app.getApplication(cfg)
-    server.listen(int(options.port))
+    # Bind the port before forking, so that every worker shares it
+    sockets = netutil.bind_sockets(int(options.port))
+
+    # Fork off the workers. The supervisor never returns, only the workers
+    # carry on from here.
+    task_id = None
+    processes = supervisor.getProcessCount(options.processes)
+    if processes > 1:
+        task_id = supervisor.Supervisor(processes).start()
+
+    # Build the HTTP service on the sockets we bound
+    application = app.getApplication(cfg, task_id, processes)
+    server = httpserver.HTTPServer(application)
+    server.add_sockets(sockets)
+
+    # Reload the config on SIGHUP (and when it changes, if configured)
+    config_reloader = reloader.ConfigReloader(
+        cfg, cfg.getGeneral().get('reload_interval', 0),
+        callback=lambda old, new: app.reconfigure(application, old, new))
+    config_reloader.installSignalHandler()
+    config_reloader.start()
+
+    # Measure how responsive the IOLoop is, and report what blocks it
+    general = cfg.getGeneral()
+    monitor.LagMonitor(
+        general.get('lag_interval', monitor.DEFAULT_INTERVAL),
+        general.get('lag_window', monitor.DEFAULT_WINDOW)).start()
+    monitor.SlowCallbackMonitor(general.get(
+        'slow_callback_threshold', monitor.DEFAULT_THRESHOLD)).start()
+
+    # Drain the requests in progress and the queue on SIGTERM
+    graceful = shutdown.GracefulShutdown(
+        server, application.settings['tracker'],
+        application.settings['queue'],
+        cfg.getGeneral().get('shutdown_timeout', shutdown.DEFAULT_TIMEOUT))
+    graceful.installSignalHandler()
+
     ioloop.IOLoop.instance().start()
 
 
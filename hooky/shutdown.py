@@ -0,0 +1,172 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc.
+
+"""
+Shuts the Hooky service down without dropping the work it has in hand.
+
+On a SIGTERM (or SIGINT), the GracefulShutdown object:
+
+  1. Stops listening for new connections. Requests that arrive on already
+     open connections are still handled, but their connections are closed
+     once the response is sent.
+  2. Waits for every inbound request still being handled to finish.
+  3. Waits for the DeliveryQueue to deliver everything in it.
+  4. Closes the journal (if any), flushes the logs and stops the IOLoop.
+
+Steps 2 and 3 are cut short once the timeout has passed. Anything still
+queued at that point is lost, unless the queue is journaled, in which case
+it is delivered again when Hooky next starts.
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import logging
+import signal
+
+from tornado import concurrent
+from tornado import gen
+from tornado import ioloop
+
+from hooky import metrics
+from hooky import utils
+
+log = logging.getLogger(__name__)
+
+# Defaults used when not overridden in the [general] config section
+DEFAULT_TIMEOUT = 30
+
+IN_FLIGHT = metrics.gauge(
+    'hooky_requests_in_flight', 'Inbound hook requests being handled')
+
+
+class Tracker(object):
+    """Counts the inbound requests being handled right now."""
+
+    def __init__(self):
+        self.active = 0
+
+        # Set once we are shutting down
+        self.closing = False
+
+        # Futures waiting for active to drop to 0
+        self._waiters = []
+
+    @classmethod
+    def instance(cls):
+        """Returns a global Tracker instance."""
+        if not hasattr(cls, '_instance'):
+            cls._instance = cls()
+        return cls._instance
+
+    def start(self):
+        """Records that a request has started"""
+        self.active += 1
+        IN_FLIGHT.inc()
+
+    def finish(self):
+        """Records that a request has finished"""
+        self.active -= 1
+        IN_FLIGHT.dec()
+        if self.active == 0:
+            waiters, self._waiters = self._waiters, []
+            for future in waiters:
+                future.set_result(None)
+
+    def wait(self):
+        """Returns a Future that resolves once no requests are active"""
+        future = concurrent.TracebackFuture()
+        if self.active == 0:
+            future.set_result(None)
+        else:
+            self._waiters.append(future)
+        return future
+
+    def __len__(self):
+        return self.active
+
+
+class GracefulShutdown(object):
+    """Drains and stops the service when asked to."""
+
+    def __init__(self, server, tracker, queue, timeout=DEFAULT_TIMEOUT,
+                 io_loop=None):
+        """Sets up the shutdown. Call installSignalHandler() to arm it.
+
+        args:
+            server: The tornado HTTPServer accepting requests
+            tracker: The Tracker counting the requests being handled
+            queue: The hooky.delivery.DeliveryQueue to drain
+            timeout: Seconds to wait for requests and deliveries to finish
+            io_loop: The IOLoop to stop (def: IOLoop.instance())
+        """
+        self.server = server
+        self.tracker = tracker
+        self.queue = queue
+        self.timeout = float(timeout)
+        self.io_loop = io_loop or ioloop.IOLoop.instance()
+        self.stopping = False
+
+    def installSignalHandler(self):
+        """Shuts down gracefully whenever we get a SIGTERM or SIGINT"""
+        signal.signal(signal.SIGTERM, self._handleSignal)
+        signal.signal(signal.SIGINT, self._handleSignal)
+
+    @gen.coroutine
+    def shutdown(self):
+        """Stops accepting requests, waits for the rest, then stops.
+
+        returns:
+            True if everything finished in time, False if the timeout was
+            reached first.
+        """
+        if self.stopping:
+            return
+        self.stopping = True
+
+        log.info('Shutting down, waiting up to %ss for %s requests and %s '
+                 'queued deliveries to finish' %
+                 (self.timeout, len(self.tracker), len(self.queue)))
+        self.server.stop()
+        self.tracker.closing = True
+
+        drained = True
+        try:
+            yield utils.withTimeout(self._drain(), self.timeout,
+                                    io_loop=self.io_loop)
+        except utils.TimeoutError:
+            drained = False
+            log.warning('Gave up waiting after %ss, %s requests and %s '
+                        'queued deliveries did not finish' %
+                        (self.timeout, len(self.tracker), len(self.queue)))
+
+        if self.queue.journal is not None:
+            self.queue.journal.close()
+
+        log.info('Shutdown complete')
+        logging.shutdown()
+        self.io_loop.stop()
+
+        raise gen.Return(drained)
+
+    @gen.coroutine
+    def _drain(self):
+        # Requests still being handled may put more on the queue, so they
+        # need to finish first.
+        yield self.tracker.wait()
+        yield self.queue.join()
+
+    def _handleSignal(self, signum, frame):
+        # Signal handlers can interrupt anything, so just hand the actual
+        # work off to the IOLoop.
+        self.io_loop.add_callback_from_signal(self.shutdown)
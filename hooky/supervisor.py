@@ -0,0 +1,216 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc.
+
+"""
+Runs Hooky as several forked worker processes.
+
+A single IOLoop only ever uses one core, and parsing, rendering and
+serializing hooks is all CPU work. To use the rest of the box, the listening
+sockets are bound once in the parent, and then a number of worker processes
+are forked off that each run their own IOLoop on the shared sockets:
+
+    sockets = netutil.bind_sockets(port)
+    task_id = supervisor.Supervisor(4).start()
+    # Only the workers get here
+    ...
+
+This works like Tornado's process.fork_processes(), except that the parent
+stays behind as a supervisor: it passes SIGTERM, SIGINT and SIGHUP on to
+every worker, and it replaces workers that crash (up to max_restarts times)
+rather than leaving the service a worker short.
+
+Nothing that creates an IOLoop may be run before start(), as the IOLoop and
+its file descriptors would be shared by every worker.
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import errno
+import logging
+import os
+import random
+import signal
+import sys
+import time
+
+from tornado import process
+
+log = logging.getLogger(__name__)
+
+# Signals the supervisor passes on to its workers
+FORWARDED_SIGNALS = (signal.SIGTERM, signal.SIGINT, signal.SIGHUP)
+
+# Signals that tell the supervisor to shut down, rather than restart workers
+STOP_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+# Defaults used when not overridden on the command line
+DEFAULT_MAX_RESTARTS = 100
+
+# Workers that die this soon after starting are restarted with a delay, so
+# that a worker that can never start (say, because of a bad config) does not
+# spin the box.
+MIN_UPTIME = 1.0
+
+
+def getProcessCount(processes):
+    """Returns the number of workers to run for a --processes value.
+
+    args:
+        processes: Number of worker processes, or 0 for one per CPU
+
+    returns:
+        The number of worker processes (at least 1)
+    """
+    processes = int(processes)
+    if processes <= 0:
+        processes = process.cpu_count()
+    return processes
+
+
+class Supervisor(object):
+    """Forks worker processes and keeps them running."""
+
+    def __init__(self, processes, max_restarts=DEFAULT_MAX_RESTARTS):
+        """Sets up the supervisor. Call start() to fork the workers.
+
+        args:
+            processes: Number of worker processes, or 0 for one per CPU
+            max_restarts: Number of crashed workers to replace before giving
+                          up and shutting down
+        """
+        self.processes = getProcessCount(processes)
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.stopping = False
+
+        # pid -> (task id, start time) of every running worker
+        self.children = {}
+
+    def start(self):
+        """Forks the workers, then supervises them until they all exit.
+
+        Only ever returns in a worker process.
+
+        returns:
+            The task id (0 to processes - 1) of this worker. A worker that
+            replaces a crashed one gets the same task id.
+        """
+        log.info('Starting %s worker processes' % self.processes)
+
+        # Install our handlers first, so that a signal that arrives while
+        # the workers are being forked reaches every one of them. Each
+        # worker puts the default handlers back.
+        for signum in FORWARDED_SIGNALS:
+            signal.signal(signum, self._handleSignal)
+
+        for task_id in xrange(self.processes):
+            if self.stopping:
+                break
+            if self._fork(task_id):
+                return task_id
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except OSError, e:
+                # Interrupted by one of our signal handlers
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+
+            if pid not in self.children:
+                continue
+
+            task_id, started = self.children.pop(pid)
+            if self._shouldRestart(pid, task_id, status):
+                if time.time() - started < MIN_UPTIME:
+                    time.sleep(MIN_UPTIME)
+
+                # A SIGTERM during the sleep was only passed on to the
+                # workers we already had, so don't start another one.
+                if self.stopping:
+                    log.info('Not restarting worker %s, shutting down' %
+                             task_id)
+                    continue
+                if self._fork(task_id):
+                    return task_id
+
+        log.info('All worker processes have exited')
+        sys.exit(0)
+
+    def _fork(self, task_id):
+        """Forks a worker. Returns True in the worker, False in the parent"""
+        pid = os.fork()
+        if pid == 0:
+            # Workers must not act on our handlers, nor share our random
+            # state (which is used for things like retry jitter). A SIGHUP
+            # would kill the worker until its ConfigReloader installs a
+            # handler for it, so it is ignored until then.
+            for signum in STOP_SIGNALS:
+                signal.signal(signum, signal.SIG_DFL)
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            random.seed()
+            self.children = {}
+            return True
+
+        log.debug('Started worker %s (pid %s)' % (task_id, pid))
+        self.children[pid] = (task_id, time.time())
+        return False
+
+    def _shouldRestart(self, pid, task_id, status):
+        """Decides whether a worker that exited should be replaced"""
+        if os.WIFSIGNALED(status):
+            reason = 'was killed by signal %s' % os.WTERMSIG(status)
+        elif os.WEXITSTATUS(status) != 0:
+            reason = 'exited with status %s' % os.WEXITSTATUS(status)
+        else:
+            log.info('Worker %s (pid %s) exited' % (task_id, pid))
+            return False
+
+        if self.stopping:
+            log.info('Worker %s (pid %s) %s' % (task_id, pid, reason))
+            return False
+
+        if self.restarts >= self.max_restarts:
+            log.error('Worker %s (pid %s) %s, but it has already been '
+                      'restarted %s times. Shutting down.' %
+                      (task_id, pid, reason, self.restarts))
+            self._stop(signal.SIGTERM)
+            return False
+
+        self.restarts += 1
+        log.warning('Worker %s (pid %s) %s, restarting it' %
+                    (task_id, pid, reason))
+        return True
+
+    def _handleSignal(self, signum, frame):
+        if signum in STOP_SIGNALS:
+            self._stop(signum)
+        else:
+            self._signal(signum)
+
+    def _stop(self, signum):
+        """Stops restarting workers, and asks each of them to exit"""
+        self.stopping = True
+        self._signal(signum)
+
+    def _signal(self, signum):
+        """Sends a signal to every worker"""
+        for pid in self.children.keys():
+            try:
+                os.kill(pid, signum)
+            except OSError, e:
+                # Already gone, and waiting to be reaped
+                if e.errno != errno.ESRCH:
+                    raise
@@ -0,0 +1,50 @@
+"""Translators and routes shared by the delivery and journal tests"""
+
+from tornado import gen
+
+from hooky.config import base as ConfigBase
+
+
+class RecordingTranslator(object):
+    """Translator that records the requests it was handed"""
+    reentrant = True
+
+    def __init__(self, success=True, retryable=True):
+        self.success = success
+        self.retryable = retryable
+        self.requests = []
+
+    @property
+    def bodies(self):
+        return [request.body for request in self.requests]
+
+    @gen.coroutine
+    def submit(self, request):
+        self.requests.append(request)
+        result = {'success': self.success, 'message': 'OK'}
+        if not self.retryable:
+            result['retryable'] = False
+        raise gen.Return(result)
+
+
+def getRoute(translators, name='unittest', **options):
+    """Builds a HookRoute for the supplied translator objects.
+
+    args:
+        translators: List of translator objects (each named 't'), or a
+                     dict of names to translator objects
+        name: Name of the hook
+        options: Options of the hook
+    """
+    if isinstance(translators, dict):
+        translators = sorted(translators.items())
+    else:
+        translators = [('t', translator) for translator in translators]
+
+    specs = []
+    for translator_name, translator in translators:
+        spec = ConfigBase.TranslatorSpec(translator_name, type(translator),
+                                         {})
+        spec._instance = translator
+        specs.append(spec)
+    return ConfigBase.HookRoute(name, options, tuple(specs))
@@ -0,0 +1,99 @@
+import mock
+
+from tornado import testing
+
+from hooky import breaker
+
+
+class TestCircuitBreaker(testing.unittest.TestCase):
+    def setUp(self):
+        self.breaker = breaker.CircuitBreaker('http://x', threshold=2,
+                                              cooldown=10)
+
+    def testOpens(self):
+        """Test that the breaker opens after threshold failures in a row"""
+        self.assertTrue(self.breaker.allow())
+        self.breaker.failure()
+        self.assertEquals(breaker.CLOSED, self.breaker.state)
+
+        # A success resets the count
+        self.breaker.success()
+        self.breaker.failure()
+        self.assertEquals(breaker.CLOSED, self.breaker.state)
+
+        self.breaker.failure()
+        self.assertEquals(breaker.OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+
+    def testHalfOpen(self):
+        """Test that a single call is let through after the cool-down"""
+        with mock.patch('time.time', return_value=100):
+            self.breaker.failure()
+            self.breaker.failure()
+            self.assertFalse(self.breaker.allow())
+
+        with mock.patch('time.time', return_value=111):
+            self.assertTrue(self.breaker.allow())
+            self.assertEquals(breaker.HALF_OPEN, self.breaker.state)
+            self.assertFalse(self.breaker.allow())
+
+            # The test call failed, so it opens right back up
+            self.breaker.failure()
+            self.assertEquals(breaker.OPEN, self.breaker.state)
+            self.assertFalse(self.breaker.allow())
+
+        with mock.patch('time.time', return_value=122):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.success()
+            self.assertEquals(breaker.CLOSED, self.breaker.state)
+            self.assertTrue(self.breaker.allow())
+            self.assertTrue(self.breaker.allow())
+
+
+class TestGetBreaker(testing.unittest.TestCase):
+    def setUp(self):
+        breaker.clearBreakers()
+
+    def tearDown(self):
+        breaker.clearBreakers()
+
+    def testGetBreaker(self):
+        """Test that each destination gets a single, shared breaker"""
+        a = breaker.getBreaker('http://a', threshold=3)
+        self.assertTrue(a is breaker.getBreaker('http://a', threshold=3))
+        self.assertEquals(3, a.threshold)
+
+        b = breaker.getBreaker('http://b')
+        self.assertEquals([a, b], breaker.getBreakers())
+
+        breaker.clearBreakers()
+        self.assertEquals([], breaker.getBreakers())
+
+    def testGetBreakerNewSettings(self):
+        """Test that new settings (from a reload) update the breaker"""
+        a = breaker.getBreaker('http://a', threshold=3, cooldown=10)
+        a.failure()
+
+        self.assertTrue(a is breaker.getBreaker('http://a', threshold=1,
+                                                cooldown=5))
+        self.assertEquals((1, 5), (a.threshold, a.cooldown))
+        self.assertEquals(1, a.failures)
+
+    def testHoldChanges(self):
+        """Test that held changes only reach the breakers once applied"""
+        a = breaker.getBreaker('http://a', threshold=3, cooldown=10)
+        changes = breaker.holdChanges()
+        try:
+            self.assertTrue(a is breaker.getBreaker('http://a', threshold=1,
+                                                    cooldown=5))
+            b = breaker.getBreaker('http://b')
+            self.assertTrue(b is breaker.getBreaker('http://b'))
+        finally:
+            breaker.releaseChanges()
+
+        self.assertEquals((3, 10), (a.threshold, a.cooldown))
+        self.assertEquals([a], breaker.getBreakers())
+
+        changes.apply()
+        self.assertEquals((1, 5), (a.threshold, a.cooldown))
+        self.assertEquals([a, b], breaker.getBreakers())
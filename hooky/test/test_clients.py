@@ -0,0 +1,86 @@
+import mock
+from tornado import testing
+from tornado import web
+
+from hooky import clients
+
+
+class HelloHandler(web.RequestHandler):
+    def get(self):
+        self.write('Hello')
+
+
+class TestClients(testing.AsyncHTTPTestCase):
+    def get_app(self):
+        return web.Application([(r'/', HelloHandler)])
+
+    def tearDown(self):
+        clients.configure()
+        super(TestClients, self).tearDown()
+
+    def testGetHost(self):
+        """Test that URLs are reduced to their scheme, host and port"""
+        self.assertEquals('http://example.com:80',
+                          clients.getHost('http://example.com/a/b?c=d'))
+        self.assertEquals('https://example.com:443',
+                          clients.getHost('https://user@example.com/'))
+        self.assertEquals('http://example.com:8080',
+                          clients.getHost('http://example.com:8080'))
+
+    def testGetPool(self):
+        """Test that each host gets its own pool"""
+        pool = clients.getPool('http://example.com/a')
+        self.assertTrue(pool is clients.getPool('http://example.com/b'))
+        self.assertFalse(pool is clients.getPool('http://example.org/a'))
+        self.assertEquals(clients.DEFAULT_MAX_CLIENTS, pool.max_clients)
+
+        # Translators with their own limit get their own pool
+        small = clients.getPool('http://example.com/a', max_clients=2)
+        self.assertFalse(pool is small)
+        self.assertEquals(2, small.max_clients)
+        self.assertEquals(2, small.client.max_clients)
+
+    def testConfigure(self):
+        """Test that configure() changes the defaults for new pools"""
+        pool = clients.getPool('http://example.com/')
+        clients.configure(max_clients='3')
+        new = clients.getPool('http://example.com/')
+        self.assertFalse(pool is new)
+        self.assertEquals(3, new.max_clients)
+
+        self.assertRaises(ValueError, clients.configure, backend='bogus')
+
+    def testConfigureCloses(self):
+        """Test that configure() closes the clients it throws away"""
+        pool = clients.getPool('http://example.com/')
+        with mock.patch.object(pool.client, 'close') as close:
+            clients.configure()
+        close.assert_called_once_with()
+
+    def testConfigureCurl(self):
+        """Test that the curl backend is only used if pycurl is installed"""
+        clients.configure(backend='curl')
+        pool = clients.getPool('http://example.com/')
+        if clients._getClientClass('curl') is None:
+            self.assertEquals('simple', pool.backend)
+        else:
+            self.assertEquals('curl', pool.backend)
+
+    @testing.gen_test
+    def testFetch(self):
+        """Test that requests are made, and counted, by the pool"""
+        url = self.get_url('/')
+        pool = clients.getPool(url, max_clients=2)
+        futures = [pool.fetch(url) for i in xrange(5)]
+        self.assertEquals({'host': clients.getHost(url),
+                           'backend': 'simple',
+                           'max_clients': 2,
+                           'active': 2,
+                           'waiting': 3,
+                           'requests': 5}, pool.stats())
+
+        responses = yield futures
+        self.assertEquals(['Hello'] * 5, [r.body for r in responses])
+        self.assertEquals(0, pool.stats()['active'])
+        self.assertEquals(0, pool.stats()['waiting'])
+        self.assertTrue(pool.stats() in clients.stats())
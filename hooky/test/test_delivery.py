@@ -0,0 +1,134 @@
+from tornado import gen
+from tornado import httpclient
+from tornado import ioloop
+from tornado import testing
+
+from hooky import delivery
+from hooky import monitor
+from hooky.test.helpers import RecordingTranslator
+from hooky.test.helpers import getRoute
+from hooky.translators import context
+
+
+class BrokenTranslator(object):
+    """Translator that raises an exception"""
+    reentrant = True
+
+    @gen.coroutine
+    def submit(self, request):
+        raise Exception('Broken')
+
+
+class ActivityTranslator(object):
+    """Translator that records the activity it runs in, across a yield"""
+    reentrant = True
+
+    def __init__(self):
+        self.activities = []
+
+    @gen.coroutine
+    def submit(self, request):
+        self.activities.append(monitor.getActivity())
+        yield gen.Task(ioloop.IOLoop.current().add_callback)
+        self.activities.append(monitor.getActivity())
+        raise gen.Return({'success': True, 'message': 'OK'})
+
+
+class TestDispatch(testing.AsyncTestCase):
+    def setUp(self):
+        super(TestDispatch, self).setUp()
+        self.request = context.RequestContext(
+            httpclient.HTTPRequest('/', body='{}'))
+
+    @testing.gen_test
+    def testDispatch(self):
+        """Test that every translator gets the same request"""
+        a = RecordingTranslator()
+        b = RecordingTranslator(success=False)
+        results = yield delivery.dispatch(getRoute([a, b]), self.request)
+
+        self.assertEquals([self.request], a.requests)
+        self.assertEquals([self.request], b.requests)
+        self.assertEquals([True, False], [r['success'] for r in results])
+
+    @testing.gen_test
+    def testDispatchBrokenTranslator(self):
+        """Test that exceptions are turned into failed results"""
+        results = yield delivery.dispatch(getRoute([BrokenTranslator()]),
+                                          self.request)
+        self.assertEquals([{'success': False,
+                            'message': 'Internal error: Broken',
+                            'retryable': False}], results)
+
+    @testing.gen_test
+    def testDispatchActivity(self):
+        """Test that translators run tagged with their hook and name"""
+        translator = ActivityTranslator()
+        yield delivery.dispatch(getRoute([translator]), self.request)
+
+        self.assertEquals([('unittest', 't')] * 2, translator.activities)
+        self.assertEquals((None, None), monitor.getActivity())
+
+
+class TestDeliveryQueue(testing.AsyncTestCase):
+    def setUp(self):
+        super(TestDeliveryQueue, self).setUp()
+        self.request = context.RequestContext(
+            httpclient.HTTPRequest('/', body='{}'))
+
+    def _drain(self, queue):
+        """Runs the IOLoop until the queue has no more running workers"""
+        def check():
+            if not queue.busy:
+                self.stop()
+            else:
+                self.io_loop.add_callback(check)
+        self.io_loop.add_callback(check)
+        self.wait()
+
+    def testPut(self):
+        """Test that queued deliveries are delivered in the background"""
+        queue = delivery.DeliveryQueue(workers=2)
+        translator = RecordingTranslator()
+        route = getRoute([translator])
+
+        enqueued = delivery.QUEUE_ENQUEUED.value
+        delivered = delivery.QUEUE_DELIVERED.value
+        for i in xrange(5):
+            queue.put(route, self.request)
+
+        # Nothing is delivered until the IOLoop gets a chance to run
+        self.assertEquals([], translator.requests)
+        self.assertEquals(5, len(queue))
+        self.assertEquals(2, queue.busy)
+
+        self._drain(queue)
+        self.assertEquals(5, len(translator.requests))
+        self.assertEquals(0, len(queue))
+        self.assertEquals(5, delivery.QUEUE_ENQUEUED.value - enqueued)
+        self.assertEquals(5, delivery.QUEUE_DELIVERED.value - delivered)
+
+    def testPutFullQueue(self):
+        """Test that a full queue rejects new deliveries"""
+        queue = delivery.DeliveryQueue(size=1)
+        route = getRoute([RecordingTranslator()])
+        queue.put(route, self.request)
+        self.assertRaises(delivery.QueueFullException,
+                          queue.put, route, self.request)
+        self._drain(queue)
+
+    @testing.gen_test
+    def testJoin(self):
+        """Test that join() waits for every delivery to be delivered"""
+        queue = delivery.DeliveryQueue(workers=2)
+        self.assertTrue(queue.join().done())
+
+        translator = RecordingTranslator()
+        for i in xrange(5):
+            queue.put(getRoute([translator]), self.request)
+
+        joined = queue.join()
+        self.assertFalse(joined.done())
+        yield joined
+        self.assertTrue(queue.idle)
+        self.assertEquals(5, len(translator.requests))
@@ -0,0 +1,71 @@
+import threading
+
+from tornado import testing
+
+from hooky import executor
+from hooky.translators import parsers
+
+
+def getThread():
+    return threading.current_thread().name
+
+
+class TestExecutor(testing.AsyncTestCase):
+    def tearDown(self):
+        executor.configure()
+        super(TestExecutor, self).tearDown()
+
+    def testConfigure(self):
+        """Test that unknown executors are refused"""
+        self.assertRaises(ValueError, executor.configure, kind='bogus')
+        executor.configure(kind='none')
+        self.assertEquals('none', executor.getKind())
+        self.assertFalse(executor.willOffload(10 ** 9))
+
+    def testConfigureWithoutFutures(self):
+        """Test that pools are only used if futures is installed"""
+        executor.configure(kind='thread')
+        if executor._getPoolClass('thread') is None:
+            self.assertEquals('none', executor.getKind())
+        else:
+            self.assertEquals('thread', executor.getKind())
+
+    @testing.gen_test
+    def testInline(self):
+        """Test that small requests are run right away, on the IOLoop"""
+        executor.configure(kind='thread', threshold=100)
+        future = executor.run(99, getThread)
+        self.assertTrue(future.done())
+        self.assertEquals(getThread(), (yield future))
+
+        future = executor.run(10, int, 'bogus')
+        self.assertTrue(future.done())
+        self.assertRaises(ValueError, future.result)
+
+    @testing.gen_test
+    def testThread(self):
+        """Test that large requests are run on another thread"""
+        executor.configure(kind='thread', threshold=100)
+        if executor.getKind() != 'thread':
+            return
+
+        self.assertTrue(executor.willOffload(100))
+        self.assertNotEquals(getThread(), (yield executor.run(100, getThread)))
+
+        with self.assertRaises(ValueError):
+            yield executor.run(100, int, 'bogus')
+
+    @testing.gen_test
+    def testProcess(self):
+        """Test that only picklable work is sent to a process pool"""
+        executor.configure(kind='process', workers=1, threshold=0)
+        if executor.getKind() != 'process':
+            return
+
+        self.assertFalse(executor.willOffload(100, picklable=False))
+        self.assertEquals(
+            {'foo': 'bar'},
+            (yield executor.run(13, parsers.parse, '{"foo": "bar"}')))
+        self.assertEquals(
+            getThread(), (yield executor.run(100, getThread,
+                                             picklable=False)))
@@ -0,0 +1,398 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from tornado import httpserver
+from tornado import httputil
+from tornado import testing
+
+from hooky import delivery
+from hooky import journal
+from hooky.config import base as ConfigBase
+from hooky.test.helpers import RecordingTranslator
+from hooky.test.helpers import getRoute
+from hooky.translators import context
+
+
+class FakeConfig(object):
+    """Config object that serves up a fixed set of routes"""
+
+    def __init__(self, *routes):
+        self.routes = dict((route.name, route) for route in routes)
+
+    def getRoute(self, name):
+        try:
+            return self.routes[name]
+        except KeyError:
+            raise ConfigBase.ConfigException('No hook named "%s"' % name)
+
+
+def getRequest(body='{"foo": "bar"}', content_type='application/json'):
+    headers = httputil.HTTPHeaders({'Content-Type': content_type})
+    return httpserver.HTTPRequest('POST', '/hook/unittest?x=1',
+                                  headers=headers, body=body)
+
+
+class TestRecord(testing.unittest.TestCase):
+    def testRoundTrip(self):
+        """Test that a request survives being written to a line and back"""
+        request = getRequest(body='\xff\x00binary')
+        record = journal.Record.fromRequest(7, 'hook', ['a', 'b'], request)
+
+        line = record.toLine()
+        self.assertTrue(line.startswith('E '))
+        self.assertTrue(line.endswith('\n'))
+        self.assertEquals(1, line.count('\n'))
+
+        copy = journal.Record.fromLine(line[2:])
+        self.assertEquals(7, copy.id)
+        self.assertEquals('hook', copy.hook)
+        self.assertEquals(['a', 'b'], copy.translators)
+
+        rebuilt = copy.toRequest()
+        self.assertEquals('POST', rebuilt.method)
+        self.assertEquals('/hook/unittest?x=1', rebuilt.uri)
+        self.assertEquals('\xff\x00binary', rebuilt.body)
+        self.assertEquals('application/json', rebuilt.headers['Content-Type'])
+        self.assertEquals({'x': ['1']}, rebuilt.arguments)
+
+    def testFormArguments(self):
+        """Test that form bodies are parsed back into arguments"""
+        request = getRequest(body='a=1&b=2',
+                             content_type='application/x-www-form-urlencoded')
+        record = journal.Record.fromRequest(1, 'hook', ['a'], request)
+        rebuilt = record.toRequest()
+        self.assertEquals(['1'], rebuilt.arguments['a'])
+        self.assertEquals(['2'], rebuilt.arguments['b'])
+
+
+class TestJournal(testing.AsyncTestCase):
+    def setUp(self):
+        super(TestJournal, self).setUp()
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        super(TestJournal, self).tearDown()
+
+    def _journal(self, **kwargs):
+        j = journal.Journal(self.path, io_loop=self.io_loop, **kwargs)
+        self.assertEquals([], j.open())
+        return j
+
+    def _segments(self):
+        return sorted(f for f in os.listdir(self.path)
+                      if f.startswith('segment-'))
+
+    def testInvalidFsync(self):
+        """Test that unknown fsync policies are rejected"""
+        self.assertRaises(journal.JournalException,
+                          journal.Journal, self.path, fsync='sometimes')
+
+    @testing.gen_test
+    def testReplay(self):
+        """Test that unacknowledged records are returned on open()"""
+        j = self._journal()
+        first, f1 = j.append('hook', ['a', 'b'], getRequest(body='1'))
+        second, f2 = j.append('hook', ['a'], getRequest(body='2'))
+        yield [f1, f2]
+
+        yield j.ack(first.id, 'a')
+        yield j.ack(second.id, 'a')
+        self.assertEquals(1, len(j))
+        j.close()
+
+        # Reopen it, as if the process had been restarted
+        j = journal.Journal(self.path, io_loop=self.io_loop)
+        records = j.open()
+        self.assertEquals(1, len(records))
+        self.assertEquals(first.id, records[0].id)
+        self.assertEquals(['b'], records[0].translators)
+        self.assertEquals('1', records[0].toRequest().body)
+
+        # New records never reuse old ids, and the old segment is gone
+        record, future = j.append('hook', ['a'], getRequest())
+        yield future
+        self.assertTrue(record.id > second.id)
+        self.assertEquals(['segment-000000000002.log'], self._segments())
+        j.close()
+
+    @testing.gen_test
+    def testTornLine(self):
+        """Test that a partially written record is skipped"""
+        j = self._journal()
+        record, future = j.append('hook', ['a'], getRequest())
+        yield future
+        j.close()
+
+        segment = os.path.join(self.path, self._segments()[0])
+        with open(segment, 'ab') as fh:
+            fh.write('E {"id": 2, "hook": "ho')
+
+        records = journal.Journal(self.path, io_loop=self.io_loop).open()
+        self.assertEquals([record.id], [r.id for r in records])
+
+    @testing.gen_test
+    def testGroupCommit(self):
+        """Test that records written together are committed together"""
+        j = self._journal(fsync='batch')
+        commits = journal.JOURNAL_COMMITS.value
+        futures = [j.append('hook', ['a'], getRequest())[1]
+                   for i in xrange(10)]
+        self.assertFalse(any(f.done() for f in futures))
+
+        yield futures
+        self.assertEquals(1, journal.JOURNAL_COMMITS.value - commits)
+        j.close()
+
+    def testFsyncAlways(self):
+        """Test that fsync=always commits every record right away"""
+        j = self._journal(fsync='always')
+        record, future = j.append('hook', ['a'], getRequest())
+        self.assertTrue(future.done())
+        j.close()
+
+    @testing.gen_test
+    def testSegmentRotation(self):
+        """Test that fully acknowledged segments are removed"""
+        j = self._journal(segment_bytes=1)
+        first, future = j.append('hook', ['a'], getRequest())
+        yield future
+        second, future = j.append('hook', ['a'], getRequest())
+        yield future
+
+        # Starting the third segment copied the first record into it, so
+        # the first segment is already gone.
+        self.assertEquals(['segment-000000000002.log',
+                           'segment-000000000003.log'], self._segments())
+
+        # Acking the first record frees up the segment it was copied into,
+        # and the second record is copied into the next one.
+        yield j.ack(first.id, 'a')
+        self.assertEquals(['segment-000000000004.log'], self._segments())
+
+        yield j.ack(second.id, 'a')
+        self.assertEquals(['segment-000000000005.log'], self._segments())
+        j.close()
+
+    @testing.gen_test
+    def testCopyForward(self):
+        """Test that one unacknowledged record doesn't keep old segments"""
+        j = self._journal(segment_bytes=2000)
+        stuck, future = j.append('hook', ['a', 'b'], getRequest(body='1'))
+        yield future
+        yield j.ack(stuck.id, 'a')
+
+        for i in xrange(100):
+            record, future = j.append('hook', ['a'], getRequest())
+            yield future
+            yield j.ack(record.id, 'a')
+
+        self.assertTrue(len(self._segments()) <= 3)
+        self.assertEquals(1, len(j))
+        j.close()
+
+        records = journal.Journal(self.path, io_loop=self.io_loop).open()
+        self.assertEquals([stuck.id], [r.id for r in records])
+        self.assertEquals(['b'], records[0].translators)
+        self.assertEquals('1', records[0].toRequest().body)
+
+    @testing.gen_test
+    def testDeadLetter(self):
+        """Test that dead-lettered deliveries are written out and acked"""
+        j = self._journal()
+        record, future = j.append('hook', ['a'], getRequest(body='1'))
+        yield future
+
+        yield j.deadLetter(record.id, 'hook', 'a', getRequest(body='1'),
+                           'HTTP 400')
+        self.assertEquals(0, len(j))
+        j.close()
+
+        lines = open(os.path.join(self.path,
+                                  journal.DEAD_LETTER_FILE)).readlines()
+        self.assertEquals(1, len(lines))
+        letter = json.loads(lines[0])
+        self.assertEquals((record.id, 'hook', 'a', 'HTTP 400'),
+                          (letter['id'], letter['hook'], letter['translator'],
+                           letter['message']))
+        self.assertEquals('MQ==', letter['request']['body'])
+        self.assertEquals([], journal.Journal(self.path).open())
+
+    @testing.gen_test
+    def testAdopt(self):
+        """Test that records of an orphaned journal are taken over"""
+        orphan_path = os.path.join(self.path, 'worker-3')
+        orphan = journal.Journal(orphan_path, io_loop=self.io_loop)
+        orphan.open()
+        first, f1 = orphan.append('hook', ['a', 'b'], getRequest(body='1'))
+        second, f2 = orphan.append('hook', ['a'], getRequest(body='2'))
+        yield [f1, f2]
+        yield orphan.ack(second.id, 'a')
+        yield orphan.ack(first.id, 'a')
+        orphan.close()
+
+        j = self._journal()
+        mine, future = j.append('hook', ['a'], getRequest(body='3'))
+        yield future
+
+        records = j.adopt(orphan_path)
+        self.assertEquals(1, len(records))
+        self.assertEquals(['b'], records[0].translators)
+        self.assertEquals('1', records[0].toRequest().body)
+        self.assertTrue(records[0].id > mine.id)
+        self.assertFalse(os.path.exists(orphan_path))
+        self.assertEquals([], j.adopt(orphan_path))
+        j.close()
+
+        # The adopted record is now replayed from this journal
+        records = journal.Journal(self.path, io_loop=self.io_loop).open()
+        self.assertEquals(['3', '1'],
+                          [r.toRequest().body for r in records])
+
+
+class TestJournaledQueue(testing.AsyncTestCase):
+    def setUp(self):
+        super(TestJournaledQueue, self).setUp()
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        super(TestJournaledQueue, self).tearDown()
+
+    def _drain(self, queue):
+        """Runs the IOLoop until the queue has no more running workers"""
+        def check():
+            if not queue.busy and not queue.journal._waiters:
+                self.stop()
+            else:
+                self.io_loop.add_callback(check)
+        self.io_loop.add_callback(check)
+        self.wait()
+
+    def _waitFor(self, condition):
+        """Runs the IOLoop until condition() is true"""
+        def check():
+            if condition():
+                self.stop()
+            else:
+                self.io_loop.add_timeout(time.time() + 0.01, check)
+        self.io_loop.add_callback(check)
+        self.wait()
+
+    def _queue(self, config):
+        j = journal.Journal(self.path, io_loop=self.io_loop)
+        queue = delivery.DeliveryQueue(journal=j, io_loop=self.io_loop)
+        queue.replay(config, j.open())
+        return queue
+
+    def testPutWaitsForCommit(self):
+        """Test that deliveries are only queued once they are on disk"""
+        a = RecordingTranslator()
+        route = getRoute({'a': a}, name='hook')
+        queue = self._queue(FakeConfig(route))
+
+        future = queue.put(route, context.RequestContext(getRequest()))
+        self.assertFalse(future.done())
+        self.assertEquals(0, len(queue))
+
+        self._drain(queue)
+        self.assertTrue(future.done())
+        self.assertEquals(['{"foo": "bar"}'], a.bodies)
+        self.assertEquals(0, len(queue.journal))
+
+    def testPutFullWhileCommitting(self):
+        """Test that deliveries waiting on the journal count toward size"""
+        route = getRoute({'a': RecordingTranslator()}, name='hook')
+        queue = self._queue(FakeConfig(route))
+        queue.size = 1
+
+        queue.put(route, context.RequestContext(getRequest()))
+        self.assertRaises(delivery.QueueFullException, queue.put, route,
+                          context.RequestContext(getRequest()))
+        self._drain(queue)
+
+    def testReplay(self):
+        """Test that unfinished deliveries are replayed after a restart"""
+        j = journal.Journal(self.path, io_loop=self.io_loop)
+        j.open()
+        record, future = j.append('hook', ['a', 'b'], getRequest(body='1'))
+        j.ack(record.id, 'a')
+        j.append('gone', ['a'], getRequest(body='2'))
+        j.close()
+
+        a = RecordingTranslator()
+        b = RecordingTranslator()
+        route = getRoute({'a': a, 'b': b}, name='hook')
+        queue = self._queue(FakeConfig(route))
+        self._drain(queue)
+
+        # Only the translator that hadn't finished gets the request, and
+        # the delivery for the hook that no longer exists is dropped.
+        self.assertEquals([], a.bodies)
+        self.assertEquals(['1'], b.bodies)
+        self.assertEquals(0, len(queue.journal))
+        queue.journal.close()
+
+        self.assertEquals([], journal.Journal(self.path).open())
+
+    def _deadLetters(self):
+        filename = os.path.join(self.path, journal.DEAD_LETTER_FILE)
+        if not os.path.exists(filename):
+            return []
+        return [json.loads(line) for line in open(filename)]
+
+    def testFailedRetried(self):
+        """Test that failed deliveries are retried by just that translator"""
+        a = RecordingTranslator()
+        b = RecordingTranslator(success=False)
+        route = getRoute({'a': a, 'b': b}, name='hook')
+        queue = self._queue(FakeConfig(route))
+        queue.retry_backoff = 0.01
+
+        queue.put(route, context.RequestContext(getRequest(body='1')))
+        self._drain(queue)
+        self.assertEquals(['1'], a.bodies)
+        self.assertEquals(['1'], b.bodies)
+        self.assertEquals(1, len(queue.journal))
+
+        # The retry succeeds, and the delivery is done with
+        b.success = True
+        self._waitFor(lambda: not len(queue.journal))
+        self.assertEquals(['1'], a.bodies)
+        self.assertEquals(['1', '1'], b.bodies)
+        self.assertEquals([], self._deadLetters())
+        queue.journal.close()
+
+    def testRetriesExhausted(self):
+        """Test that deliveries out of retries are dead-lettered"""
+        a = RecordingTranslator(success=False)
+        route = getRoute({'a': a}, name='hook')
+        queue = self._queue(FakeConfig(route))
+        queue.retries = 2
+        queue.retry_backoff = 0.01
+
+        queue.put(route, context.RequestContext(getRequest(body='1')))
+        self._waitFor(lambda: not len(queue.journal))
+        self.assertEquals(['1'] * 3, a.bodies)
+        self.assertEquals(['a'], [letter['translator']
+                                  for letter in self._deadLetters()])
+        queue.journal.close()
+
+    def testNotRetryable(self):
+        """Test that failures not worth retrying are dead-lettered at once"""
+        a = RecordingTranslator(success=False, retryable=False)
+        route = getRoute({'a': a}, name='hook')
+        queue = self._queue(FakeConfig(route))
+
+        queue.put(route, context.RequestContext(getRequest(body='1')))
+        self._drain(queue)
+        self.assertEquals(['1'], a.bodies)
+        self.assertEquals(0, len(queue.journal))
+        self.assertEquals(['a'], [letter['translator']
+                                  for letter in self._deadLetters()])
+        queue.journal.close()
+
+        self.assertEquals([], journal.Journal(self.path).open())
@@ -0,0 +1,67 @@
+import sys
+import types
+
+import mock
+from tornado.testing import unittest
+
+from hooky import jsonbackend
+from hooky.translators import parsers
+
+DOCUMENT = '{"url": "http://example.com/a", "total": 10.25, "items": [1]}'
+
+
+def getFakeOrjson():
+    """Returns a stand in for orjson, which returns bytes from dumps()"""
+    module = types.ModuleType('orjson')
+    module.loads = jsonbackend.json.loads
+    module.dumps = lambda obj: jsonbackend.json.dumps(obj).encode('utf-8')
+    return module
+
+
+class TestJSONBackend(unittest.TestCase):
+    def tearDown(self):
+        jsonbackend.configure()
+
+    def testConfigure(self):
+        """Test that unknown backends are refused"""
+        self.assertRaises(ValueError, jsonbackend.configure, 'bogus')
+        jsonbackend.configure('stdlib')
+        self.assertEquals('stdlib', jsonbackend.getBackend())
+        self.assertTrue('stdlib' in jsonbackend.getAvailable())
+
+    def testFallback(self):
+        """Test that a backend that isn't installed falls back to stdlib"""
+        with mock.patch.dict(sys.modules, {'ujson': None}):
+            jsonbackend.configure('ujson')
+            self.assertFalse('ujson' in jsonbackend.getAvailable())
+        self.assertEquals('stdlib', jsonbackend.getBackend())
+        self.assertEquals({'a': 1}, jsonbackend.loads('{"a": 1}'))
+
+    def testEachBackend(self):
+        """Test that every installed backend decodes the same way"""
+        expected = jsonbackend.json.loads(DOCUMENT)
+        for backend in jsonbackend.getAvailable():
+            jsonbackend.configure(backend)
+            self.assertEquals(backend, jsonbackend.getBackend())
+            self.assertEquals(expected, jsonbackend.loads(DOCUMENT))
+            self.assertEquals(expected,
+                              jsonbackend.loads(jsonbackend.dumps(expected)))
+            self.assertTrue(isinstance(jsonbackend.dumps(expected),
+                                       basestring))
+            self.assertRaises(ValueError, jsonbackend.loads, '{"a":')
+
+    def testBytesDecoded(self):
+        """Test that a backend returning bytes from dumps() is decoded"""
+        with mock.patch.dict(sys.modules, {'orjson': getFakeOrjson()}):
+            jsonbackend.configure('orjson')
+        self.assertEquals('orjson', jsonbackend.getBackend())
+        self.assertEquals(u'[1]', jsonbackend.dumps([1]))
+        self.assertTrue(isinstance(jsonbackend.dumps([1]), unicode))
+
+    def testParser(self):
+        """Test that JSON bodies are parsed with the configured backend"""
+        loads = mock.Mock(return_value={'parsed': True})
+        with mock.patch.dict(jsonbackend._functions, {'loads': loads}):
+            self.assertEquals({'parsed': True}, parsers.parseJSON('{}'))
+        loads.assert_called_once_with('{}')
+        self.assertRaises(parsers.ParseError, parsers.parseJSON, '{"a":')
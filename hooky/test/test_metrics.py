@@ -0,0 +1,113 @@
+from tornado.testing import unittest
+
+from hooky import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        """Create a fresh Registry for each test"""
+        self.registry = metrics.Registry()
+
+    def testCounter(self):
+        """Test an unlabelled Counter"""
+        counter = self.registry.register(metrics.Counter('c', 'help'))
+        counter.inc()
+        counter.inc(2)
+        self.assertEquals(3, counter.value)
+        self.assertEquals([((), counter.labels())], counter.children())
+
+    def testGauge(self):
+        """Test a Gauge"""
+        gauge = self.registry.register(metrics.Gauge('g', 'help'))
+        gauge.inc(5)
+        gauge.dec()
+        self.assertEquals(4, gauge.value)
+        gauge.set(10)
+        self.assertEquals(10, gauge.value)
+
+    def testSummary(self):
+        """Test a Summary"""
+        summary = self.registry.register(metrics.Summary('s', 'help'))
+        summary.observe(1)
+        summary.observe(3)
+        self.assertEquals(2, summary.count)
+        self.assertEquals(4, summary.sum)
+        self.assertEquals(3, summary.max)
+
+    def testHistogram(self):
+        """Test that a Histogram counts observations into its buckets"""
+        histogram = self.registry.register(
+            metrics.Histogram('h', 'help', buckets=(1, 0.1)))
+        self.assertEquals((0.1, 1), histogram.buckets)
+
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value)
+        self.assertEquals(4, histogram.count)
+        self.assertEquals(5.65, histogram.sum)
+        self.assertEquals([(0.1, 2), (1, 3), (metrics.INF, 4)],
+                          histogram.cumulative())
+
+        # Each label set gets a histogram of its own, with the same buckets
+        labelled = self.registry.register(
+            metrics.Histogram('l', 'help', labels=('hook',)))
+        self.assertEquals(metrics.DEFAULT_BUCKETS,
+                          labelled.labels('a').buckets)
+
+        self.assertRaises(ValueError, self.registry.register,
+                          metrics.Histogram('h', 'help', buckets=(2,)))
+
+    def testLabels(self):
+        """Test that labelled metrics keep one value per label set"""
+        counter = self.registry.register(
+            metrics.Counter('c', 'help', labels=('hook',)))
+        counter.labels('a').inc()
+        counter.labels('a').inc()
+        counter.labels('b').inc()
+        self.assertEquals(2, counter.labels('a').value)
+        self.assertEquals(1, counter.labels('b').value)
+
+        # Labelled metrics have no single value, and need every label
+        self.assertRaises(AttributeError, getattr, counter, 'inc')
+        self.assertRaises(ValueError, counter.labels, 'a', 'b')
+
+    def testRegister(self):
+        """Test that registering a metric twice returns the original"""
+        first = self.registry.register(metrics.Counter('c', 'help'))
+        second = self.registry.register(metrics.Counter('c', 'help'))
+        self.assertTrue(first is second)
+        self.assertEquals([first], self.registry.collect())
+        self.assertEquals(first, self.registry.get('c'))
+
+        self.assertRaises(ValueError, self.registry.register,
+                          metrics.Gauge('c', 'help'))
+
+    def testExpose(self):
+        """Test that metrics are rendered in the Prometheus text format"""
+        counter = self.registry.register(
+            metrics.Counter('c_total', 'A "counter"', labels=('hook',)))
+        counter.labels('a"b').inc()
+        self.registry.register(metrics.Gauge('g', 'A gauge')).set(2)
+        self.registry.register(metrics.Summary('s', 'A summary')).observe(3)
+        self.registry.register(
+            metrics.Histogram('h', 'A histogram', buckets=(1,))).observe(0.5)
+
+        self.assertEquals(
+            '# HELP c_total A "counter"\n'
+            '# TYPE c_total counter\n'
+            'c_total{hook="a\\"b"} 1\n'
+            '# HELP g A gauge\n'
+            '# TYPE g gauge\n'
+            'g 2\n'
+            '# HELP s A summary\n'
+            '# TYPE s summary\n'
+            's_count 1\n'
+            's_sum 3.0\n'
+            '# HELP s_max Largest value of s\n'
+            '# TYPE s_max gauge\n'
+            's_max 3\n'
+            '# HELP h A histogram\n'
+            '# TYPE h histogram\n'
+            'h_bucket{le="1"} 1\n'
+            'h_bucket{le="+Inf"} 1\n'
+            'h_count 1\n'
+            'h_sum 0.5\n', metrics.expose(self.registry))
@@ -0,0 +1,112 @@
+import time
+
+import mock
+from tornado import testing
+
+from hooky import monitor
+
+
+class TestLagMonitor(testing.AsyncTestCase):
+    def testLag(self):
+        """Test that a blocked IOLoop shows up as lag"""
+        lag = monitor.IOLOOP_LAG
+        count, total = lag.count, lag.sum
+
+        lag_monitor = monitor.LagMonitor(0.01, io_loop=self.io_loop)
+        lag_monitor.start()
+        self.addCleanup(lag_monitor.stop)
+
+        # Hold the IOLoop up for a while, then let it run a few timers
+        self.io_loop.add_callback(time.sleep, 0.1)
+        self.io_loop.add_timeout(time.time() + 0.2, self.stop)
+        self.wait()
+
+        self.assertGreater(lag.count - count, 2)
+        self.assertGreater(lag.sum - total, 0.05)
+
+    def testDisabled(self):
+        """Test that an interval of 0 disables the monitor"""
+        lag_monitor = monitor.LagMonitor(0, io_loop=self.io_loop)
+        lag_monitor.start()
+        self.assertEquals(None, lag_monitor._timeout)
+
+    def testWindow(self):
+        """Test that only the last window of measurements is kept"""
+        lag_monitor = monitor.LagMonitor(0.5, window=2, io_loop=self.io_loop)
+        self.assertEquals(4, lag_monitor.recent.maxlen)
+
+        for lag in (5, 1, 2, 3, 4):
+            lag_monitor._expected = self.io_loop.time() - lag
+            lag_monitor._check()
+        lag_monitor.stop()
+
+        self.assertEquals(4, len(lag_monitor.recent))
+        percentiles = lag_monitor.getPercentiles()
+        self.assertAlmostEquals(4, percentiles[1.0], places=1)
+        self.assertAlmostEquals(
+            percentiles[0.99],
+            monitor.IOLOOP_LAG_WINDOW.labels('0.99').value)
+
+    def testGetPercentiles(self):
+        """Test the nearest rank percentiles of a list"""
+        self.assertEquals({}, monitor.getPercentiles([]))
+        self.assertEquals({0.5: 7, 1.0: 7},
+                          monitor.getPercentiles([7], (0.5, 1.0)))
+        self.assertEquals({0.5: 51, 0.9: 90, 0.99: 99, 1.0: 100},
+                          monitor.getPercentiles(range(100, 0, -1)))
+
+
+def spin(seconds):
+    """Blocks the IOLoop without sleeping, which signals would cut short"""
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+class TestSlowCallbackMonitor(testing.AsyncTestCase):
+    def testActivity(self):
+        """Test that an activity follows the callbacks it schedules"""
+        seen = []
+
+        def record():
+            seen.append(monitor.getActivity())
+            self.stop()
+
+        with monitor.activity('hook', 'tr'):
+            self.assertEquals(('hook', 'tr'), monitor.getActivity())
+            self.io_loop.add_callback(record)
+        self.assertEquals((None, None), monitor.getActivity())
+
+        self.wait()
+        self.assertEquals([('hook', 'tr')], seen)
+
+    def testSlowCallback(self):
+        """Test that a blocked IOLoop is blamed on the running activity"""
+        slow = monitor.SLOW_CALLBACKS.labels('hook', 'tr')
+        count = slow.value
+
+        slow_monitor = monitor.SlowCallbackMonitor(0.02, io_loop=self.io_loop)
+        slow_monitor.start()
+        self.addCleanup(slow_monitor.stop)
+
+        # The alarm is only armed once the IOLoop has polled, so give it a
+        # chance to before blocking it
+        with monitor.activity('hook', 'tr'):
+            self.io_loop.add_timeout(time.time() + 0.01,
+                                     lambda: spin(0.1))
+        self.io_loop.add_timeout(time.time() + 0.2, self.stop)
+
+        with mock.patch.object(monitor.log, 'warning') as warning:
+            self.wait()
+
+        self.assertEquals(count + 1, slow.value)
+        message = warning.call_args[0][0]
+        self.assertIn('hook: hook, translator: tr', message)
+        self.assertIn('in spin', message)
+
+    def testDisabled(self):
+        """Test that a threshold of 0 disables the monitor"""
+        slow_monitor = monitor.SlowCallbackMonitor(0, io_loop=self.io_loop)
+        slow_monitor.start()
+        self.assertFalse(slow_monitor.running)
+        self.assertEquals(None, self.io_loop._blocking_signal_threshold)
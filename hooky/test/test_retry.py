@@ -0,0 +1,76 @@
+import mock
+
+from tornado import testing
+
+from hooky import retry
+
+
+class TestBackoff(testing.unittest.TestCase):
+    def testBackoff(self):
+        """Test that the delay doubles each attempt, up to the cap"""
+        self.assertEquals(0.5, retry.backoff(1, 0.5, 10, jitter=0))
+        self.assertEquals(1.0, retry.backoff(2, 0.5, 10, jitter=0))
+        self.assertEquals(4.0, retry.backoff(4, 0.5, 10, jitter=0))
+        self.assertEquals(10.0, retry.backoff(10, 0.5, 10, jitter=0))
+
+    def testJitter(self):
+        """Test that jitter takes a random fraction off of the delay"""
+        with mock.patch('random.random', return_value=0.5):
+            self.assertEquals(2.0, retry.backoff(3, 1, 60, jitter=1.0))
+            self.assertEquals(3.0, retry.backoff(3, 1, 60, jitter=0.5))
+
+
+class TestRetryScheduler(testing.AsyncTestCase):
+    def setUp(self):
+        super(TestRetryScheduler, self).setUp()
+        self.scheduler = retry.RetryScheduler(io_loop=self.io_loop)
+        self.calls = []
+
+    def _call(self, name):
+        return lambda: self.calls.append(name)
+
+    def testSchedule(self):
+        """Test that callbacks run in deadline order"""
+        self.scheduler.schedule(0.03, self._call('c'))
+        self.scheduler.schedule(0.01, self._call('a'))
+        self.scheduler.schedule(0.02, self._call('b'))
+        self.scheduler.schedule(0.04, self.stop)
+        self.assertEquals(4, len(self.scheduler))
+
+        self.wait()
+        self.assertEquals(['a', 'b', 'c'], self.calls)
+        self.assertEquals(0, len(self.scheduler))
+
+    def testSingleTimeout(self):
+        """Test that only one IOLoop timeout is used for many retries"""
+        with mock.patch.object(self.io_loop, 'add_timeout',
+                               wraps=self.io_loop.add_timeout) as add:
+            for i in xrange(100):
+                self.scheduler.schedule(0.01 + i / 10000.0, self._call(i))
+            self.assertEquals(1, add.call_count)
+
+        self.scheduler.schedule(0.05, self.stop)
+        self.wait()
+        self.assertEquals(range(100), self.calls)
+
+    def testCancel(self):
+        """Test that cancelled callbacks never run"""
+        handle = self.scheduler.schedule(0.01, self._call('a'))
+        self.scheduler.schedule(0.02, self._call('b'))
+        self.scheduler.cancel(handle)
+        self.assertEquals(1, len(self.scheduler))
+
+        self.scheduler.schedule(0.03, self.stop)
+        self.wait()
+        self.assertEquals(['b'], self.calls)
+
+    def testBrokenCallback(self):
+        """Test that an exception doesn't stop other callbacks from running"""
+        def broken():
+            raise Exception('Broken')
+
+        self.scheduler.schedule(0.01, broken)
+        self.scheduler.schedule(0.01, self._call('a'))
+        self.scheduler.schedule(0.02, self.stop)
+        self.wait()
+        self.assertEquals(['a'], self.calls)
@@ -0,0 +1,98 @@
+import mock
+from tornado import gen
+from tornado import httpclient
+from tornado import testing
+
+from hooky import delivery
+from hooky import shutdown
+from hooky.test import helpers
+from hooky.translators import context
+
+
+class SlowTranslator(object):
+    """Translator that takes a while to finish"""
+    reentrant = True
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.finished = 0
+
+    @gen.coroutine
+    def submit(self, request):
+        yield gen.Task(self.io_loop.add_timeout, self.io_loop.time() +
+                       self.delay)
+        self.finished += 1
+        raise gen.Return({'success': True, 'message': 'OK'})
+
+
+class TestTracker(testing.AsyncTestCase):
+    def testTracker(self):
+        """Test that wait() resolves once every request has finished"""
+        tracker = shutdown.Tracker()
+        self.assertTrue(tracker.wait().done())
+
+        tracker.start()
+        tracker.start()
+        waiting = tracker.wait()
+        self.assertEquals(2, len(tracker))
+
+        tracker.finish()
+        self.assertFalse(waiting.done())
+        tracker.finish()
+        self.assertTrue(waiting.done())
+
+
+class TestGracefulShutdown(testing.AsyncTestCase):
+    def setUp(self):
+        super(TestGracefulShutdown, self).setUp()
+        self.server = mock.MagicMock()
+        self.tracker = shutdown.Tracker()
+        self.queue = delivery.DeliveryQueue(io_loop=self.io_loop)
+        self.request = context.RequestContext(
+            httpclient.HTTPRequest('/', body='{}'))
+
+    def _shutdown(self, timeout):
+        """Returns the GracefulShutdown, and the Future from shutdown()"""
+        graceful = shutdown.GracefulShutdown(
+            self.server, self.tracker, self.queue, timeout=timeout,
+            io_loop=self.io_loop)
+        return graceful, graceful.shutdown()
+
+    @testing.gen_test
+    def testShutdown(self):
+        """Test that requests and deliveries are finished before stopping"""
+        translator = SlowTranslator(0.1)
+        translator.io_loop = self.io_loop
+        self.queue.put(helpers.getRoute([translator]), self.request)
+        self.tracker.start()
+
+        with mock.patch.object(self.io_loop, 'stop') as stop:
+            with mock.patch('logging.shutdown'):
+                graceful, future = self._shutdown(timeout=5)
+                self.assertTrue(self.server.stop.called)
+                self.assertTrue(self.tracker.closing)
+
+                self.io_loop.add_callback(self.tracker.finish)
+                drained = yield future
+
+                self.assertTrue(drained)
+                self.assertEquals(1, translator.finished)
+                self.assertTrue(stop.called)
+
+    @testing.gen_test
+    def testShutdownTimeout(self):
+        """Test that we stop anyway once the timeout has passed"""
+        self.tracker.start()
+
+        with mock.patch.object(self.io_loop, 'stop') as stop:
+            with mock.patch('logging.shutdown'):
+                graceful, future = self._shutdown(timeout=0.1)
+                drained = yield future
+
+                self.assertFalse(drained)
+                self.assertTrue(stop.called)
+
+        # A second signal doesn't start another shutdown
+        self.server.reset_mock()
+        graceful.shutdown()
+        self.assertFalse(self.server.stop.called)
@@ -0,0 +1,148 @@
+import os
+import signal
+
+import mock
+from tornado import process
+from tornado.testing import unittest
+
+from hooky import supervisor
+
+
+class TestSupervisor(unittest.TestCase):
+    def setUp(self):
+        # Don't install our handlers in the test runner
+        patcher = mock.patch.object(supervisor.signal, 'signal')
+        self.signal = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testGetProcessCount(self):
+        """Test that 0 processes means one per CPU"""
+        self.assertEquals(3, supervisor.getProcessCount(3))
+        self.assertEquals(3, supervisor.getProcessCount('3'))
+        self.assertEquals(process.cpu_count(),
+                          supervisor.getProcessCount(0))
+
+    @mock.patch.object(supervisor.os, 'fork')
+    def testStartInWorker(self, fork):
+        """Test that start() returns the task id in the workers"""
+        fork.side_effect = [100, 0]
+        s = supervisor.Supervisor(3)
+        self.assertEquals(1, s.start())
+
+        # Workers stop on the default handlers, but ignore SIGHUP until the
+        # config reloader is set up
+        self.assertEquals(
+            [mock.call(signal.SIGTERM, signal.SIG_DFL),
+             mock.call(signal.SIGINT, signal.SIG_DFL),
+             mock.call(signal.SIGHUP, signal.SIG_IGN)],
+            self.signal.call_args_list[-3:])
+        self.assertEquals({}, s.children)
+
+    @mock.patch.object(supervisor, 'MIN_UPTIME', 0)
+    @mock.patch.object(supervisor.os, 'wait')
+    @mock.patch.object(supervisor.os, 'fork')
+    def testRestart(self, fork, wait):
+        """Test that a crashed worker is replaced, keeping its task id"""
+        fork.side_effect = [100, 101, 0]
+        wait.side_effect = [(101, 256)]
+        s = supervisor.Supervisor(2)
+        self.assertEquals(1, s.start())
+        self.assertEquals(1, s.restarts)
+
+    @mock.patch.object(supervisor.os, 'kill')
+    @mock.patch.object(supervisor.os, 'wait')
+    @mock.patch.object(supervisor.os, 'fork')
+    def testStopDuringRestartDelay(self, fork, wait, kill):
+        """Test that a worker isn't restarted once we're stopping"""
+        fork.side_effect = [100, 101]
+        wait.side_effect = [(101, 256), (100, 15)]
+        s = supervisor.Supervisor(2)
+
+        # The SIGTERM arrives while we wait to restart the crashed worker
+        def sleep(seconds):
+            s._handleSignal(signal.SIGTERM, None)
+
+        with mock.patch.object(supervisor.time, 'sleep', sleep):
+            self.assertRaises(SystemExit, s.start)
+
+        self.assertEquals(2, fork.call_count)
+        kill.assert_called_once_with(100, signal.SIGTERM)
+
+    def testHandlersBeforeFork(self):
+        """Test that our handlers are installed before any worker starts"""
+        calls = []
+        supervisor.signal.signal.side_effect = \
+            lambda signum, handler: calls.append('signal')
+
+        def fork():
+            calls.append('fork')
+            return 0
+
+        with mock.patch.object(supervisor.os, 'fork', fork):
+            self.assertEquals(0, supervisor.Supervisor(2).start())
+        self.assertEquals('signal', calls[0])
+        self.assertEquals(['fork'], [c for c in calls if c == 'fork'])
+
+    @mock.patch.object(supervisor.os, 'wait')
+    @mock.patch.object(supervisor.os, 'fork')
+    def testCleanExit(self, fork, wait):
+        """Test that workers that exit cleanly are not replaced"""
+        fork.side_effect = [100, 101]
+        wait.side_effect = [(100, 0), (101, 0)]
+        s = supervisor.Supervisor(2)
+        self.assertRaises(SystemExit, s.start)
+        self.assertEquals(0, s.restarts)
+
+    @mock.patch.object(supervisor.os, 'kill')
+    @mock.patch.object(supervisor.os, 'wait')
+    @mock.patch.object(supervisor.os, 'fork')
+    def testMaxRestarts(self, fork, wait, kill):
+        """Test that we give up after max_restarts crashes"""
+        fork.side_effect = [100, 101, 102]
+        wait.side_effect = [(100, 256), (102, 9), (101, 0)]
+        s = supervisor.Supervisor(2, max_restarts=1)
+        with mock.patch.object(supervisor, 'MIN_UPTIME', 0):
+            self.assertRaises(SystemExit, s.start)
+
+        self.assertEquals(1, s.restarts)
+        self.assertTrue(s.stopping)
+        kill.assert_called_once_with(101, signal.SIGTERM)
+
+    @mock.patch.object(supervisor.os, 'kill')
+    def testSignals(self, kill):
+        """Test that signals are passed on to every worker"""
+        s = supervisor.Supervisor(2)
+        s.children = {100: (0, 0), 101: (1, 0)}
+
+        s._handleSignal(signal.SIGHUP, None)
+        self.assertEquals(
+            [mock.call(100, signal.SIGHUP), mock.call(101, signal.SIGHUP)],
+            sorted(kill.call_args_list))
+        self.assertFalse(s.stopping)
+
+        kill.reset_mock()
+        s._handleSignal(signal.SIGTERM, None)
+        self.assertEquals(2, kill.call_count)
+        self.assertTrue(s.stopping)
+
+        # Workers exiting after a SIGTERM are not replaced
+        self.assertFalse(s._shouldRestart(100, 0, signal.SIGTERM))
+
+    def testFork(self):
+        """Test that real worker processes are started and reaped"""
+        r, w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Runs the supervisor, and its workers, away from the test runner
+            try:
+                os.close(r)
+                task_id = supervisor.Supervisor(3).start()
+                os.write(w, str(task_id))
+            finally:
+                os._exit(0)
+
+        os.close(w)
+        self.assertEquals(0, os.waitpid(pid, 0)[1])
+        output = os.read(r, 100)
+        os.close(r)
+        self.assertEquals(['0', '1', '2'], sorted(output))
@@ -1,6 +1,7 @@
 import os
 import logging
 
+import mock
 from tornado import testing
 from tornado.testing import unittest
 
@@ -14,6 +15,31 @@ class TestUtils(unittest.TestCase):
         returned_class = utils.strToClass(class_string_name)
         self.assertEquals(testing.AsyncTestCase, returned_class)
 
+    def testStrToClassCache(self):
+        """Test that strToClass() caches its results until cleared"""
+        class_string_name = 'tornado.testing.AsyncTestCase'
+        utils.strToClass(class_string_name)
+        self.assertIn(class_string_name, utils._classes)
+
+        utils.clearClassCache()
+        self.assertEquals({}, utils._classes)
+
+    def testStrToClassCacheHit(self):
+        """A cached strToClass() call must not import the module again"""
+        class_string_name = 'tornado.testing.AsyncTestCase'
+        utils.clearClassCache()
+
+        with mock.patch('__builtin__.__import__',
+                        side_effect=__import__) as importer:
+            first = utils.strToClass(class_string_name)
+            self.assertEquals(1, importer.call_count)
+
+            second = utils.strToClass(class_string_name)
+            self.assertEquals(1, importer.call_count)
+
+        self.assertIs(testing.AsyncTestCase, first)
+        self.assertIs(first, second)
+
     def testGetRootPath(self):
         """Test the getRootPath() method"""
         path = utils.getRootPath()
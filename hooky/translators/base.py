@@ -12,17 +12,22 @@
 #
 # Copyright 2013 Nextdoor.com, Inc
 
-import json
 import logging
+import time
 
 from tornado import gen
 
-from xml.parsers.expat import ExpatError
-import pystache
-import xmltodict
+from hooky import executor
+from hooky import metrics
+from hooky.translators import context
+from hooky.translators import templates
 
 log = logging.getLogger(__name__)
 
+RENDER_SECONDS = metrics.histogram(
+    'hooky_render_seconds', 'Time taken to render templates, per hook and '
+    'translator class', labels=('hook', 'translator'))
+
 
 class RequestException(Exception):
     """Raised when the supplied webhook http request is invalid"""
@@ -41,8 +46,17 @@ class BaseTranslator(object):
 
     A single call to the submit() method yields a generator that allows the
     Tornado IOLoop to continue operating on other requests.
+
+    Translators that keep no per-request state on the object (everything
+    set in __init__() is only read from in submit()) should set 'reentrant'
+    to True. Hooky will then build a single instance per translator
+    definition and share it across all concurrent requests, rather than
+    building a new object for every inbound webhook.
     """
 
+    # Whether or not a single instance may safely serve many requests at once
+    reentrant = False
+
     def submit(self, request):
         """Generator that translates an HTTPRequest into an outbound hook.
 
@@ -57,7 +71,8 @@ class BaseTranslator(object):
         to the caller.
 
         args:
-            request: tornado.httpclient.HTTPRequest object
+            request: tornado.httpclient.HTTPRequest object, or a
+                     hooky.translators.context.RequestContext wrapping one
         """
         raise NotImplementedError('Not implemented. Use one of my subclasses.')
 
@@ -65,52 +80,89 @@ class BaseTranslator(object):
         """Translates supplied HTTPRequest into a dictionary.
 
         Walks through the supplied HTTPRequest object and tries to translate it
-        into a dictionary. Supports inbound XML and JSON inside the reques
-        POST body, or key=value pairs as GET arguments.
+        into a dictionary. Supports inbound XML, JSON and form-encoded data
+        inside the reques POST body, or key=value pairs as GET arguments. See
+        hooky.translators.parsers for how the body parser is picked.
+
+        When handed a RequestContext, the body is only parsed if no other
+        Translator has already done so for this request.
 
         args:
-            request: tornado.httpclient.HTTPRequest object
+            request: tornado.httpclient.HTTPRequest object, or a
+                     hooky.translators.context.RequestContext object
 
         returns:
-            data: A dictionary of data
+            data: A dictionary of data. This may be shared with other
+                  Translators, so it must not be modified.
 
         raises:
             RequestException: If the content cannot be converted into a dict
         """
-        # Begin a dictionary of content with the request parameters themselves.
-        content = {}
-        content['request'] = request.__dict__
-
-        # Append the headers as well
-        content['headers'] = getattr(request, 'headers', None)
-
-        # Now convert the arguments
-        content['arguments'] = getattr(request, 'arguments', None)
-
-        # See if the data is JSON
-        try:
-            log.debug('Attempting to parse supplied body as JSON')
-            data = json.loads(request.body)
-        except (ValueError, TypeError):
-            log.debug('Content is not JSON...')
-            pass
-        else:
-            log.debug('Content is JSON...')
-            content['body'] = data
-
-        # See if the data is XML
-        try:
-            log.debug('Attempting to parse supplied body as XML')
-            data = xmltodict.parse(request.body)
-        except (ExpatError, TypeError):
-            log.debug('Content is not XML...')
-            pass
-        else:
-            log.debug('Content is XML...')
-            content['body'] = data
-
-        # Lastly, return the content object
-        return content
+        # The parsing work is done (once) by the RequestContext, and shared
+        # with any other Translator handed the same context.
+        return context.getContext(request).toDict()
+
+    @gen.coroutine
+    def _loadData(self, request, tree=None):
+        """Translates supplied HTTPRequest into a dictionary, asynchronously.
+
+        Works like _request_to_dict(), except that a body large enough to be
+        offloaded (see hooky.executor) is parsed off the IOLoop first. With a
+        tree, only the paths in it are parsed there.
+
+        args:
+            request: tornado.httpclient.HTTPRequest object, or a
+                     hooky.translators.context.RequestContext object
+            tree: A hooky.translators.extract.PathTree of the only parts of
+                  the body needed (def: None, the whole body)
+
+        returns:
+            data: See _request_to_dict()
+        """
+        request = context.getContext(request)
+        if executor.willOffload(_getSize(request)):
+            if tree is not None:
+                yield request.extractBody(tree)
+            else:
+                yield request.parseBody()
+
+        raise gen.Return(request.toDict(tree))
+
+    @gen.coroutine
+    def _render(self, template, data, request):
+        """Renders a template, off the IOLoop if the request is large enough.
+
+        args:
+            template: A template string, or a compiled template from
+                      hooky.translators.templates.parse()
+            data: The dictionary returned by _loadData()
+            request: The request the data came from
+
+        returns:
+            The rendered unicode string
+        """
+        size = _getSize(request)
+        latency = RENDER_SECONDS.labels(getattr(request, 'hook', ''),
+                                        self.__class__.__name__)
+        start = time.time()
+
+        # The template data holds the request itself, so can't be pickled
+        if not executor.willOffload(size, picklable=False):
+            content = templates.render(template, data)
+            latency.observe(time.time() - start)
+            raise gen.Return(content)
+
+        # Compile the template and fill in the rest of the data here, so
+        # that the worker thread only ever reads from them.
+        if isinstance(template, basestring):
+            template = templates.parse(template)
+        if isinstance(data, context.LazyDict):
+            data.load()
+
+        content = yield executor.run(size, templates.render, template, data,
+                                     picklable=False)
+        latency.observe(time.time() - start)
+        raise gen.Return(content)
 
 
 class TestTranslator(BaseTranslator):
@@ -122,6 +174,8 @@ class TestTranslator(BaseTranslator):
     a user create new webhook translations.
     """
 
+    reentrant = True
+
     def __init__(self):
         """Initiates the object and sanity checks the config. """
         log.debug('Initializing TestTranslator object...')
@@ -140,14 +194,15 @@ class TestTranslator(BaseTranslator):
         log.debug('%s beginning...' % self)
 
         # Parse the incoming data into a dict that we can handle
-        data = self._request_to_dict(request)
+        data = yield self._loadData(request)
 
         # Now that we have the dict, create a dynamic template that lists
         # all of the keys in that dict.
         template = self._createTemplate(data)
 
-        # Generate our parsed template now
-        content = pystache.render(template, data)
+        # Generate our parsed template now. Payloads with the same shape
+        # produce the same template, so these are cached too.
+        content = yield self._render(template, data, request)
 
         # return the template
         response = ({'success': True, 'message': content})
@@ -191,3 +246,8 @@ class TestTranslator(BaseTranslator):
             string = "%s\n%s" % (string, line)
 
         return string
+
+
+def _getSize(request):
+    """Returns the size of a request body in bytes"""
+    return len(getattr(request, 'body', None) or '')
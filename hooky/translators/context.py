@@ -0,0 +1,367 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc
+
+"""
+Per-request context shared by every Translator of a hook.
+
+A single RequestContext is built by the HookHandler for each inbound request
+and handed to all of the Translators configured for that hook. Body parsing
+and building the template data happen the first time a Translator asks for
+them, and the results are reused by every other Translator.
+
+The template data itself is a LazyDict, so the 'request', 'headers',
+'arguments' and 'body' sections are only built if a template looks them up.
+Large bodies can be parsed off the IOLoop ahead of time with parseBody().
+
+Translators whose template only uses a few paths of the body can ask for
+just those to be parsed, by passing a hooky.translators.extract.PathTree to
+toDict(). Once anything has parsed the whole body though, everyone gets it.
+Those paths of a large body can be parsed off the IOLoop with extractBody().
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import functools
+import logging
+import time
+
+from tornado import gen
+
+from hooky import executor
+from hooky import metrics
+from hooky.translators import extract
+from hooky.translators import parsers
+
+log = logging.getLogger(__name__)
+
+PARSE_SECONDS = metrics.histogram(
+    'hooky_parse_seconds', 'Time taken to parse request bodies, per hook',
+    labels=('hook',))
+EXTRACT_SECONDS = metrics.histogram(
+    'hooky_extract_seconds',
+    'Time taken to parse just the parts of request bodies templates use, '
+    'per hook', labels=('hook',))
+
+
+class RequestContext(object):
+    """A read-only, lazily populated wrapper around an inbound HTTPRequest.
+
+    Any attribute that is not defined here (body, headers, arguments, uri,
+    etc.) is read straight from the wrapped request, so Translators that
+    only know about HTTPRequest objects keep working when handed a
+    RequestContext instead.
+
+    The data returned by this object is shared between Translators and
+    must not be modified.
+    """
+
+    def __init__(self, request, hook='', parsed=None):
+        """Wraps the supplied request.
+
+        args:
+            request: tornado HTTPRequest object
+            hook: Name of the hook the request is for, used to label metrics
+            parsed: The parsed body, if it was already parsed as it arrived
+                    (def: None, parse it when it is first needed)
+        """
+        object.__setattr__(self, 'request', request)
+        object.__setattr__(self, 'hook', hook)
+        object.__setattr__(self, '_cache', {})
+        if parsed is not None:
+            self._cache['body'] = parsed
+
+    def __getattr__(self, name):
+        # Only called for attributes we don't have. Guard our own ones so
+        # that a half-built object (eg. during copy) can't recurse forever.
+        if name in ('request', 'hook', '_cache'):
+            raise AttributeError(name)
+        return getattr(self.request, name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('RequestContext objects are read-only')
+
+    def getParsedBody(self, tree=None):
+        """Returns the parsed request body.
+
+        The body is parsed on the first call only.
+
+        args:
+            tree: A hooky.translators.extract.PathTree. If supplied, only the
+                  paths in it are parsed, unless the whole body already has
+                  been (or can't be parsed that way).
+
+        returns:
+            The parsed body data, or None if the body could not be parsed
+        """
+        try:
+            return self._cache['body']
+        except KeyError:
+            pass
+
+        if tree is not None:
+            return self._getExtractedBody(tree)
+
+        start = time.time()
+        body = parsers.parse(*self._getParseArgs())
+        PARSE_SECONDS.labels(self.hook).observe(time.time() - start)
+
+        self._cache['body'] = body
+        return body
+
+    def parseBody(self):
+        """Parses the request body, off the IOLoop if it is large enough.
+
+        See hooky.executor. Every caller shares the one parse, and once it
+        is done getParsedBody() returns its result.
+
+        returns:
+            A Future that resolves to the parsed body data, or None
+        """
+        try:
+            return self._cache['parsing']
+        except KeyError:
+            pass
+
+        if 'body' in self._cache:
+            future = executor.run(0, self.getParsedBody)
+        else:
+            args = self._getParseArgs()
+            future = executor.run(len(args[0] or ''), parsers.parse, *args)
+            future.add_done_callback(functools.partial(self._parsed,
+                                                       time.time()))
+
+        self._cache['parsing'] = future
+        return future
+
+    def _parsed(self, start, future):
+        PARSE_SECONDS.labels(self.hook).observe(time.time() - start)
+
+        # A parse that failed outright is left for getParsedBody() to retry
+        if future.exception() is None:
+            self._cache.setdefault('body', future.result())
+
+    def extractBody(self, tree):
+        """Parses the paths of the body in a tree, off the IOLoop if needed.
+
+        Like parseBody(), but only the paths in the tree are parsed (see
+        getParsedBody()). Once it is done, getParsedBody(tree) returns its
+        result.
+
+        args:
+            tree: A hooky.translators.extract.PathTree
+
+        returns:
+            A Future that resolves to the parsed body data, or None
+        """
+        key = ('extracting', tree)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+
+        if 'body' in self._cache or ('body', tree) in self._cache:
+            future = executor.run(0, self.getParsedBody, tree)
+        else:
+            future = self._extract(tree)
+
+        self._cache[key] = future
+        return future
+
+    @gen.coroutine
+    def _extract(self, tree):
+        """Runs tree.extract() through the executor, for extractBody()"""
+        args = self._getParseArgs()
+        start = time.time()
+        body = yield executor.run(len(args[0] or ''), extract.extractBody,
+                                  tree.root, *args)
+        if body is extract.NOT_SUPPORTED:
+            body = yield self.parseBody()
+            raise gen.Return(body)
+
+        EXTRACT_SECONDS.labels(self.hook).observe(time.time() - start)
+        self._cache.setdefault(('body', tree), body)
+        raise gen.Return(body)
+
+    def _getExtractedBody(self, tree):
+        """Returns the paths of the body in a PathTree, parsing them once"""
+        key = ('body', tree)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+
+        start = time.time()
+        body = tree.extract(*self._getParseArgs())
+        if body is extract.NOT_SUPPORTED:
+            return self.getParsedBody()
+        EXTRACT_SECONDS.labels(self.hook).observe(time.time() - start)
+
+        self._cache[key] = body
+        return body
+
+    def _getParseArgs(self):
+        """Returns the (body, content_type) to hand to parsers.parse()"""
+        headers = getattr(self.request, 'headers', None) or {}
+        return (getattr(self.request, 'body', None),
+                headers.get('Content-Type'))
+
+    def toDict(self, tree=None):
+        """Returns the request as a dictionary suitable for templating.
+
+        The dictionary is lazy: each of its sections is only built the first
+        time something (usually a template) looks it up. A template that only
+        references {{headers.X}} never causes the body to be parsed.
+
+        args:
+            tree: A hooky.translators.extract.PathTree, to only parse the
+                  parts of the body in it. See getParsedBody().
+
+        returns:
+            A LazyDict object that looks something like:
+                { 'request': { <HTTPRequest attributes> },
+                  'headers': { 'Content-Type': 'application/json', ... },
+                  'arguments': { 'foo': [ 'bar' ] },
+                  'body': { <parsed body> },
+                }
+        """
+        key = 'dict' if tree is None else ('dict', tree)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+
+        content = LazyDict({
+            'request': lambda: self.request.__dict__,
+            'headers': lambda: getattr(self.request, 'headers', None),
+            'arguments': lambda: getattr(self.request, 'arguments', None),
+            # The body is only included if it could actually be parsed
+            'body': lambda: _orAbsent(self.getParsedBody(tree)),
+        })
+
+        self._cache[key] = content
+        return content
+
+
+class LazyDict(dict):
+    """A read-only dict whose values are computed on first access.
+
+    Built with a dictionary of key -> loader functions. A loader is called
+    the first time its key is looked up (or tested for with 'in'), and its
+    result is stored. A loader may return ABSENT to indicate that its key
+    does not exist after all.
+
+    Methods that need every key (items(), keys(), len(), iteration, etc.)
+    load everything first. Note that some C-level code (dict(lazy) on Python
+    2, for instance) reads the underlying dict directly and will only see
+    keys that have already been loaded.
+    """
+
+    def __init__(self, loaders):
+        dict.__init__(self)
+        self._loaders = dict(loaders)
+
+    def __missing__(self, key):
+        try:
+            loader = self._loaders.pop(key)
+        except KeyError:
+            raise KeyError(key)
+
+        value = loader()
+        if value is ABSENT:
+            raise KeyError(key)
+
+        dict.__setitem__(self, key, value)
+        return value
+
+    def __contains__(self, key):
+        if dict.__contains__(self, key):
+            return True
+
+        if key not in self._loaders:
+            return False
+
+        try:
+            self.__missing__(key)
+        except KeyError:
+            return False
+
+        return True
+
+    has_key = __contains__
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def load(self):
+        """Runs all of the remaining loaders."""
+        for key in self._loaders.keys():
+            self.__contains__(key)
+
+    def _loaded(method):
+        """Decorator that loads every key before calling a dict method"""
+        def wrapper(self, *args, **kwargs):
+            self.load()
+            return method(self, *args, **kwargs)
+        wrapper.__name__ = method.__name__
+        return wrapper
+
+    def _readOnly(self, *args, **kwargs):
+        raise TypeError('LazyDict objects are read-only')
+
+    __iter__ = _loaded(dict.__iter__)
+    __len__ = _loaded(dict.__len__)
+    __eq__ = _loaded(dict.__eq__)
+    __ne__ = _loaded(dict.__ne__)
+    __repr__ = _loaded(dict.__repr__)
+    copy = _loaded(dict.copy)
+    items = _loaded(dict.items)
+    iteritems = _loaded(dict.iteritems)
+    iterkeys = _loaded(dict.iterkeys)
+    itervalues = _loaded(dict.itervalues)
+    keys = _loaded(dict.keys)
+    values = _loaded(dict.values)
+
+    __setitem__ = __delitem__ = _readOnly
+    clear = pop = popitem = setdefault = update = _readOnly
+
+    del _loaded
+
+
+# Returned by a LazyDict loader when its key turns out not to exist.
+ABSENT = object()
+
+
+def _orAbsent(value):
+    """Returns ABSENT if value is None, otherwise value"""
+    if value is None:
+        return ABSENT
+    return value
+
+
+def getContext(request):
+    """Returns a RequestContext for the supplied request.
+
+    args:
+        request: A tornado HTTPRequest object or an existing RequestContext
+
+    returns:
+        The supplied RequestContext, or a new one wrapping the request
+    """
+    if isinstance(request, RequestContext):
+        return request
+
+    return RequestContext(request)
@@ -0,0 +1,496 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc
+
+"""
+Parses only the parts of a request body that a template uses.
+
+A template that picks a handful of {{body.x.y}} values out of a big payload
+doesn't need the rest of it turned into Python objects. A PathTree is built
+from a compiled template with getPathTree(), listing every path under
+'body' that the template could look up. The body is then parsed with an
+event based parser that only builds the values on those paths:
+
+    tree = extract.getPathTree(templates.parse(template))
+    data = tree.extract(body, content_type)
+
+The data has the same shape as a full parse: every key along the way is
+present, so sections see the same truthy and falsy values. The values that
+the template never looks at are left as None, rather than being built.
+
+XML is parsed with expat, and JSON with ijson (if it is installed, with the
+yajl2_c backend for preference). Bodies of any other type, or any body that
+fails to parse this way, get a normal full parse instead.
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import decimal
+import logging
+
+from pystache import parser as pystache_parser
+from xml.parsers.expat import ExpatError
+
+from hooky.translators import parsers
+
+try:
+    import ijson
+    try:
+        ijson = ijson.get_backend('yajl2_c')
+    except Exception:
+        pass
+except ImportError:
+    ijson = None
+
+log = logging.getLogger(__name__)
+
+# Top level key of the template data that the body is found under
+ROOT = 'body'
+
+
+class _Marker(object):
+    """A unique marker object, that is still itself once unpickled.
+
+    Trees (and the results of extracting them) are pickled to be sent to a
+    process pool, see hooky.executor. A plain object() would come back as a
+    different object, and fail every 'is' test.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __reduce__(self):
+        # Pickled by reference, as the module global of the same name
+        return self.name
+
+    def __repr__(self):
+        return self.name
+
+
+# Marks a path whose whole value is needed
+ALL = _Marker('ALL')
+
+
+def _nodeType(name):
+    """Returns a pystache parse tree node class, or None if there isn't one.
+
+    pystache has no public API for its parse tree, so these are private
+    names that could change under us. _walk() gives up on (and needs the
+    whole body for) any node it doesn't know.
+    """
+    return getattr(pystache_parser, name, None)
+
+
+_VALUE_NODES = tuple(filter(None, [_nodeType('_EscapeNode'),
+                                   _nodeType('_LiteralNode')]))
+_SECTION_NODE = _nodeType('_SectionNode')
+_INVERTED_NODE = _nodeType('_InvertedNode')
+
+# Nodes that don't look anything up: comments and delimiter changes
+_IGNORED_NODES = tuple(filter(None, [_nodeType('_CommentNode'),
+                                     _nodeType('_ChangeNode')]))
+
+# Whether getPathTree() builds trees at all. See configure().
+_settings = {'enabled': True}
+
+
+def configure(enabled=True):
+    """Turns selective parsing on or off for templates compiled from now on.
+
+    args:
+        enabled: If False, getPathTree() always returns None, so bodies are
+                 always parsed in full
+    """
+    _settings['enabled'] = bool(enabled)
+
+
+def getPaths(template):
+    """Works out which paths under 'body' a compiled template can look up.
+
+    Mustache looks names up through a stack of contexts (one per section
+    it is inside), so a name inside a section is taken to mean the name
+    within each of the sections around it, and at the top level.
+
+    args:
+        template: A pystache ParsedTemplate (see hooky.translators.templates)
+
+    returns:
+        A list of (path, whole) tuples, where path is a tuple of keys under
+        'body', and whole is True if the entire value at the path is needed,
+        or False if it is only tested (as a section). None is returned if the
+        template needs the whole body, or uses partials.
+    """
+    paths = []
+    try:
+        _walk(template, [()], paths)
+    except _WholeBody:
+        return None
+    return paths
+
+
+class _WholeBody(Exception):
+    """Raised by _walk() when the template needs the whole body"""
+
+
+def _walk(template, scopes, paths):
+    """Adds the paths used by each node of a template.
+
+    args:
+        template: A pystache ParsedTemplate
+        scopes: The contexts names are looked up in. () is the top level of
+                the template data, anything else is a path under 'body'.
+        paths: List to add (path, whole) tuples to
+    """
+    for node in template._parse_tree:
+        if isinstance(node, basestring):
+            continue
+
+        if type(node) in _VALUE_NODES:
+            for path in _resolve(node.key, scopes):
+                paths.append((path, True))
+
+        elif type(node) is _SECTION_NODE:
+            inner = _resolve(node.key, scopes)
+            for path in inner:
+                paths.append((path, False))
+            _walk(node.parsed, scopes + inner, paths)
+
+        elif type(node) is _INVERTED_NODE:
+            # Only rendered when the value is falsy, so nothing is pushed
+            for path in _resolve(node.key, scopes):
+                paths.append((path, False))
+            _walk(node.parsed_section, scopes, paths)
+
+        elif type(node) not in _IGNORED_NODES:
+            # Partials, or something this version of pystache added
+            raise _WholeBody()
+
+
+def _resolve(name, scopes):
+    """Returns every path under 'body' that a name could refer to.
+
+    args:
+        name: A (possibly dotted) name from a template
+        scopes: See _walk()
+
+    returns:
+        A list of path tuples
+    """
+    if name == '.':
+        # The innermost context itself
+        scope = scopes[-1]
+        if scope == ():
+            raise _WholeBody()
+        return [scope]
+
+    parts = tuple(name.split('.'))
+    paths = []
+    for scope in scopes:
+        if scope != ():
+            paths.append(scope + parts)
+        elif parts[0] == ROOT:
+            if len(parts) == 1:
+                raise _WholeBody()
+            paths.append(parts[1:])
+    return paths
+
+
+def getPathTree(template):
+    """Returns a PathTree for a compiled template.
+
+    args:
+        template: A pystache ParsedTemplate
+
+    returns:
+        A PathTree, or None if the template needs the whole body (or
+        selective parsing is turned off)
+    """
+    if not _settings['enabled']:
+        return None
+    return buildPathTree(getPaths(template))
+
+
+def buildPathTree(paths):
+    """Returns a PathTree for a list of paths, however they were found.
+
+    args:
+        paths: A list of (path, whole) tuples (see getPaths()), or None if
+               the whole body is needed
+
+    returns:
+        A PathTree, or None if the whole body is needed (or selective
+        parsing is turned off)
+    """
+    if not _settings['enabled'] or paths is None:
+        return None
+    return PathTree(paths)
+
+
+class PathTree(object):
+    """The paths within a body that need to be parsed.
+
+    Each node of the tree is a dict of the keys below it that are needed,
+    or ALL if everything below it is.
+    """
+
+    def __init__(self, paths):
+        """Builds the tree.
+
+        args:
+            paths: A list of (path, whole) tuples. See getPaths().
+        """
+        self.root = {}
+        for path, whole in paths:
+            self.add(path, whole)
+
+    def add(self, path, whole=True):
+        """Adds a path to the tree.
+
+        args:
+            path: Tuple of keys
+            whole: Whether the whole value at the end of the path is needed
+        """
+        if not path:
+            if whole:
+                self.root = ALL
+            return
+
+        node = self.root
+        for key in path[:-1]:
+            if node is ALL:
+                return
+            node = node.setdefault(key, {})
+
+        if node is ALL:
+            return
+        if whole:
+            node[path[-1]] = ALL
+        else:
+            node.setdefault(path[-1], {})
+
+    def extract(self, body, content_type=None):
+        """Parses the parts of a body that are in the tree.
+
+        args:
+            body: The raw body string
+            content_type: Raw Content-Type header value, or None
+
+        returns:
+            The parsed data, or NOT_SUPPORTED if the body can't be parsed
+            this way (so should be parsed in full instead)
+        """
+        return extractBody(self.root, body, content_type)
+
+
+# Returned by PathTree.extract() when a body has to be parsed in full
+NOT_SUPPORTED = _Marker('NOT_SUPPORTED')
+
+
+def extractBody(root, body, content_type=None):
+    """Parses the parts of a body in a tree. See PathTree.extract().
+
+    A plain function, so that it can be handed to hooky.executor.
+
+    args:
+        root: The root node of a PathTree
+        body: The raw body string
+        content_type: Raw Content-Type header value, or None
+
+    returns:
+        The parsed data, or NOT_SUPPORTED
+    """
+    if not body or root is ALL:
+        return NOT_SUPPORTED
+
+    parser = parsers.getParser(content_type)
+    if parser is None or parsers._mimeType(content_type) in \
+            parsers.SNIFFED_TYPES:
+        parser = parsers.sniff(body) or parser
+
+    try:
+        if parser is parsers.parseXML:
+            return extractXML(body, root)
+        if parser is parsers.parseJSON and ijson is not None:
+            return extractJSON(body, root)
+    except parsers.ParseError, e:
+        log.debug('Body could not be parsed selectively: %s' % e)
+
+    return NOT_SUPPORTED
+
+
+class _XMLHandler(object):
+    """Passes expat events on to an XMLDictBuilder, for elements in a tree.
+
+    Elements that are not needed are skipped along with everything inside
+    them, and just recorded as None in their parent, so that the result is
+    shaped like the one parsers.parseXML() would build.
+    """
+
+    def __init__(self, root):
+        self.handler = parsers.XMLDictBuilder()
+        self.nodes = [root]
+        self.skipping = 0
+
+    def startElement(self, name, attrs):
+        if self.skipping:
+            self.skipping += 1
+            return
+
+        node = self.nodes[-1]
+        if node is not ALL:
+            node = node.get(name)
+            if node is None:
+                self.skipping = 1
+                self.handler.skipElement(name)
+                return
+
+        self.nodes.append(node)
+        self.handler.startElement(name, attrs)
+
+    def endElement(self, name):
+        if self.skipping:
+            self.skipping -= 1
+            return
+
+        self.nodes.pop()
+        self.handler.endElement(name)
+
+    def characters(self, data):
+        if not self.skipping:
+            self.handler.characters(data)
+
+
+def extractXML(body, root):
+    """Parses the parts of an XML body in a tree, like parsers.parseXML().
+
+    args:
+        body: The raw XML string
+        root: The root node of a PathTree
+
+    returns:
+        The parsed data
+
+    raises:
+        parsers.ParseError if the body is not valid XML
+    """
+    parser, handler = parsers.XMLDictBuilder.createParser(_XMLHandler(root))
+
+    try:
+        parser.Parse(body, True)
+    except (ExpatError, TypeError), e:
+        raise parsers.ParseError(e)
+    return handler.handler.item
+
+
+def extractJSON(body, root):
+    """Parses the parts of a JSON body in a tree, like parsers.parseJSON().
+
+    Needs the ijson package.
+
+    args:
+        body: The raw JSON string
+        root: The root node of a PathTree
+
+    returns:
+        The parsed data
+
+    raises:
+        parsers.ParseError if the body is not valid JSON
+    """
+    try:
+        return buildJSON(ijson.parse(_StringReader(body)), root)
+    except Exception, e:
+        # Each ijson backend raises its own exceptions
+        raise parsers.ParseError(e)
+
+
+class _StringReader(object):
+    """The read() of a file like object, over a string"""
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def read(self, size=-1):
+        if size < 0:
+            size = len(self.data)
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += len(chunk)
+        return chunk
+
+
+def buildJSON(events, root):
+    """Builds the parts of a JSON document in a tree from ijson events.
+
+    args:
+        events: An iterable of (prefix, event, value) tuples, as returned by
+                ijson.parse()
+        root: The root node of a PathTree
+
+    returns:
+        The parsed data
+    """
+    # (container, tree node) for each open object or array
+    stack = []
+    result = None
+    key = None
+    skipping = 0
+
+    for prefix, event, value in events:
+        if skipping:
+            if event in ('start_map', 'start_array'):
+                skipping += 1
+            elif event in ('end_map', 'end_array'):
+                skipping -= 1
+            continue
+
+        if event == 'map_key':
+            key = value
+            continue
+        if event in ('end_map', 'end_array'):
+            stack.pop()
+            continue
+
+        # Anything else is a value: the document, an array item, or the
+        # value of the last key of an object
+        if not stack:
+            node = root
+        else:
+            container, node = stack[-1]
+            if isinstance(container, dict) and node is not ALL:
+                node = node.get(key)
+                if node is None:
+                    container[key] = None
+                    if event in ('start_map', 'start_array'):
+                        skipping = 1
+                    continue
+
+        if event == 'start_map':
+            value = {}
+        elif event == 'start_array':
+            value = []
+        elif isinstance(value, decimal.Decimal):
+            # json.loads() gives floats, not Decimals
+            value = float(value)
+
+        if not stack:
+            result = value
+        elif isinstance(stack[-1][0], dict):
+            stack[-1][0][key] = value
+        else:
+            stack[-1][0].append(value)
+
+        if event in ('start_map', 'start_array'):
+            stack.append((value, node))
+
+    return result
@@ -0,0 +1,237 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc
+
+"""
+Builds a dict out of request data, from a list of key to path mappings.
+
+A mapping is written one output key per line, as 'key: path|type|default'.
+The type and default are optional:
+
+    id: body.head_commit.id
+    committer.name: body.head_commit.author.name|str|unknown
+    watchers: body.repository.watchers|int|0
+    first_commit: body.commits.0.id
+
+Paths are looked up in the same data a template sees (so they start with
+'body', 'headers', 'arguments' or 'request'), with numbers picking items out
+of lists. Dotted keys build nested objects. If the path is missing, or its
+value can't be converted to the type, the default is used instead (or None
+if there is no default). The types are:
+
+    str, int, float, bool, and any (the default), which leaves the value as
+    it was parsed.
+
+A mapping is compiled once, and then applied to each request:
+
+    extractor = mapping.Mapping(text)
+    result = extractor.apply(data)
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import logging
+
+from hooky.translators import extract
+
+log = logging.getLogger(__name__)
+
+# Strings taken to mean False by the bool type. Anything else non-empty is
+# True.
+FALSE_STRINGS = ('false', 'no', 'off', '0', 'none', 'null')
+
+
+class MappingException(Exception):
+    """Raised when a mapping can't be compiled"""
+
+
+def _toStr(value):
+    if isinstance(value, basestring):
+        return value
+    if isinstance(value, (dict, list)):
+        raise ValueError('Can not convert %s to a string' % type(value))
+    return unicode(value)
+
+
+def _toInt(value):
+    if isinstance(value, basestring):
+        # '10.0' is a perfectly good int for our purposes
+        return int(float(value))
+    return int(value)
+
+
+def _toBool(value):
+    if isinstance(value, basestring):
+        return value.strip().lower() not in FALSE_STRINGS + ('',)
+    return bool(value)
+
+
+TYPES = {
+    'any': lambda value: value,
+    'str': _toStr,
+    'int': _toInt,
+    'float': float,
+    'bool': _toBool,
+}
+
+
+class Field(object):
+    """A single 'key: path|type|default' line of a mapping."""
+
+    def __init__(self, key, path, kind='any', default=None):
+        """Compiles the line.
+
+        args:
+            key: Dotted output key
+            path: Dotted path to look the value up at
+            kind: One of the TYPES
+            default: The default, as a string (def: None, no default)
+
+        raises:
+            MappingException if the type is unknown, or the default can't
+            be converted to it
+        """
+        if kind not in TYPES:
+            raise MappingException('Invalid type "%s" for "%s", must be one '
+                                   'of %s' % (kind, key, sorted(TYPES)))
+
+        self.key = tuple(key.split('.'))
+        self.path = tuple(path.split('.'))
+        self.kind = kind
+        self.convert = TYPES[kind]
+
+        self.default = None
+        if default is not None:
+            try:
+                self.default = self.convert(default)
+            except (ValueError, TypeError), e:
+                raise MappingException('Invalid default for "%s": %s' %
+                                       (key, e))
+
+    def get(self, data):
+        """Looks the value up in some data, and converts it.
+
+        args:
+            data: The template data of a request
+
+        returns:
+            The converted value, or the default
+        """
+        value = data
+        try:
+            for part in self.path:
+                if isinstance(value, list):
+                    part = int(part)
+                value = value[part]
+            if value is None:
+                return self.default
+            return self.convert(value)
+        except (KeyError, IndexError, TypeError, ValueError, OverflowError):
+            return self.default
+
+
+class Mapping(object):
+    """A compiled mapping, which builds a dict out of request data."""
+
+    def __init__(self, text):
+        """Compiles a mapping.
+
+        args:
+            text: The mapping, one 'key: path|type|default' per line. Blank
+                  lines and lines starting with '#' are skipped.
+
+        raises:
+            MappingException if the mapping is empty, or any line of it is
+            invalid
+        """
+        self.fields = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            self.fields.append(self._parseLine(line))
+
+        if not self.fields:
+            raise MappingException('The mapping has no fields')
+
+        # Make sure that no key is both a value and an object
+        keys = set(field.key for field in self.fields)
+        for field in self.fields:
+            for i in xrange(1, len(field.key)):
+                if field.key[:i] in keys:
+                    raise MappingException(
+                        'Key "%s" is inside another key' %
+                        '.'.join(field.key))
+
+    def _parseLine(self, line):
+        """Builds a Field out of one line of a mapping"""
+        key, sep, spec = line.partition(':')
+        key = key.strip()
+        if not sep or not key:
+            raise MappingException('Invalid mapping line "%s", must look '
+                                   'like "key: path|type|default"' % line)
+
+        parts = [part.strip() for part in spec.split('|', 2)]
+        if not parts[0]:
+            raise MappingException('No path given for "%s"' % key)
+
+        path = parts[0]
+        kind = parts[1] if len(parts) > 1 and parts[1] else 'any'
+        default = parts[2] if len(parts) > 2 else None
+        return Field(key, path, kind, default)
+
+    def getBodyPaths(self):
+        """Returns the paths under 'body' that the mapping uses.
+
+        A PathTree has no notion of list indexes (every item of a list
+        shares its node), so a path is cut short at its first index, and
+        the whole list is parsed.
+
+        returns:
+            A list of (path, whole) tuples for extract.buildPathTree(), or
+            None if the mapping needs the whole body
+        """
+        paths = []
+        for field in self.fields:
+            if field.path[0] != extract.ROOT:
+                continue
+
+            path = []
+            for part in field.path[1:]:
+                if part.isdigit():
+                    break
+                path.append(part)
+
+            if not path:
+                return None
+            paths.append((tuple(path), True))
+        return paths
+
+    def apply(self, data):
+        """Builds the output for a request.
+
+        args:
+            data: The template data of a request (see
+                  hooky.translators.context.RequestContext.toDict())
+
+        returns:
+            A dict. Key order isn't kept, as a plain dict is a lot cheaper
+            to build and serialize than an OrderedDict.
+        """
+        result = {}
+        for field in self.fields:
+            node = result
+            for part in field.key[:-1]:
+                node = node.setdefault(part, {})
+            node[field.key[-1]] = field.get(data)
+        return result
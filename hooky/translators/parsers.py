@@ -0,0 +1,408 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc
+
+"""
+Inbound request body parsers.
+
+Bodies are parsed exactly once, by a single parser picked from the request
+Content-Type header. A number of senders (curl -d, for example) label JSON
+or XML bodies as form-encoded, so for those content types (or when no
+Content-Type is supplied at all) the first non-whitespace byte of the body
+is used to pick the parser instead.
+
+Additional parsers can be registered at any time:
+
+    from hooky.translators import parsers
+
+    def parseYaml(body):
+        try:
+            return yaml.safe_load(body)
+        except yaml.YAMLError, e:
+            raise parsers.ParseError(e)
+
+    parsers.register('application/x-yaml', parseYaml)
+
+A parser takes the raw body string and returns the parsed data, or raises
+ParseError if the body cannot be parsed.
+
+Some parsers can also work through a body a chunk at a time, as it arrives,
+with a feed parser registered alongside them:
+
+    feed = parsers.getFeedParser(content_type)
+    for chunk in chunks:
+        feed.feed(chunk)
+    data = feed.close()
+
+A feed parser produces the same data as its parser would from the whole
+body. Only XML has one (expat works incrementally), and only bodies labelled
+with a content type that is trusted (so not one of SNIFFED_TYPES) use it.
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import logging
+import collections
+import re
+import urlparse
+
+from xml.parsers import expat
+from xml.parsers.expat import ExpatError
+import xmltodict
+
+from hooky import jsonbackend
+
+log = logging.getLogger(__name__)
+
+# Content types that are frequently sent with bodies that are really
+# something else. The body is sniffed before trusting these.
+SNIFFED_TYPES = ('', 'application/x-www-form-urlencoded', 'text/plain')
+
+# Matches the first non-whitespace character of a body.
+FIRST_BYTE = re.compile(r'\s*(\S)')
+
+
+class ParseError(Exception):
+    """Raised by a parser when the supplied body cannot be parsed"""
+
+
+def parseJSON(body):
+    """Parses a JSON body, with the configured hooky.jsonbackend library"""
+    try:
+        return jsonbackend.loads(body)
+    except (ValueError, TypeError), e:
+        raise ParseError(e)
+
+
+def parseXML(body):
+    """Parses an XML body into a dict with xmltodict"""
+    try:
+        return xmltodict.parse(body)
+    except (ExpatError, TypeError), e:
+        raise ParseError(e)
+
+
+class XMLDictBuilder(object):
+    """Builds the same dict as xmltodict.parse() out of expat events.
+
+    Elements become OrderedDicts (or a plain string, if they only hold
+    text), attributes are keys starting with '@', text next to child
+    elements or attributes goes under '#text', and repeated elements become
+    lists. Whitespace around text is stripped.
+
+    Use createParser() to get an expat parser wired up to a builder. Once
+    the document is parsed, the result is in 'item'.
+    """
+
+    def __init__(self):
+        self.item = None
+
+        # The (item, text) of each element that is still open
+        self._stack = []
+        self._text = []
+
+    def startElement(self, name, attrs):
+        """Opens an element. attrs is a flat [name, value, ...] list"""
+        self._stack.append((self.item, self._text))
+        self.item = collections.OrderedDict(
+            ('@' + key, value)
+            for key, value in zip(attrs[0::2], attrs[1::2])) or None
+        self._text = []
+
+    def endElement(self, name):
+        """Closes an element, adding it to its parent"""
+        text = ''.join(self._text).strip() or None
+        item = self.item
+        self.item, self._text = self._stack.pop()
+
+        if item is not None:
+            if text:
+                self._push(item, '#text', text)
+            self.item = self._push(self.item, name, item)
+        else:
+            self.item = self._push(self.item, name, text)
+
+    def characters(self, data):
+        """Adds text to the open element"""
+        self._text.append(data)
+
+    def skipElement(self, name):
+        """Adds an element that was never parsed to the open element"""
+        self.item = self._push(self.item, name, None)
+
+    def _push(self, item, key, data):
+        """Adds a value to an item, turning repeated keys into lists.
+
+        returns:
+            The item, which is created if it was None
+        """
+        if item is None:
+            item = collections.OrderedDict()
+
+        try:
+            value = item[key]
+        except KeyError:
+            item[key] = data
+            return item
+
+        if isinstance(value, list):
+            value.append(data)
+        else:
+            item[key] = [value, data]
+        return item
+
+    @classmethod
+    def createParser(cls, handler=None):
+        """Builds an expat parser the way xmltodict.parse() does.
+
+        Entities are not expanded, and text is buffered so that each run of
+        it arrives in one piece.
+
+        args:
+            handler: Object with startElement(), endElement() and
+                     characters() methods (def: a new XMLDictBuilder)
+
+        returns:
+            A (parser, handler) tuple
+        """
+        if handler is None:
+            handler = cls()
+
+        parser = expat.ParserCreate()
+        parser.ordered_attributes = True
+        parser.buffer_text = True
+        parser.StartElementHandler = handler.startElement
+        parser.EndElementHandler = handler.endElement
+        parser.CharacterDataHandler = handler.characters
+        parser.DefaultHandler = lambda data: None
+        parser.ExternalEntityRefHandler = lambda *args: 1
+        return parser, handler
+
+
+class XMLFeedParser(object):
+    """Parses an XML body into the same dict as parseXML(), in chunks.
+
+    Builds the expat parser the way xmltodict.parse() does (see
+    XMLDictBuilder), but feeds it with Parse(chunk, False) rather than
+    handing it the whole body at once.
+    """
+
+    def __init__(self):
+        self._parser, self._handler = XMLDictBuilder.createParser()
+
+    def feed(self, chunk):
+        """Parses the next chunk of the body.
+
+        raises:
+            ParseError if the body is not valid XML
+        """
+        try:
+            self._parser.Parse(chunk, False)
+        except ExpatError, e:
+            raise ParseError(e)
+
+    def close(self):
+        """Finishes parsing, once the whole body has been fed in.
+
+        returns:
+            The parsed data
+
+        raises:
+            ParseError if the body is not valid XML
+        """
+        try:
+            self._parser.Parse('', True)
+        except ExpatError, e:
+            raise ParseError(e)
+        return self._handler.item
+
+
+def parseForm(body):
+    """Parses a form-encoded (key=value&...) body into a dict of lists"""
+    return urlparse.parse_qs(body, keep_blank_values=True)
+
+
+# Registered parsers, keyed by lower-case mime type.
+_parsers = {}
+
+# Parsers used for structured syntax suffixes (RFC 6839), for example
+# application/vnd.github+json.
+_suffixes = {}
+
+# Parsers picked by the first non-whitespace byte of a body.
+_sniffers = {}
+
+# Feed parser classes, keyed by the parser whose results they produce.
+_feeds = {}
+
+
+def register(content_type, parser):
+    """Registers a parser for a content type.
+
+    args:
+        content_type: A mime type (application/json), or a structured syntax
+                      suffix (+json) that applies to any matching type.
+        parser: A function that takes the raw body and returns the parsed
+                data, raising ParseError on failure.
+    """
+    content_type = content_type.lower()
+    if content_type.startswith('+'):
+        _suffixes[content_type] = parser
+    else:
+        _parsers[content_type] = parser
+
+
+def registerSniffer(first_byte, parser):
+    """Registers the parser to use for bodies starting with first_byte.
+
+    args:
+        first_byte: Single character, eg. '{'
+        parser: A parser function. See register().
+    """
+    _sniffers[first_byte] = parser
+
+
+def registerFeed(parser, feed_class):
+    """Registers a feed parser for the bodies a parser handles.
+
+    args:
+        parser: A parser function registered with register()
+        feed_class: A class with feed(chunk) and close() methods. close()
+                    returns the same data the parser would have. Both raise
+                    ParseError on bad input.
+    """
+    _feeds[parser] = feed_class
+
+
+def getFeedParser(content_type):
+    """Returns a new feed parser for a Content-Type header, if there is one.
+
+    Content types that are sniffed (see SNIFFED_TYPES) never get one, as
+    their bodies can only be parsed once they are known.
+
+    args:
+        content_type: Raw Content-Type header value, or None
+
+    returns:
+        A feed parser object, or None
+    """
+    if _mimeType(content_type) in SNIFFED_TYPES:
+        return None
+
+    feed_class = _feeds.get(getParser(content_type))
+    if feed_class is None:
+        return None
+    return feed_class()
+
+
+def getParser(content_type):
+    """Returns the parser registered for the supplied Content-Type header.
+
+    args:
+        content_type: Raw Content-Type header value (may include parameters
+                      such as charset), or None
+
+    returns:
+        A parser function, or None if nothing is registered
+    """
+    mime = _mimeType(content_type)
+    try:
+        return _parsers[mime]
+    except KeyError:
+        pass
+
+    plus = mime.rfind('+')
+    if plus != -1:
+        return _suffixes.get(mime[plus:])
+
+    return None
+
+
+def sniff(body):
+    """Returns a parser picked from the first non-whitespace byte of body.
+
+    args:
+        body: The raw body string
+
+    returns:
+        A parser function, or None if the body is not recognized
+    """
+    match = FIRST_BYTE.match(body)
+    if match is None:
+        return None
+
+    return _sniffers.get(match.group(1))
+
+
+def parse(body, content_type=None):
+    """Parses a request body.
+
+    args:
+        body: The raw body string
+        content_type: Raw Content-Type header value, or None
+
+    returns:
+        The parsed data, or None if the body is empty or cannot be parsed
+    """
+    if not body:
+        return None
+
+    parser = getParser(content_type)
+    if parser is None or _mimeType(content_type) in SNIFFED_TYPES:
+        parser = sniff(body) or parser
+
+    if parser is None:
+        log.debug('No parser found for Content-Type: %s' % content_type)
+        return None
+
+    try:
+        return parser(body)
+    except ParseError, e:
+        log.debug('Body could not be parsed by %s: %s' % (parser.__name__, e))
+
+    # The declared Content-Type was wrong. Give the body one more chance
+    # with whatever it looks like, if thats something different.
+    fallback = sniff(body)
+    if fallback is None or fallback is parser:
+        return None
+
+    try:
+        return fallback(body)
+    except ParseError, e:
+        log.debug('Body could not be parsed by %s: %s' %
+                  (fallback.__name__, e))
+
+    return None
+
+
+def _mimeType(content_type):
+    """Strips parameters from a Content-Type header and lower-cases it"""
+    if not content_type:
+        return ''
+
+    return content_type.split(';', 1)[0].strip().lower()
+
+
+register('application/json', parseJSON)
+register('text/json', parseJSON)
+register('+json', parseJSON)
+register('application/xml', parseXML)
+register('text/xml', parseXML)
+register('+xml', parseXML)
+register('application/x-www-form-urlencoded', parseForm)
+
+registerSniffer('{', parseJSON)
+registerSniffer('[', parseJSON)
+registerSniffer('<', parseXML)
+
+registerFeed(parseXML, XMLFeedParser)
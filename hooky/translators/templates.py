@@ -0,0 +1,134 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc
+
+"""
+Compiled template cache for the Pystache based Translators.
+
+pystache.render() parses the mustache template from scratch every time it is
+called. This module parses each template once into a pystache ParsedTemplate
+and keeps it in a bounded LRU cache keyed by the template content, so that
+the request path only ever pays for rendering.
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import collections
+import logging
+import threading
+
+import pystache
+
+log = logging.getLogger(__name__)
+
+# Maximum number of compiled templates kept around by the default cache.
+DEFAULT_CACHE_SIZE = 256
+
+
+class TemplateCache(object):
+    """A bounded LRU cache of compiled Pystache templates.
+
+    Templates are keyed on their contents rather than on any name, so two
+    translators with an identical template share one compiled copy, and a
+    changed template is simply a new entry.
+    """
+
+    def __init__(self, size=DEFAULT_CACHE_SIZE):
+        """Creates an empty cache.
+
+        args:
+            size: Maximum number of compiled templates to keep
+        """
+        self.size = size
+        self._local = threading.local()
+        self._templates = collections.OrderedDict()
+
+    def parse(self, template):
+        """Returns the compiled form of the supplied template string.
+
+        args:
+            template: A template string (str or unicode)
+
+        returns:
+            A pystache ParsedTemplate object
+        """
+        try:
+            # Pop and re-insert the entry to mark it as recently used.
+            parsed = self._templates.pop(template)
+        except KeyError:
+            log.debug('Compiling template (%s bytes)' % len(template))
+            parsed = pystache.parse(self._toUnicode(template))
+
+            if len(self._templates) >= self.size:
+                self._templates.popitem(last=False)
+
+        self._templates[template] = parsed
+        return parsed
+
+    def render(self, template, data):
+        """Renders a template against the supplied data.
+
+        args:
+            template: A template string, or a ParsedTemplate object returned
+                      by parse()
+            data: The dictionary (or object) to render the template with
+
+        returns:
+            The rendered unicode string
+        """
+        if isinstance(template, basestring):
+            template = self.parse(template)
+
+        return self._getRenderer().render(template, data)
+
+    def clear(self):
+        """Empties the cache."""
+        self._templates.clear()
+
+    def __len__(self):
+        return len(self._templates)
+
+    def _getRenderer(self):
+        """Returns the pystache Renderer for the current thread.
+
+        A Renderer keeps state while it renders, so each thread that renders
+        templates (see hooky.executor) needs one of its own.
+        """
+        try:
+            return self._local.renderer
+        except AttributeError:
+            renderer = self._local.renderer = pystache.Renderer()
+            return renderer
+
+    def _toUnicode(self, template):
+        """Decodes a byte string template the same way pystache.render does"""
+        if isinstance(template, unicode):
+            return template
+
+        renderer = self._getRenderer()
+        return unicode(template, renderer.string_encoding,
+                       renderer.decode_errors)
+
+
+# Default cache shared by all of the Translators.
+cache = TemplateCache()
+
+
+def parse(template):
+    """Compiles a template using the default cache. See TemplateCache."""
+    return cache.parse(template)
+
+
+def render(template, data):
+    """Renders a template using the default cache. See TemplateCache."""
+    return cache.render(template, data)
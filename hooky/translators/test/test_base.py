@@ -1,11 +1,15 @@
 import json
 
+import mock
 from tornado import testing
 from tornado.testing import unittest
 from tornado import httpclient
 
+from hooky import executor
 from hooky import utils
 from hooky.translators import base
+from hooky.translators import context
+from hooky.translators import extract
 
 
 class TestBaseTranslator(unittest.TestCase):
@@ -39,6 +43,14 @@ class TestBaseTranslator(unittest.TestCase):
                           '123 Amoebobacterieae St')
         self.assertEquals(data['body']['order']['email'], 'bob@customer.com')
 
+    def testContentTypeSelectsParser(self):
+        """Tests that the Content-Type header picks the body parser"""
+        req = httpclient.HTTPRequest(
+            '/', body='foo=bar',
+            headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        data = self.translator._request_to_dict(req)
+        self.assertEquals({'foo': ['bar']}, data['body'])
+
 
 class TestTestTranslator(testing.AsyncTestCase):
     def setUp(self):
@@ -87,3 +99,38 @@ class TestTestTranslator(testing.AsyncTestCase):
 
         # Are they the same?
         self.assertEquals(result['success'], True)
+
+    @testing.gen_test
+    def testSubmitOffloaded(self):
+        """Test that offloaded parsing and rendering give the same result"""
+        req = httpclient.HTTPRequest('/', body=json.dumps({'foo': 'bar'}))
+        inline = yield self.translator.submit(req)
+
+        executor.configure(kind='thread', threshold=0)
+        try:
+            offloaded = yield self.translator.submit(req)
+        finally:
+            executor.configure()
+
+        self.assertEquals(inline, offloaded)
+
+    @testing.gen_test
+    def testLoadDataOffloadedTree(self):
+        """Test that an offloaded body with a tree is never parsed in full"""
+        req = httpclient.HTTPRequest('/', body=json.dumps({'foo': 'bar'}))
+        tree = extract.PathTree([(('foo',), True)])
+
+        executor.configure(kind='thread', threshold=0)
+        try:
+            with mock.patch.object(context.RequestContext,
+                                   'parseBody') as parse_body:
+                with mock.patch.object(
+                        extract, 'extractBody',
+                        return_value={'foo': 'bar'}) as extract_body:
+                    data = yield self.translator._loadData(req, tree)
+        finally:
+            executor.configure()
+
+        self.assertEquals({'foo': 'bar'}, data['body'])
+        self.assertFalse(parse_body.called)
+        self.assertEquals(1, extract_body.call_count)
@@ -0,0 +1,214 @@
+import mock
+from tornado import testing
+from tornado.testing import unittest
+from tornado import httpclient
+
+from hooky import executor
+from hooky import utils
+from hooky.translators import base
+from hooky.translators import context
+from hooky.translators import extract
+from hooky.translators import templates
+
+
+class TestRequestContext(unittest.TestCase):
+    def setUp(self):
+        """Creates a RequestContext around a GitHub webhook"""
+        source_path = '%s/test_data/sources' % utils.getRootPath()
+        body = open('%s/github.json' % source_path, 'r').read()
+        self.request = httpclient.HTTPRequest('/', body=body)
+        self.context = context.RequestContext(self.request)
+
+    def testProxiesRequest(self):
+        """Test that request attributes are readable from the context"""
+        self.assertEquals(self.request.body, self.context.body)
+        self.assertEquals(self.request.headers, self.context.headers)
+        self.assertRaises(AttributeError, getattr, self.context, 'bogus')
+
+    def testReadOnly(self):
+        """Test that the context cannot be modified"""
+        self.assertRaises(AttributeError, setattr, self.context, 'body', '')
+
+    def testToDict(self):
+        """Test that toDict() builds the template data"""
+        data = self.context.toDict()
+        self.assertEquals(data['body']['ref'], 'refs/heads/master')
+        self.assertEquals(data['request'], self.request.__dict__)
+        self.assertTrue(data is self.context.toDict())
+
+    def testParsesOnce(self):
+        """Test that many Translators sharing a context parse once"""
+        with mock.patch('hooky.translators.parsers.parse') as parse:
+            parse.return_value = {'foo': 'bar'}
+            translators = [base.TestTranslator(), base.TestTranslator()]
+            for translator in translators:
+                data = translator._request_to_dict(self.context)
+                self.assertEquals({'foo': 'bar'}, data['body'])
+
+            self.assertEquals(1, parse.call_count)
+
+    def testParseBody(self):
+        """Test that parseBody() parses once, for everyone"""
+        with mock.patch('hooky.translators.parsers.parse') as parse:
+            parse.return_value = {'foo': 'bar'}
+            future = self.context.parseBody()
+            self.assertTrue(future is self.context.parseBody())
+            self.assertEquals({'foo': 'bar'}, future.result())
+            self.assertEquals({'foo': 'bar'}, self.context.getParsedBody())
+            self.assertEquals(1, parse.call_count)
+
+    def testAlreadyParsed(self):
+        """Test that a body parsed as it arrived is not parsed again"""
+        request = context.RequestContext(self.request, parsed={'foo': 'bar'})
+        with mock.patch('hooky.translators.parsers.parse') as parse:
+            self.assertEquals({'foo': 'bar'}, request.getParsedBody())
+            self.assertEquals({'foo': 'bar'}, request.parseBody().result())
+            self.assertFalse(parse.called)
+
+    def testExtracted(self):
+        """Test that a PathTree only parses the paths it needs, once"""
+        tree = extract.PathTree([(('ref',), True)])
+        with mock.patch.object(tree, 'extract') as extract_paths:
+            extract_paths.return_value = {'ref': 'master'}
+            data = self.context.toDict(tree)
+            self.assertEquals('master', data['body']['ref'])
+            self.assertTrue(data is self.context.toDict(tree))
+            self.assertEquals({'ref': 'master'},
+                              self.context.getParsedBody(tree))
+            self.assertEquals(1, extract_paths.call_count)
+
+        # Once the whole body is parsed, everyone gets that
+        self.assertEquals(self.context.getParsedBody(),
+                          self.context.getParsedBody(tree))
+
+    def testExtractNotSupported(self):
+        """Test that bodies that can't be extracted are parsed in full"""
+        tree = extract.PathTree([(('ref',), True)])
+        with mock.patch.object(tree, 'extract') as extract_paths:
+            extract_paths.return_value = extract.NOT_SUPPORTED
+            data = self.context.toDict(tree)
+            self.assertEquals('refs/heads/master', data['body']['ref'])
+
+    def testGetContext(self):
+        """Test that getContext() only wraps bare requests"""
+        self.assertTrue(self.context is context.getContext(self.context))
+        wrapped = context.getContext(self.request)
+        self.assertTrue(isinstance(wrapped, context.RequestContext))
+        self.assertTrue(wrapped.request is self.request)
+
+    def testToDictIsLazy(self):
+        """Test that sections are only built when looked up"""
+        with mock.patch('hooky.translators.parsers.parse') as parse:
+            parse.return_value = {'foo': 'bar'}
+            data = self.context.toDict()
+            self.assertEquals(self.request.headers, data['headers'])
+            self.assertFalse(parse.called)
+
+            self.assertEquals('bar', data['body']['foo'])
+            self.assertEquals(1, parse.call_count)
+
+    def testToDictTemplating(self):
+        """Test that templates only touch the sections they use"""
+        with mock.patch('hooky.translators.parsers.parse') as parse:
+            rendered = templates.render('{{headers.X-Test}}',
+                                        context.RequestContext(
+                                            httpclient.HTTPRequest(
+                                                '/', headers={'X-Test': 'a'},
+                                                body='{}')).toDict())
+            self.assertEquals('a', rendered)
+            self.assertFalse(parse.called)
+
+        rendered = templates.render('{{body.ref}}', self.context.toDict())
+        self.assertEquals('refs/heads/master', rendered)
+
+    def testToDictMissingBody(self):
+        """Test that an unparseable body leaves out the 'body' key"""
+        request = httpclient.HTTPRequest('/', body='<bogus data>')
+        data = context.RequestContext(request).toDict()
+        self.assertFalse('body' in data)
+        self.assertEquals(None, data.get('body'))
+        self.assertEquals(['arguments', 'headers', 'request'],
+                          sorted(data.keys()))
+
+
+class TestLazyDict(unittest.TestCase):
+    def setUp(self):
+        """Creates a LazyDict with a mocked loader"""
+        self.loader = mock.Mock(return_value='value')
+        self.data = context.LazyDict({'key': self.loader,
+                                      'absent': lambda: context.ABSENT})
+
+    def testLoadsOnce(self):
+        """Test that loaders are called once, and only when needed"""
+        self.assertFalse(self.loader.called)
+        self.assertEquals('value', self.data['key'])
+        self.assertEquals('value', self.data['key'])
+        self.assertEquals(1, self.loader.call_count)
+
+    def testAbsent(self):
+        """Test that loaders returning ABSENT hide their key"""
+        self.assertFalse('absent' in self.data)
+        self.assertRaises(KeyError, self.data.__getitem__, 'absent')
+        self.assertRaises(KeyError, self.data.__getitem__, 'bogus')
+        self.assertEquals({'key': 'value'}, self.data)
+        self.assertEquals(1, len(self.data))
+
+    def testReadOnly(self):
+        """Test that LazyDict objects cannot be modified"""
+        self.assertRaises(TypeError, self.data.__setitem__, 'key', 'foo')
+        self.assertRaises(TypeError, self.data.update, {})
+        self.assertRaises(TypeError, self.data.pop, 'key')
+
+
+class TestRequestContextOffload(testing.AsyncTestCase):
+    def setUp(self):
+        super(TestRequestContextOffload, self).setUp()
+        executor.configure(kind='thread', threshold=0)
+
+    def tearDown(self):
+        executor.configure()
+        super(TestRequestContextOffload, self).tearDown()
+
+    @testing.gen_test
+    def testParseBody(self):
+        """Test that large bodies can be parsed off the IOLoop"""
+        request = httpclient.HTTPRequest('/', body='{"foo": "bar"}')
+        ctx = context.RequestContext(request)
+
+        self.assertEquals({'foo': 'bar'}, (yield ctx.parseBody()))
+        with mock.patch('hooky.translators.parsers.parse') as parse:
+            self.assertEquals({'foo': 'bar'}, ctx.toDict()['body'])
+            self.assertFalse(parse.called)
+
+    @testing.gen_test
+    def testExtractBody(self):
+        """Test that only the paths in a tree are parsed off the IOLoop"""
+        request = httpclient.HTTPRequest(
+            '/', body='<root><a>1</a><b>2</b></root>',
+            headers={'Content-Type': 'application/xml'})
+        ctx = context.RequestContext(request)
+        tree = extract.PathTree([(('root', 'a'), True)])
+
+        with mock.patch('hooky.translators.parsers.parse') as parse:
+            future = ctx.extractBody(tree)
+            self.assertTrue(future is ctx.extractBody(tree))
+            body = yield future
+            self.assertFalse(parse.called)
+        self.assertEquals({'root': {'a': '1', 'b': None}}, body)
+
+        with mock.patch.object(extract, 'extractBody') as extract_body:
+            self.assertEquals(body, ctx.toDict(tree)['body'])
+            self.assertFalse(extract_body.called)
+
+    @testing.gen_test
+    def testExtractBodyUnsupported(self):
+        """Test that bodies that can't be extracted are parsed in full"""
+        request = httpclient.HTTPRequest('/', body='{"a": 1, "b": 2}')
+        ctx = context.RequestContext(request)
+        tree = extract.PathTree([(('a',), True)])
+
+        with mock.patch.object(extract, 'extractBody',
+                               return_value=extract.NOT_SUPPORTED):
+            body = yield ctx.extractBody(tree)
+        self.assertEquals({'a': 1, 'b': 2}, body)
+        self.assertEquals(body, ctx.getParsedBody())
@@ -0,0 +1,170 @@
+import json
+import pickle
+
+import mock
+from tornado.testing import unittest
+
+from hooky import utils
+from hooky.translators import extract
+from hooky.translators import parsers
+from hooky.translators import templates
+
+ORDER_TEMPLATE = (
+    u'{{#body.order}}{{email}} {{id.#text}}: '
+    u'{{#line-items}}{{#line-item}}{{title}} {{/line-item}}{{/line-items}}'
+    u'{{^closed-at}}open{{/closed-at}}{{/body.order}}')
+
+PUSH_TEMPLATE = (
+    u'{{body.ref}} {{body.repository.owner.name}} '
+    u'{{#body.commits}}{{id}} {{author.email}} {{/body.commits}}'
+    u'{{headers.X-Github-Event}}')
+
+
+def getEvents(value, prefix=''):
+    """Generates the ijson events for a parsed JSON value"""
+    if isinstance(value, dict):
+        yield prefix, 'start_map', None
+        for key, item in value.iteritems():
+            yield prefix, 'map_key', key
+            path = '%s.%s' % (prefix, key) if prefix else key
+            for event in getEvents(item, path):
+                yield event
+        yield prefix, 'end_map', None
+    elif isinstance(value, list):
+        yield prefix, 'start_array', None
+        path = '%s.item' % prefix if prefix else 'item'
+        for item in value:
+            for event in getEvents(item, path):
+                yield event
+        yield prefix, 'end_array', None
+    else:
+        yield prefix, 'string', value
+
+
+class TestGetPaths(unittest.TestCase):
+    def _paths(self, template):
+        paths = extract.getPaths(templates.parse(template))
+        return None if paths is None else sorted(paths)
+
+    def testVariables(self):
+        """Test that only names under body are paths"""
+        self.assertEquals([(('a', 'b'), True), (('c',), True)],
+                          self._paths(u'{{body.a.b}} {{{body.c}}} {{x}} '
+                                      u'{{headers.y}}'))
+
+    def testSections(self):
+        """Test that names in sections are looked up in every context"""
+        self.assertEquals(
+            [(('a',), False), (('a', 'b'), True), (('a', 'body', 'b'), True),
+             (('b',), True), (('c',), False)],
+            self._paths(u'{{#body.a}}{{b}}{{body.b}}{{/body.a}}'
+                        u'{{^body.c}}{{x}}{{/body.c}}'))
+
+    def testWholeBody(self):
+        """Test that templates needing the whole body have no paths"""
+        self.assertEquals(None, self._paths(u'{{body}}'))
+        self.assertEquals(None, self._paths(u'{{#body}}{{a}}{{/body}}'))
+        self.assertEquals(None, self._paths(u'{{.}}'))
+        self.assertEquals(None, self._paths(u'{{>partial}}'))
+
+    def testIgnoredNodes(self):
+        """Test that comments and delimiter changes don't need the body"""
+        self.assertEquals([(('a',), True)],
+                          self._paths(u'{{! note}}{{=<% %>=}}<%body.a%>'))
+
+    def testUnknownNode(self):
+        """Test that nodes of an unknown type need the whole body"""
+        with mock.patch.object(extract, '_VALUE_NODES', ()):
+            self.assertEquals(None, self._paths(u'{{body.a}}'))
+
+    def testCurrentItem(self):
+        """Test that {{.}} in a section needs all of the section's value"""
+        tree = extract.getPathTree(templates.parse(
+            u'{{#body.tags}}{{.}}{{/body.tags}}{{#body.a}}{{b}}{{/body.a}}'))
+        self.assertEquals({'tags': extract.ALL, 'a': {'b': extract.ALL}},
+                          tree.root)
+
+    def testDisabled(self):
+        """Test that no trees are built when turned off"""
+        template = templates.parse(u'{{body.a}}')
+        extract.configure(False)
+        self.addCleanup(extract.configure)
+        self.assertEquals(None, extract.getPathTree(template))
+
+
+class TestExtract(unittest.TestCase):
+    def setUp(self):
+        source_path = '%s/test_data/sources' % utils.getRootPath()
+        self.json = open('%s/github.json' % source_path, 'r').read()
+        self.xml = open('%s/shopify.xml' % source_path, 'r').read()
+
+    def _render(self, template, body):
+        return templates.render(template, {'body': body, 'headers': {}})
+
+    def testXML(self):
+        """Test that XML extracted by path renders like a full parse"""
+        template = templates.parse(ORDER_TEMPLATE)
+        tree = extract.getPathTree(template)
+        data = tree.extract(self.xml, 'application/xml')
+
+        full = parsers.parseXML(self.xml)
+        self.assertEquals(self._render(template, full),
+                          self._render(template, data))
+        self.assertIn('bob@customer.com 516163746: Draft', self._render(
+            template, data))
+
+        # Everything else is left out, but the keys are all still there
+        self.assertEquals(full['order'].keys(), data['order'].keys())
+        self.assertEquals(None, data['order']['billing-address'])
+
+    def testXMLSniffed(self):
+        """Test that mislabelled XML bodies are extracted too"""
+        tree = extract.getPathTree(templates.parse(ORDER_TEMPLATE))
+        data = tree.extract(self.xml, 'text/plain')
+        self.assertEquals('bob@customer.com', data['order']['email'])
+
+    def testPickled(self):
+        """Test that trees and markers survive a trip to a process pool"""
+        tree = extract.PathTree([(('order', 'email'), True)])
+        root = pickle.loads(pickle.dumps(tree.root))
+        self.assertTrue(root['order']['email'] is extract.ALL)
+        self.assertTrue(pickle.loads(pickle.dumps(extract.NOT_SUPPORTED)) is
+                        extract.NOT_SUPPORTED)
+
+        data = extract.extractBody(root, self.xml, 'application/xml')
+        self.assertEquals('bob@customer.com', data['order']['email'])
+
+    def testXMLBogusData(self):
+        """Test that bad XML is left for a full parse"""
+        tree = extract.PathTree([(('a',), True)])
+        self.assertTrue(tree.extract('<a><b></a>', 'text/xml') is
+                        extract.NOT_SUPPORTED)
+
+    def testBuildJSON(self):
+        """Test that JSON built from ijson events renders like json.loads"""
+        template = templates.parse(PUSH_TEMPLATE)
+        tree = extract.getPathTree(template)
+        full = json.loads(self.json)
+        data = extract.buildJSON(getEvents(full), tree.root)
+
+        self.assertEquals(self._render(template, full),
+                          self._render(template, data))
+        self.assertEquals(len(full['commits']), len(data['commits']))
+        self.assertEquals(None, data['commits'][0]['message'])
+        self.assertEquals({'name': 'octokitty', 'email': None},
+                          data['repository']['owner'])
+
+    def testJSONWithoutIjson(self):
+        """Test that JSON is parsed in full without ijson"""
+        tree = extract.getPathTree(templates.parse(PUSH_TEMPLATE))
+        with mock.patch.object(extract, 'ijson', None):
+            self.assertTrue(tree.extract(self.json, 'application/json') is
+                            extract.NOT_SUPPORTED)
+
+    def testUnsupported(self):
+        """Test that other bodies are left for a full parse"""
+        tree = extract.PathTree([(('a',), True)])
+        self.assertTrue(tree.extract('a=b', 'application/x-www-form-'
+                                     'urlencoded') is extract.NOT_SUPPORTED)
+        self.assertTrue(tree.extract('', 'text/xml') is
+                        extract.NOT_SUPPORTED)
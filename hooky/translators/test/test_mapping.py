@@ -0,0 +1,105 @@
+from tornado.testing import unittest
+
+from hooky.translators import extract
+from hooky.translators import mapping
+from hooky.translators import parsers
+from hooky.translators.test import test_extract
+
+DATA = {
+    'headers': {'X-Event': 'push'},
+    'body': {
+        'repository': {'name': 'hooky', 'watchers': '12', 'private': 'false',
+                       'size': 10.5, 'owner': None},
+        'commits': [{'id': 'abc'}, {'id': 'def'}],
+    },
+}
+
+
+class TestMapping(unittest.TestCase):
+    def testApply(self):
+        """Test that values are looked up, converted and nested"""
+        extractor = mapping.Mapping("""
+            # Comments and blank lines are skipped
+
+            event: headers.X-Event
+            repo.name: body.repository.name
+            repo.watchers: body.repository.watchers|int
+            repo.private: body.repository.private|bool
+            repo.size: body.repository.size|str
+            last: body.commits.1.id
+            commits: body.commits
+        """)
+
+        result = extractor.apply(DATA)
+        self.assertEquals({'event': 'push',
+                           'repo': {'name': 'hooky', 'watchers': 12,
+                                    'private': False, 'size': u'10.5'},
+                           'last': 'def',
+                           'commits': [{'id': 'abc'}, {'id': 'def'}]},
+                          result)
+
+    def testDefaults(self):
+        """Test that missing or unconvertable values get the default"""
+        extractor = mapping.Mapping("""
+            missing: body.bogus.path|int|5
+            owner: body.repository.owner|str|nobody
+            name: body.repository.name|float|1.5
+            index: body.commits.9.id
+            into_string: body.repository.name.first|any|x
+        """)
+
+        self.assertEquals({'missing': 5, 'owner': 'nobody', 'name': 1.5,
+                           'index': None, 'into_string': 'x'},
+                          extractor.apply(DATA))
+
+    def testInvalid(self):
+        """Test that broken mappings are refused when compiled"""
+        for text in ('', '# nothing', 'no separator', ': body.a',
+                     'a: |int', 'a: body.a|date', 'a: body.a|int|bogus',
+                     'a: body.a\na.b: body.b'):
+            self.assertRaises(mapping.MappingException, mapping.Mapping,
+                              text)
+
+    def testGetBodyPaths(self):
+        """Test that the body paths used are listed for selective parsing"""
+        extractor = mapping.Mapping('a: body.x.y\nb: headers.Host\nc: body.z')
+        self.assertEquals([(('x', 'y'), True), (('z',), True)],
+                          extractor.getBodyPaths())
+
+        self.assertEquals(None, mapping.Mapping('a: body').getBodyPaths())
+        self.assertEquals(None, mapping.Mapping('a: body.0').getBodyPaths())
+
+    def testGetBodyPathsIndexed(self):
+        """Test that paths are cut short at list indexes"""
+        extractor = mapping.Mapping('a: body.root.item.1.id\nb: body.x.0')
+        self.assertEquals([(('root', 'item'), True), (('x',), True)],
+                          extractor.getBodyPaths())
+
+    def testIndexedXML(self):
+        """Test that indexed paths work on selectively parsed XML"""
+        extractor = mapping.Mapping('first: body.root.item.0.id\n'
+                                    'second: body.root.item.1.id|int')
+        tree = extract.buildPathTree(extractor.getBodyPaths())
+        body = ('<root><item><id>1</id></item><item><id>2</id></item>'
+                '<other>x</other></root>')
+
+        data = tree.extract(body, 'application/xml')
+        self.assertEquals(None, data['root']['other'])
+        self.assertEquals({'first': u'1', 'second': 2},
+                          extractor.apply({'body': data}))
+        self.assertEquals(extractor.apply({'body': parsers.parseXML(body)}),
+                          extractor.apply({'body': data}))
+
+    def testIndexedJSON(self):
+        """Test that indexed paths work on JSON built from ijson events"""
+        extractor = mapping.Mapping('id: body.commits.0.id\n'
+                                    'name: body.commits.1.author.name')
+        tree = extract.buildPathTree(extractor.getBodyPaths())
+        full = {'commits': [{'id': 'a', 'author': {'name': 'x'}},
+                            {'id': 'b', 'author': {'name': 'y'}}],
+                'other': 'skipped'}
+
+        data = extract.buildJSON(test_extract.getEvents(full), tree.root)
+        self.assertEquals(None, data['other'])
+        self.assertEquals({'id': 'a', 'name': 'y'},
+                          extractor.apply({'body': data}))
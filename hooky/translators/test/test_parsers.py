@@ -0,0 +1,121 @@
+import mock
+from tornado.testing import unittest
+import xmltodict
+
+from hooky import utils
+from hooky.translators import parsers
+
+
+class TestParsers(unittest.TestCase):
+    def setUp(self):
+        """Loads up the sample sources"""
+        source_path = '%s/test_data/sources' % utils.getRootPath()
+        self.json = open('%s/github.json' % source_path, 'r').read()
+        self.xml = open('%s/shopify.xml' % source_path, 'r').read()
+
+    def testGetParser(self):
+        """Test that getParser() handles mime types, params and suffixes"""
+        self.assertEquals(parsers.parseJSON,
+                          parsers.getParser('application/json'))
+        self.assertEquals(parsers.parseJSON,
+                          parsers.getParser('Application/JSON; charset=utf8'))
+        self.assertEquals(parsers.parseJSON,
+                          parsers.getParser('application/vnd.github+json'))
+        self.assertEquals(parsers.parseXML, parsers.getParser('text/xml'))
+        self.assertEquals(None, parsers.getParser('image/png'))
+        self.assertEquals(None, parsers.getParser(None))
+
+    def testSniff(self):
+        """Test that sniff() picks a parser by the first byte"""
+        self.assertEquals(parsers.parseJSON, parsers.sniff(' \n{"a": 1}'))
+        self.assertEquals(parsers.parseJSON, parsers.sniff('[1, 2]'))
+        self.assertEquals(parsers.parseXML, parsers.sniff('<xml/>'))
+        self.assertEquals(None, parsers.sniff('foo=bar'))
+        self.assertEquals(None, parsers.sniff('   '))
+
+    def testParseByContentType(self):
+        """Test that the declared Content-Type picks the parser"""
+        data = parsers.parse(self.json, 'application/json')
+        self.assertEquals(data['ref'], 'refs/heads/master')
+
+        data = parsers.parse(self.xml, 'application/xml')
+        self.assertEquals(data['order']['email'], 'bob@customer.com')
+
+        data = parsers.parse('foo=bar&foo=baz',
+                             'application/x-www-form-urlencoded')
+        self.assertEquals({'foo': ['bar', 'baz']}, data)
+
+    def testParseSniffsMislabelledBodies(self):
+        """Test that JSON and XML sent as form data still parse"""
+        form = 'application/x-www-form-urlencoded'
+        self.assertEquals(parsers.parse(self.json, form)['ref'],
+                          'refs/heads/master')
+        self.assertEquals(parsers.parse(self.xml, form)['order']['email'],
+                          'bob@customer.com')
+        self.assertEquals(parsers.parse(self.json)['ref'],
+                          'refs/heads/master')
+
+    def testFeedParser(self):
+        """Test that a fed XML body parses the same as a whole one"""
+        feed = parsers.getFeedParser('application/xml; charset=utf8')
+        for i in xrange(0, len(self.xml), 100):
+            feed.feed(self.xml[i:i + 100])
+        self.assertEquals(parsers.parseXML(self.xml), feed.close())
+
+    def testXMLDictBuilder(self):
+        """Test that the XML builder matches xmltodict.parse() exactly"""
+        for body in ('<a/>', '<a>  text  </a>', '<a x="1">text</a>',
+                     '<a><b>1</b><b>2</b><c/><b>3</b></a>',
+                     '<a x="1" y="2"><b z="3"/>tail</a>',
+                     '<a>one<b>2</b>two</a>', self.xml):
+            parser, builder = parsers.XMLDictBuilder.createParser()
+            parser.Parse(body, True)
+            self.assertEquals(xmltodict.parse(body), builder.item)
+
+    def testFeedParserBogusData(self):
+        """Test that bad XML fed in raises ParseError"""
+        feed = parsers.getFeedParser('text/xml')
+        self.assertRaises(parsers.ParseError, feed.feed, '<a></b>')
+
+        feed = parsers.getFeedParser('text/xml')
+        feed.feed('<a>')
+        self.assertRaises(parsers.ParseError, feed.close)
+
+    def testGetFeedParser(self):
+        """Test that only trusted content types get a feed parser"""
+        self.assertTrue(isinstance(parsers.getFeedParser('application/xml'),
+                                   parsers.XMLFeedParser))
+        self.assertEquals(None, parsers.getFeedParser('application/json'))
+        self.assertEquals(None, parsers.getFeedParser('text/plain'))
+        self.assertEquals(None, parsers.getFeedParser(None))
+
+    def testParseOnlyOnce(self):
+        """Test that a JSON body never touches the XML parser"""
+        with mock.patch('xmltodict.parse') as xml_parse:
+            parsers.parse(self.json, 'application/json')
+            parsers.parse(self.json)
+            self.assertFalse(xml_parse.called)
+
+    def testParseWrongContentType(self):
+        """Test that a body with the wrong Content-Type still parses"""
+        data = parsers.parse(self.xml, 'application/json')
+        self.assertEquals(data['order']['email'], 'bob@customer.com')
+
+    def testParseBogusData(self):
+        """Test that unparseable bodies return None"""
+        self.assertEquals(None, parsers.parse('<xml> oo":"bar"}'))
+        self.assertEquals(None, parsers.parse('{bogus', 'application/json'))
+        self.assertEquals(None, parsers.parse('bogus'))
+        self.assertEquals(None, parsers.parse(''))
+        self.assertEquals(None, parsers.parse(None))
+
+    def testRegister(self):
+        """Test that custom parsers can be registered"""
+        custom = mock.Mock(return_value={'custom': True})
+        parsers.register('application/x-unittest', custom)
+        try:
+            self.assertEquals({'custom': True},
+                              parsers.parse('data', 'application/x-unittest'))
+            custom.assert_called_once_with('data')
+        finally:
+            del parsers._parsers['application/x-unittest']
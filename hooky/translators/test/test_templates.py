@@ -0,0 +1,64 @@
+import json
+
+import mock
+from tornado.testing import unittest
+import pystache
+
+from hooky import utils
+from hooky.translators import templates
+
+# A realistic template for a GitHub push webhook
+TEMPLATE = ('{\n "committer": "{{body.head_commit.author.name}}",\n'
+            ' "id": "{{body.head_commit.id}}",\n'
+            ' "url": "{{body.repository.url}}",\n'
+            ' "commits": [{{#body.commits}}"{{id}}", {{/body.commits}}]\n}')
+
+
+class TestTemplateCache(unittest.TestCase):
+    def setUp(self):
+        """Creates an empty TemplateCache"""
+        self.cache = templates.TemplateCache(size=2)
+        self.source_path = '%s/test_data/sources' % utils.getRootPath()
+
+    def testParse(self):
+        """Test that parse() compiles each template only once"""
+        parsed = self.cache.parse(TEMPLATE)
+        self.assertTrue(isinstance(parsed, pystache.parsed.ParsedTemplate))
+        self.assertTrue(parsed is self.cache.parse(TEMPLATE))
+        self.assertEquals(1, len(self.cache))
+
+    def testParseEvictsLeastRecentlyUsed(self):
+        """Test that the cache never grows beyond its size"""
+        self.cache.parse('a')
+        self.cache.parse('b')
+        self.cache.parse('a')
+        self.cache.parse('c')
+        self.assertEquals(['a', 'c'], list(self.cache._templates))
+
+    def testRender(self):
+        """Test that render() matches pystache.render() exactly"""
+        data = {'body': json.load(open('%s/github.json' % self.source_path))}
+        expected = pystache.render(TEMPLATE, data)
+
+        self.assertEquals(expected, self.cache.render(TEMPLATE, data))
+        self.assertEquals(expected,
+                          self.cache.render(self.cache.parse(TEMPLATE), data))
+
+    def testRenderEscapesLikePystache(self):
+        """Test that HTML escaping behavior is unchanged"""
+        data = {'name': '<b>"bob"</b>'}
+        self.assertEquals(pystache.render('{{name}}', data),
+                          self.cache.render('{{name}}', data))
+
+    def testRenderParsesOnce(self):
+        """Test that rendering the same template again does not reparse it"""
+        data = {'body': json.load(open('%s/github.json' % self.source_path))}
+        expected = pystache.render(TEMPLATE, data)
+
+        with mock.patch.object(templates.pystache, 'parse',
+                               side_effect=pystache.parse) as parse:
+            for i in xrange(3):
+                self.assertEquals(expected,
+                                  self.cache.render(TEMPLATE, data))
+
+        self.assertEquals(1, parse.call_count)
@@ -1,7 +1,15 @@
+import json
+import mock
+
+from tornado import concurrent
 from tornado import testing
 from tornado import httpclient
 
+from hooky import breaker
 from hooky import utils
+from hooky.translators import extract
+from hooky.translators import mapping
+from hooky.translators import templates
 from hooky.translators import web
 
 # Defaults to use for the unit tests below
@@ -66,7 +74,8 @@ class PostTranslatorIntegrationTests(testing.AsyncTestCase):
         # Expected results
         expected = {
             'success': False,
-            'message': '2XX not returned: HTTP 405: Method Not Allowed'}
+            'message': '2XX not returned: HTTP 405: Method Not Allowed',
+            'retryable': False}
 
         # Call the submit method
         results = yield translator.submit(req)
@@ -90,7 +99,8 @@ class PostTranslatorIntegrationTests(testing.AsyncTestCase):
         # Expected results
         expected = {
             'success': False,
-            'message': '2XX not returned: HTTP 405: Method Not Allowed'}
+            'message': '2XX not returned: HTTP 405: Method Not Allowed',
+            'retryable': False}
 
         # Call the submit method
         results = yield translator.submit(req)
@@ -116,6 +126,8 @@ class PostTranslatorUnitTests(testing.AsyncTestCase):
         """Make sure the object was initialized properly."""
         self.assertEquals(self.translator.url, URL)
         self.assertEquals(self.translator.template, TEMPLATE)
+        self.assertTrue(self.translator._template is
+                        templates.parse(TEMPLATE))
         self.assertEquals(self.translator.auth_mode, AUTH_MODE)
         self.assertEquals(self.translator.auth_username, 'user')
         self.assertEquals(self.translator.auth_password, 'pass')
@@ -137,3 +149,254 @@ class PostTranslatorUnitTests(testing.AsyncTestCase):
 
         # Make sure the exception was indeed thrown
         self.assertTrue(threw_exception)
+
+
+class PostTranslatorRetryTests(testing.AsyncTestCase):
+    """Tests the retry behavior of the PostTranslator with a fake client."""
+
+    def setUp(self):
+        super(PostTranslatorRetryTests, self).setUp()
+        breaker.clearBreakers()
+
+    def tearDown(self):
+        breaker.clearBreakers()
+        super(PostTranslatorRetryTests, self).tearDown()
+
+    def _client(self, *errors):
+        """Returns a fake client pool that fails with the supplied errors"""
+        responses = list(errors)
+
+        def fetch(request):
+            future = concurrent.Future()
+            error = responses.pop(0) if responses else None
+            if error is None:
+                future.set_result(mock.Mock(reason='OK'))
+            else:
+                future.set_exception(error)
+            return future
+
+        client = mock.Mock()
+        client.fetch.side_effect = fetch
+        return client
+
+    @testing.gen_test
+    def testRetry(self):
+        """Test that failed POSTs are retried until they succeed"""
+        translator = web.PostTranslator(URL, CONTENT_TYPE, TEMPLATE,
+                                        max_retries='3', backoff_base='0.01',
+                                        jitter='0')
+        client = self._client(httpclient.HTTPError(599),
+                              httpclient.HTTPError(503))
+        recovered = web.POST_RECOVERED.labels(URL).value
+
+        request = httpclient.HTTPRequest('/', body='{}')
+        with mock.patch.object(web.clients, 'getPool', return_value=client):
+            result = yield translator.submit(request)
+
+        self.assertEquals({'success': True, 'message': 'OK'}, result)
+        self.assertEquals(3, client.fetch.call_count)
+        self.assertEquals(1, web.POST_RECOVERED.labels(URL).value - recovered)
+
+    @testing.gen_test
+    def testRetriesExhausted(self):
+        """Test that POSTs are given up on after max_retries"""
+        translator = web.PostTranslator(URL, CONTENT_TYPE, TEMPLATE,
+                                        max_retries=2, backoff_base=0.01)
+        client = self._client(*[httpclient.HTTPError(500)] * 5)
+        exhausted = web.POST_EXHAUSTED.labels(URL).value
+
+        request = httpclient.HTTPRequest('/', body='{}')
+        with mock.patch.object(web.clients, 'getPool', return_value=client):
+            result = yield translator.submit(request)
+
+        self.assertFalse(result['success'])
+        self.assertFalse('retryable' in result)
+        self.assertEquals(3, client.fetch.call_count)
+        self.assertEquals(1, web.POST_EXHAUSTED.labels(URL).value - exhausted)
+
+    @testing.gen_test
+    def testNoRetryOnClientError(self):
+        """Test that 4XX responses (other than 429) are not retried"""
+        translator = web.PostTranslator(URL, CONTENT_TYPE, TEMPLATE,
+                                        max_retries=2, backoff_base=0.01)
+        client = self._client(httpclient.HTTPError(404))
+
+        request = httpclient.HTTPRequest('/', body='{}')
+        with mock.patch.object(web.clients, 'getPool', return_value=client):
+            result = yield translator.submit(request)
+
+        self.assertFalse(result['success'])
+        self.assertFalse(result['retryable'])
+        self.assertEquals(1, client.fetch.call_count)
+
+    @testing.gen_test
+    def testBreakerFailsFast(self):
+        """Test that POSTs to a URL that keeps failing fail fast"""
+        translator = web.PostTranslator(URL, CONTENT_TYPE, TEMPLATE,
+                                        breaker_threshold=2)
+        client = self._client(*[httpclient.HTTPError(599)] * 5)
+
+        request = httpclient.HTTPRequest('/', body='{}')
+        with mock.patch.object(web.clients, 'getPool', return_value=client):
+            for i in xrange(3):
+                result = yield translator.submit(request)
+
+        # The third POST never made it to the client
+        self.assertEquals(2, client.fetch.call_count)
+        self.assertIn('Circuit breaker', result['message'])
+        self.assertEquals(breaker.OPEN, translator.breaker.state)
+
+    @testing.gen_test
+    def testBreakerIgnoresClientErrors(self):
+        """Test that 4XX responses don't count against the breaker"""
+        translator = web.PostTranslator(URL, CONTENT_TYPE, TEMPLATE,
+                                        breaker_threshold=1)
+        client = self._client(httpclient.HTTPError(400))
+
+        request = httpclient.HTTPRequest('/', body='{}')
+        with mock.patch.object(web.clients, 'getPool', return_value=client):
+            yield translator.submit(request)
+
+        self.assertEquals(breaker.CLOSED, translator.breaker.state)
+
+    def testBreakerDisabled(self):
+        """Test that a threshold of 0 disables the breaker"""
+        translator = web.PostTranslator(URL, CONTENT_TYPE, TEMPLATE,
+                                        breaker_threshold='0')
+        self.assertEquals(None, translator.breaker)
+
+
+class BatchingPostTranslatorTests(testing.AsyncTestCase):
+    """Tests the BatchingPostTranslator with a fake client."""
+
+    def setUp(self):
+        super(BatchingPostTranslatorTests, self).setUp()
+        self.bodies = []
+
+        def fetch(request):
+            self.bodies.append(request.body)
+            future = concurrent.Future()
+            future.set_result(mock.Mock(reason='OK'))
+            return future
+
+        self.client = mock.Mock()
+        self.client.fetch.side_effect = fetch
+        patcher = mock.patch.object(web.clients, 'getPool',
+                                    return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _request(self, name):
+        return httpclient.HTTPRequest(
+            '/', body='{"pusher": {"name": "%s", "email": "e"}}' % name)
+
+    @testing.gen_test
+    def testBatchSize(self):
+        """Test that a full batch is sent as a single POST"""
+        translator = web.BatchingPostTranslator(
+            URL, CONTENT_TYPE, '{"name": "{{body.pusher.name}}"}',
+            batch_size=10, linger=60)
+
+        results = yield [translator.submit(self._request(i))
+                         for i in xrange(100)]
+
+        self.assertEquals(10, len(self.bodies))
+        self.assertEquals([{'name': str(i)} for i in xrange(10)],
+                          json.loads(self.bodies[0]))
+        self.assertEquals([{'success': True, 'message': 'OK'}] * 100,
+                          results)
+
+    @testing.gen_test
+    def testBatchBytes(self):
+        """Test that a batch is sent once it reaches batch_bytes"""
+        translator = web.BatchingPostTranslator(
+            URL, CONTENT_TYPE, '"{{body.pusher.name}}"',
+            batch_bytes=10, linger=60)
+
+        yield [translator.submit(self._request('abcd')) for i in xrange(6)]
+        self.assertEquals(['["abcd","abcd"]'] * 3, self.bodies)
+
+    @testing.gen_test
+    def testLinger(self):
+        """Test that a partial batch is sent after the linger time"""
+        translator = web.BatchingPostTranslator(
+            URL, CONTENT_TYPE, '{{body.pusher.name}}', linger=0.01,
+            wrapper='{{count}}: {{{items}}}', separator='|')
+
+        yield [translator.submit(self._request(i)) for i in xrange(3)]
+        self.assertEquals(['3: 0|1|2'], self.bodies)
+
+    @testing.gen_test
+    def testBatchError(self):
+        """Test that an error building the batch POST fails every item"""
+        translator = web.BatchingPostTranslator(
+            URL, CONTENT_TYPE, '"{{body.pusher.name}}"', batch_size=2,
+            linger=60)
+
+        with mock.patch.object(web.clients, 'getPool',
+                               side_effect=ValueError('Bad pool')):
+            results = yield [translator.submit(self._request(i))
+                             for i in xrange(2)]
+
+        self.assertEquals([False, False], [r['success'] for r in results])
+        self.assertIn('Bad pool', results[0]['message'])
+
+
+class JsonMappingTranslatorTests(testing.AsyncTestCase):
+    """Tests the JsonMappingTranslator with a fake client."""
+
+    MAPPING = """
+        name: body.pusher.name
+        contact.email: body.pusher.email|str|nobody
+        commits: body.size|int|0
+        agent: headers.User-Agent
+    """
+
+    def setUp(self):
+        super(JsonMappingTranslatorTests, self).setUp()
+        self.requests = []
+
+        def fetch(request):
+            self.requests.append(request)
+            future = concurrent.Future()
+            future.set_result(mock.Mock(reason='OK'))
+            return future
+
+        client = mock.Mock()
+        client.fetch.side_effect = fetch
+        patcher = mock.patch.object(web.clients, 'getPool',
+                                    return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testInit(self):
+        """Test that the mapping is compiled, along with the body paths"""
+        translator = web.JsonMappingTranslator(URL, self.MAPPING)
+        self.assertEquals('application/json',
+                          translator.headers['Content-Type'])
+        self.assertEquals({'pusher': {'name': extract.ALL,
+                                      'email': extract.ALL},
+                           'size': extract.ALL},
+                          translator._paths.root)
+
+        self.assertRaises(mapping.MappingException,
+                          web.JsonMappingTranslator, URL, 'name: body|date')
+
+    @testing.gen_test
+    def testSubmit(self):
+        """Test that the mapped object is POSTed as escaped JSON"""
+        translator = web.JsonMappingTranslator(URL, self.MAPPING)
+        request = httpclient.HTTPRequest(
+            '/', method='POST', headers={'User-Agent': 'Tests'},
+            body='{"pusher": {"name": "Say \\"hi\\"\\nthere"}, "size": "3"}')
+
+        result = yield translator.submit(request)
+
+        self.assertEquals({'success': True, 'message': 'OK'}, result)
+        self.assertEquals(1, len(self.requests))
+        self.assertTrue(isinstance(self.requests[0].body, str))
+        self.assertEquals({'name': 'Say "hi"\nthere',
+                           'contact': {'email': 'nobody'},
+                           'commits': 3,
+                           'agent': 'Tests'},
+                          json.loads(self.requests[0].body))
@@ -1,14 +1,41 @@
 import logging
+import time
 
+from tornado import concurrent
 from tornado import gen
 from tornado import httpclient
+from tornado import httputil
+from tornado import ioloop
 
-import pystache
-
+from hooky import breaker
+from hooky import clients
+from hooky import jsonbackend
+from hooky import metrics
+from hooky import retry
 from hooky.translators import base
+from hooky.translators import extract
+from hooky.translators import mapping as mapping_module
+from hooky.translators import templates
 
 log = logging.getLogger(__name__)
 
+POST_ATTEMPTS = metrics.counter(
+    'hooky_post_attempts_total', 'Outbound POST attempts', labels=('url',))
+POST_RETRIES = metrics.counter(
+    'hooky_post_retries_total', 'Outbound POSTs scheduled for a retry',
+    labels=('url',))
+POST_RECOVERED = metrics.counter(
+    'hooky_post_recovered_total', 'Outbound POSTs that succeeded on a retry',
+    labels=('url',))
+POST_EXHAUSTED = metrics.counter(
+    'hooky_post_exhausted_total', 'Outbound POSTs that ran out of retries',
+    labels=('url',))
+BATCH_FLUSHES = metrics.counter(
+    'hooky_batch_flushes_total', 'Batches sent, by what triggered them',
+    labels=('reason',))
+BATCH_ITEMS = metrics.summary(
+    'hooky_batch_items', 'Number of items in each batch sent')
+
 
 class PostTranslator(base.BaseTranslator):
     """Translates a given webhook input into an outbound POST webhook.
@@ -17,21 +44,36 @@ class PostTranslator(base.BaseTranslator):
     This object will translate the hook, and then make the remote webhook call.
 
     Each Translator object is designed to only provide one type of translation,
-    which keeps the code relatively simple and well enxapsulated. Additionally,
-    since this object has to turn an arbitrary set of inputs into live Python
-    objects, its recommended that you create a new Translator object for every
-    single web hook submitted... this makes it less likely that we will end
-    up with object references that prevent garbage collection.
+    which keeps the code relatively simple and well enxapsulated. None of the
+    per-request data is stored on the object itself, so a single instance is
+    shared across all requests for a given translator definition.
     """
 
+    reentrant = True
+
     def __init__(self, url, content_type, template, auth=None,
-                 auth_mode='basic'):
+                 auth_mode='basic', max_retries=0, backoff_base=1,
+                 backoff_cap=60, jitter=1.0, max_clients=None,
+                 breaker_threshold=breaker.DEFAULT_THRESHOLD,
+                 breaker_cooldown=breaker.DEFAULT_COOLDOWN):
         """Initiates the object and sanity checks the config.
 
         args:
             url: String represnting the remote webhook URL
             content_type: String representing the content encoding
             template: The template to use as the remote webhook data
+            max_retries: Number of times to retry a failed POST (def: 0)
+            backoff_base: Seconds to wait before the first retry. The wait
+                          doubles with each retry after that.
+            backoff_cap: Maximum number of seconds to wait between retries
+            jitter: Fraction (0-1) of each wait that is randomized
+            max_clients: Number of requests in flight at once to the host in
+                         the URL (def: [general] max_clients)
+            breaker_threshold: Number of failed POSTs in a row to the URL
+                               before POSTs to it fail fast (def: 5, 0 to
+                               disable the circuit breaker)
+            breaker_cooldown: Seconds to fail fast for before trying the URL
+                              again (def: 30)
         """
 
         # Test our config before creating the object
@@ -43,6 +85,24 @@ class PostTranslator(base.BaseTranslator):
         self.template = template
         self.headers = {'Content-Type': content_type}
 
+        # Settings come straight from the config file, so may be strings
+        self.max_retries = int(max_retries)
+        self.backoff_base = float(backoff_base)
+        self.backoff_cap = float(backoff_cap)
+        self.jitter = float(jitter)
+        self.max_clients = int(max_clients or 0)
+
+        # Every translator POSTing to the same URL shares its breaker
+        self.breaker = None
+        if int(breaker_threshold) > 0:
+            self.breaker = breaker.getBreaker(url, int(breaker_threshold),
+                                              float(breaker_cooldown))
+
+        # Compile the template now so that each request only has to render
+        # it, and only has to parse the parts of the body it uses
+        self._template = templates.parse(template)
+        self._paths = extract.getPathTree(self._template)
+
         # If the auth information was supplied, turn it into a Tuple and save
         # it appropriately.
         try:
@@ -64,19 +124,37 @@ class PostTranslator(base.BaseTranslator):
             request: Tornado HTTPRequest Object
         """
         # Parse the incoming data into a dict that we can handle
-        data = self._request_to_dict(request)
+        data = yield self._loadData(request, self._paths)
 
         # Parse our incoming data against our template and generate the
         # outbound POST body string.
-        post_body = pystache.render(self.template, data)
+        post_body = yield self._render(self._template, data, request)
+
+        response = yield self._post(post_body)
+        raise gen.Return(response)
+
+    @gen.coroutine
+    def _post(self, post_body):
+        """POSTs a rendered body to our URL.
 
-        # Build our Async HTTP client object as well as the request object
-        http_client = httpclient.AsyncHTTPClient()
+        args:
+            post_body: The body to send, either unicode or an already
+                       encoded str
+
+        returns:
+            A result dictionary with 'success' and 'message' keys, and
+            'retryable' set to False if the POST was rejected outright
+        """
+        # Grab the client pool for our destination host, and build the
+        # request object
+        pool = clients.getPool(self.url, self.max_clients)
         http_request = httpclient.HTTPRequest(
             url=self.url,
             method='POST',
-            body=post_body.encode('UTF-8'),
-            headers=self.headers,
+            body=_encode(post_body),
+            # The HTTP client modifies the request headers in place, so give
+            # it a copy rather than our shared dict.
+            headers=httputil.HTTPHeaders(self.headers),
             auth_username=self.auth_username,
             auth_password=self.auth_password,
             auth_mode=self.auth_mode,
@@ -86,12 +164,315 @@ class PostTranslator(base.BaseTranslator):
 
         # Throw the request into the IOLoop for execution..
         try:
-            http_response = yield http_client.fetch(http_request)
+            http_response = yield self._fetch(pool, http_request)
             response = {'success': True,
                         'message': http_response.reason}
         except Exception, e:
             response = {'success': False,
                         'message': '2XX not returned: %s' % e}
+            if not self._isRetryable(e):
+                response['retryable'] = False
 
         log.debug('Response: %s' % response)
         raise gen.Return(response)
+
+    def _fetch(self, pool, http_request):
+        """Fetches a request, retrying it if it fails.
+
+        Retries are run by the shared RetryScheduler rather than by a
+        coroutine sleeping for each request, so waiting retries only cost a
+        heap entry each.
+
+        args:
+            pool: A hooky.clients.Pool object
+            http_request: The HTTPRequest to fetch
+
+        returns:
+            A Future that resolves to the HTTPResponse of the last attempt,
+            or raises its exception.
+        """
+        result = concurrent.TracebackFuture()
+        attempts = POST_ATTEMPTS.labels(self.url)
+        io_loop = ioloop.IOLoop.current()
+
+        def attempt(number):
+            # Don't bother waiting on a URL that is known to be down, just
+            # go straight to the retry (if any).
+            if self.breaker is not None and not self.breaker.allow():
+                future = concurrent.TracebackFuture()
+                future.set_exception(breaker.BreakerOpenException(
+                    self.breaker))
+                finished(number, future)
+                return
+
+            attempts.inc()
+            io_loop.add_future(pool.fetch(http_request),
+                               lambda future: finished(number, future))
+
+        def finished(number, future):
+            error = future.exception()
+            self._recordOutcome(error)
+            if error is None:
+                if number > 1:
+                    POST_RECOVERED.labels(self.url).inc()
+                result.set_result(future.result())
+                return
+
+            if not self._isRetryable(error):
+                result.set_exception(error)
+                return
+
+            if number > self.max_retries:
+                if self.max_retries:
+                    log.error('Giving up on %s after %s attempts: %s' %
+                              (self.url, number, error))
+                    POST_EXHAUSTED.labels(self.url).inc()
+                result.set_exception(error)
+                return
+
+            delay = retry.backoff(number, self.backoff_base,
+                                  self.backoff_cap, self.jitter)
+            log.warning('POST to %s failed (%s), retrying in %.2fs' %
+                        (self.url, error, delay))
+            POST_RETRIES.labels(self.url).inc()
+            retry.RetryScheduler.instance().schedule(
+                delay, lambda: attempt(number + 1))
+
+        attempt(1)
+        return result
+
+    def _recordOutcome(self, error):
+        """Tells the circuit breaker how a POST went.
+
+        Only failures that suggest the remote end is down or overloaded
+        count against it. A 4XX response means that it is up and answering.
+
+        args:
+            error: The exception raised by the HTTP client, or None
+        """
+        if (self.breaker is None or
+                isinstance(error, breaker.BreakerOpenException)):
+            return
+
+        if error is not None and self._isRetryable(error):
+            self.breaker.failure()
+        else:
+            self.breaker.success()
+
+    def _isRetryable(self, error):
+        """Returns True if a failed POST is worth trying again.
+
+        Connection errors, timeouts (reported as HTTP 599), rate limiting and
+        server side errors are retried. Any other 4XX response means that the
+        remote end rejected the request itself, so it is not.
+
+        args:
+            error: The exception raised by the HTTP client
+        """
+        if not isinstance(error, httpclient.HTTPError):
+            return True
+
+        return error.code >= 500 or error.code == 429
+
+
+class JsonMappingTranslator(PostTranslator):
+    """POSTs a JSON object built from a mapping, rather than a template.
+
+    Each key of the outbound object is mapped to a path in the inbound
+    webhook (see hooky.translators.mapping). The mapping is compiled once,
+    and only the paths it uses are parsed out of the body. The object is
+    then serialized with the configured json_backend (the standard library
+    unless one of the faster encoders is picked), so values are always
+    escaped properly, whatever they contain.
+    """
+
+    def __init__(self, url, mapping, content_type='application/json',
+                 template=None, **kwargs):
+        """Initiates the object and sanity checks the config.
+
+        args:
+            url: See PostTranslator
+            mapping: The mapping, one 'key: path|type|default' per line
+            content_type: See PostTranslator (def: application/json)
+            template: Ignored, there is no template to render
+            kwargs: Any other PostTranslator options
+
+        raises:
+            hooky.translators.mapping.MappingException if the mapping is
+            invalid
+        """
+        self.mapping = mapping
+        self._mapping = mapping_module.Mapping(mapping)
+
+        super(JsonMappingTranslator, self).__init__(
+            url, content_type, '', **kwargs)
+
+        # Nothing is rendered, so only parse the paths the mapping uses
+        self._template = None
+        self._paths = extract.buildPathTree(self._mapping.getBodyPaths())
+
+    @gen.coroutine
+    def submit(self, request):
+        """Maps an incoming webhook to a JSON object and POSTs it.
+
+        args:
+            request: Tornado HTTPRequest Object
+        """
+        data = yield self._loadData(request, self._paths)
+
+        latency = base.RENDER_SECONDS.labels(getattr(request, 'hook', ''),
+                                             self.__class__.__name__)
+        start = time.time()
+        post_body = jsonbackend.dumps(self._mapping.apply(data))
+        latency.observe(time.time() - start)
+
+        response = yield self._post(post_body)
+        raise gen.Return(response)
+
+
+class BatchingPostTranslator(PostTranslator):
+    """Collects several inbound webhooks into a single outbound POST.
+
+    Each inbound webhook is rendered with the template as usual, and the
+    result is added to a batch. The batch is sent once it holds batch_size
+    items, reaches batch_bytes bytes, or linger seconds after its first item
+    arrived, whichever happens first. The items are joined together with
+    the separator and rendered into the wrapper template as {{{items}}} (the
+    number of items is available as {{count}}). By default this builds a
+    JSON array.
+
+    Every inbound webhook in a batch gets the result of the batch POST. As
+    they may wait up to 'linger' seconds for it, this works best with hooks
+    that are set to 'mode: async'.
+    """
+
+    def __init__(self, url, content_type, template, batch_size=100,
+                 batch_bytes=1048576, linger=1.0, wrapper='[{{{items}}}]',
+                 separator=',', **kwargs):
+        """Initiates the object and sanity checks the config.
+
+        args:
+            url: See PostTranslator
+            content_type: See PostTranslator
+            template: See PostTranslator. Used to render each item.
+            batch_size: Maximum number of items in a batch
+            batch_bytes: Maximum size (in bytes) of the items in a batch
+            linger: Maximum number of seconds to hold on to a batch
+            wrapper: The template used to render the whole batch
+            separator: String placed between the items of a batch
+            kwargs: Any other PostTranslator options
+        """
+        super(BatchingPostTranslator, self).__init__(
+            url, content_type, template, **kwargs)
+
+        self.batch_size = int(batch_size)
+        self.batch_bytes = int(batch_bytes)
+        self.linger = float(linger)
+        self.wrapper = wrapper
+        self.separator = separator.decode('UTF-8')
+        self._wrapper = templates.parse(wrapper)
+
+        # The batch currently being filled up
+        self._batch = None
+
+    @gen.coroutine
+    def submit(self, request):
+        """Translates an incoming webhook and adds it to the current batch.
+
+        args:
+            request: Tornado HTTPRequest Object
+
+        returns:
+            The result of the POST of the batch this webhook ended up in
+        """
+        data = yield self._loadData(request, self._paths)
+        item = yield self._render(self._template, data, request)
+
+        response = yield self._add(item)
+        raise gen.Return(response)
+
+    def _add(self, item):
+        """Adds a rendered item to the current batch, starting one if needed.
+
+        args:
+            item: The rendered (unicode) item
+
+        returns:
+            A Future that resolves to the result of the batch POST
+        """
+        if self._batch is None:
+            io_loop = ioloop.IOLoop.current()
+            self._batch = Batch(io_loop)
+            self._batch.timeout = io_loop.add_timeout(
+                time.time() + self.linger, lambda: self._flush('linger'))
+
+        future = self._batch.add(item)
+
+        if len(self._batch.items) >= self.batch_size:
+            self._flush('size')
+        elif self._batch.bytes >= self.batch_bytes:
+            self._flush('bytes')
+
+        return future
+
+    def _flush(self, reason):
+        """Sends the current batch off, and starts a new one.
+
+        args:
+            reason: Why the batch is being sent (size, bytes or linger)
+        """
+        batch, self._batch = self._batch, None
+        if batch is None:
+            return
+
+        batch.io_loop.remove_timeout(batch.timeout)
+        BATCH_FLUSHES.labels(reason).inc()
+        BATCH_ITEMS.observe(len(batch.items))
+        log.debug('Sending batch of %s items to %s (%s)' %
+                  (len(batch.items), self.url, reason))
+
+        body = templates.render(self._wrapper, {
+            'items': self.separator.join(batch.items),
+            'count': len(batch.items)})
+        batch.io_loop.add_future(self._post(body), batch.finish)
+
+
+class Batch(object):
+    """Items waiting to be sent by a BatchingPostTranslator."""
+
+    def __init__(self, io_loop):
+        self.io_loop = io_loop
+        self.items = []
+        self.futures = []
+        self.bytes = 0
+        self.timeout = None
+
+    def add(self, item):
+        """Adds an item, returning a Future for the result of the batch"""
+        future = concurrent.TracebackFuture()
+        self.items.append(item)
+        self.futures.append(future)
+        self.bytes += len(item.encode('UTF-8'))
+        return future
+
+    def finish(self, future):
+        """Hands the result of the batch POST to every item in it"""
+        try:
+            response = future.result()
+        except Exception, e:
+            # _post() reports failed POSTs itself, so this is a failure to
+            # even build the request. Don't leave the items hanging on it.
+            log.exception('Unable to send batch of %s items' %
+                          len(self.items))
+            response = {'success': False,
+                        'message': 'Unable to send batch: %s' % e}
+
+        for waiter in self.futures:
+            waiter.set_result(response)
+
+
+def _encode(body):
+    """Returns a body as UTF-8 bytes, encoding it only if it is unicode"""
+    if isinstance(body, unicode):
+        return body.encode('UTF-8')
+    return body
@@ -14,7 +14,7 @@
 
 """
 Common location for utility functions used by various parts of the
-Hooky code. getXXXPath(), setupLogging, etc.
+Hooky code. getXXXPath(), setupLogging, withTimeout(), etc.
 """
 
 __author__ = 'Matt Wise (matt@nextdoor.com)'
@@ -22,18 +22,27 @@ __author__ = 'Matt Wise (matt@nextdoor.com)'
 from logging import handlers
 import os
 import logging
+import time
+
+from tornado import concurrent
+from tornado import ioloop
 
 log = logging.getLogger(__name__)
 
 # Constants for some of the utilities below
 STATIC_PATH_NAME = 'static'
 
+# Cache of dotted path strings to the objects strToClass() resolved them to.
+_classes = {}
+
 
 def strToClass(string):
     """Method that converts a string name into a usable Class name
 
     This is used to take the 'translator' config value from the
-    Config object and convert it into a valid object.
+    Config object and convert it into a valid object. Results are
+    cached, so only the first call for any given string does any real
+    work. Use clearClassCache() to drop the cache (eg. on config reload).
 
     args:
         cls: String name of the wanted class and package.
@@ -42,23 +51,84 @@ def strToClass(string):
     returns:
         A reference to the actual Class to be instantiated
     """
+    try:
+        return _classes[string]
+    except KeyError:
+        pass
+
     # Split the string up. The last element is the Class, the rest is
     # the package name.
-    log.debug('Translating "%s" into a Module and Class...' % string)
+    log.debug('Translating "%s" into a Module and Class...', string)
     string_elements = string.split('.')
     class_name = string_elements.pop()
     module_name = '.'.join(string_elements)
-    log.debug('Module: %s, Class: %s' % (module_name, class_name))
+    log.debug('Module: %s, Class: %s', module_name, class_name)
 
     # load the module, will raise ImportError if module cannot be loaded
     m = __import__(module_name, globals(), locals(), class_name)
     # get the class, will raise AttributeError if class cannot be found
     c = getattr(m, class_name)
 
-    log.debug('Class Reference: %s' % c)
+    log.debug('Class Reference: %s', c)
+    _classes[string] = c
     return c
 
 
+def clearClassCache():
+    """Empties the strToClass() cache.
+
+    Should be called whenever the configuration is reloaded, so that newly
+    referenced (or reloaded) classes are resolved again.
+    """
+    log.debug('Clearing %s cached class references', len(_classes))
+    _classes.clear()
+
+
+class TimeoutError(Exception):
+    """Raised by withTimeout() when a Future does not finish in time"""
+
+
+def withTimeout(future, timeout, io_loop=None):
+    """Wraps a Future so that it fails if it takes too long.
+
+    The wrapped Future is not cancelled (Tornado has no way to do that), its
+    result is simply ignored if it arrives after the timeout.
+
+    args:
+        future: The Future to wait on
+        timeout: Number of seconds to wait
+        io_loop: The IOLoop to schedule the timeout on (def: current)
+
+    returns:
+        A new Future that resolves with the result of the supplied one, or
+        fails with TimeoutError after timeout seconds.
+    """
+    io_loop = io_loop or ioloop.IOLoop.current()
+    result = concurrent.TracebackFuture()
+
+    def onTimeout():
+        if not result.done():
+            result.set_exception(
+                TimeoutError('Timed out after %s seconds' % timeout))
+
+    def onDone(future):
+        io_loop.remove_timeout(handle)
+        if result.done():
+            return
+        # Not every Future type keeps the original traceback around.
+        exc_info = getattr(future, 'exc_info', lambda: None)()
+        if exc_info is not None:
+            result.set_exc_info(exc_info)
+        elif future.exception() is not None:
+            result.set_exception(future.exception())
+        else:
+            result.set_result(future.result())
+
+    handle = io_loop.add_timeout(time.time() + timeout, onTimeout)
+    io_loop.add_future(future, onDone)
+    return result
+
+
 def getRootPath():
     """Returns the fully qualified path to our root package path.
 
@@ -97,16 +167,16 @@ def setupLogger(level=logging.WARNING, syslog=None):
     # Set the default logging handler to stream to console..
     handler = logging.StreamHandler()
 
-    # Get our PID .. used below in the log line format.
-    pid = os.getpid()
-    format = '%(asctime)-15s [' + str(pid) + '] [%(name)s] ' \
+    # The PID is looked up for each log line, rather than once here, so that
+    # forked worker processes (see hooky.supervisor) log their own.
+    format = '%(asctime)-15s [%(process)d] [%(name)s] ' \
              '[%(funcName)s]: (%(levelname)s) %(message)s'
 
     # If syslog enabled, then override the logging handler to go to syslog.
     if syslog is not None:
         handler = handlers.SysLogHandler(address=('127.0.0.1', 514),
                                          facility=syslog)
-        format = '[' + str(pid) + '] [%(name)s] ' \
+        format = '[%(process)d] [%(name)s] ' \
                  '[%(funcName)s]: (%(levelname)s) %(message)s'
 
     formatter = logging.Formatter(format)
@@ -17,31 +17,205 @@
 
 __author__ = 'matt@nextdoor.com (Matt Wise)'
 
+import glob
 import logging
+import os
 
 from tornado import web
 
+from hooky import clients
+from hooky import delivery
+from hooky import executor
+from hooky import journal
+from hooky import jsonbackend
+from hooky import shutdown
 from hooky import utils
+from hooky.translators import extract
 from hooky.web import hook
+from hooky.web import metrics
+from hooky.web import pages as pages_module
 from hooky.web import root
 
 log = logging.getLogger(__name__)
 
 
-def getApplication(config):
+def getJournal(general, task_id=None):
+    """Builds the delivery journal, if one is configured.
+
+    args:
+        general: Dictionary of settings from the [general] config section
+        task_id: The worker number, if running as several processes. Each
+                 worker keeps its own journal in a subdirectory.
+
+    returns:
+        An unopened hooky.journal.Journal object, or None
+    """
+    path = general.get('journal')
+    if not path:
+        return None
+
+    if task_id is not None:
+        path = os.path.join(path, 'worker-%s' % task_id)
+
+    return journal.Journal(
+        path,
+        fsync=general.get('journal_fsync', journal.DEFAULT_FSYNC),
+        fsync_interval=float(general.get('journal_fsync_interval',
+                                         journal.DEFAULT_FSYNC_INTERVAL)),
+        segment_bytes=int(general.get('journal_segment_bytes',
+                                      journal.DEFAULT_SEGMENT_BYTES)))
+
+
+def getOrphanedJournals(general, task_id=None, processes=1):
+    """Lists the journals that no worker will replay, for this one to adopt.
+
+    Running as a single process, the journal is kept in the 'journal'
+    directory itself, and running as several, each worker keeps its own in
+    a 'worker-N' subdirectory of it. The journals that the current layout
+    doesn't use (the single process one, or those of workers that are no
+    longer started) are all adopted by worker 0, or by the single process.
+
+    args:
+        general: Dictionary of settings from the [general] config section
+        task_id: The worker number, if running as several processes
+        processes: Number of worker processes
+
+    returns:
+        A list of journal directories
+    """
+    path = general.get('journal')
+    if not path or task_id not in (None, 0):
+        return []
+
+    paths = []
+    if task_id is not None:
+        paths.append(path)
+
+    for worker_path in sorted(glob.glob(os.path.join(path, 'worker-*'))):
+        try:
+            number = int(os.path.basename(worker_path)[7:])
+        except ValueError:
+            continue
+        if task_id is None or number >= processes:
+            paths.append(worker_path)
+    return paths
+
+
+def configureJSON(general):
+    """Sets the library JSON bodies (and the journal) are parsed with"""
+    jsonbackend.configure(
+        general.get('json_backend', jsonbackend.DEFAULT_BACKEND))
+
+
+def configureExecutor(general):
+    """Sets up where large requests are parsed and rendered"""
+    executor.configure(
+        kind=general.get('executor', executor.DEFAULT_KIND),
+        workers=general.get('executor_workers'),
+        threshold=general.get('executor_threshold',
+                              executor.DEFAULT_THRESHOLD))
+
+
+def configureQueue(general, queue):
+    """Sizes the queue used by 'mode: async' hooks, and sets its retries"""
+    queue.workers = int(general.get('queue_workers',
+                                    delivery.DEFAULT_WORKERS))
+    queue.size = int(general.get('queue_size', 0))
+    queue.retries = int(general.get('journal_retries',
+                                    delivery.DEFAULT_RETRIES))
+    queue.retry_backoff = float(general.get('journal_retry_backoff',
+                                            delivery.DEFAULT_RETRY_BACKOFF))
+
+
+# [general] settings that only take effect when Hooky is restarted
+RESTART_ONLY = ('http_client', 'max_clients', 'journal', 'journal_fsync',
+                'journal_fsync_interval', 'journal_segment_bytes',
+                'selective_parsing', 'page_cache', 'lag_interval',
+                'lag_window', 'slow_callback_threshold', 'shutdown_timeout',
+                'reload_interval')
+
+
+def reconfigure(application, old, new):
+    """Applies the [general] settings that a config reload changed.
+
+    The JSON backend, executor and queue settings are applied right away.
+    Changes to any of the RESTART_ONLY settings are logged and ignored.
+
+    args:
+        application: The tornado Application built by getApplication()
+        old: Dictionary of [general] settings before the reload
+        new: Dictionary of [general] settings after the reload
+    """
+    def changed(*names):
+        return [name for name in names if old.get(name) != new.get(name)]
+
+    if changed('json_backend'):
+        configureJSON(new)
+    if changed('executor', 'executor_workers', 'executor_threshold'):
+        configureExecutor(new)
+    if changed('queue_workers', 'queue_size', 'journal_retries',
+               'journal_retry_backoff'):
+        configureQueue(new, application.settings['queue'])
+
+    for name in changed(*RESTART_ONLY):
+        log.warning('The %s setting has changed, but only takes effect '
+                    'once Hooky is restarted' % name)
+
+
+def getApplication(config, task_id=None, processes=1):
+    # Outbound HTTP client settings, shared by all of the client pools
+    general = config.getGeneral()
+    clients.configure(
+        backend=general.get('http_client', clients.DEFAULT_BACKEND),
+        max_clients=general.get('max_clients', clients.DEFAULT_MAX_CLIENTS))
+
+    configureJSON(general)
+    configureExecutor(general)
+
+    # Whether translators parse only the parts of bodies their templates use
+    extract.configure(general.get('selective_parsing', True))
+
+    # Build the queue used by 'mode: async' hooks. Its settings come from the
+    # [general] section of the config too.
+    queue = delivery.DeliveryQueue(journal=getJournal(general, task_id))
+    configureQueue(general, queue)
+
+    # Counts the hook requests in progress, for a graceful shutdown
+    tracker = shutdown.Tracker()
+
+    # Pick up whatever was left undelivered the last time we ran
+    if queue.journal is not None:
+        records = queue.journal.open()
+        for path in getOrphanedJournals(general, task_id, processes):
+            records.extend(queue.journal.adopt(path))
+        queue.replay(config, records)
+
+    # One template Loader for every handler, with the templates compiled now
+    # rather than on the first request for each page
+    pages = pages_module.Pages(cache=general.get('page_cache', True))
+    pages.precompile()
+
     # Default list of URLs provided by Hooky and links to their classes
     URLS = [
         # Handle initial web clients at the root of our service.
-        (r"/", root.RootHandler),
+        (r"/", root.RootHandler, {'pages': pages}),
 
         # Provide access to our static content
         (r'/static/(.*)',
          web.StaticFileHandler,
          {'path': utils.getStaticPath()}),
 
+        # Service metrics, in the Prometheus text format
+        (r"/metrics", metrics.MetricsHandler),
+
         # Handle incoming hook requests
-        (r"/hook", hook.HookRootHandler, {'config': config}),
-        (r"/hook/(.*)", hook.HookHandler, {'config': config}),
+        (r"/hook", hook.HookRootHandler, {'config': config, 'pages': pages}),
+        (r"/hook/(.*)", hook.HookHandler,
+         {'config': config, 'queue': queue, 'tracker': tracker,
+          'pages': pages}),
     ]
-    application = web.Application(URLS)
+
+    # The queue and tracker are handed back in the settings, so that the
+    # server can be shut down gracefully. See hooky.shutdown.
+    application = web.Application(URLS, queue=queue, tracker=tracker)
     return application
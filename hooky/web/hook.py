@@ -31,36 +31,134 @@ __author__ = 'matt@nextdoor.com (Matt Wise)'
 import logging
 
 from tornado import gen
-from tornado import template
+from tornado import httputil
 from tornado import web
 
-from hooky import utils
+from hooky import breaker
+from hooky import delivery
+from hooky import journal
+from hooky import metrics
+from hooky import shutdown
+from hooky.config.base import ConfigException
+from hooky.translators import context
+from hooky.translators import parsers
+from hooky.web import pages as pages_module
 
 log = logging.getLogger(__name__)
 
+HOOK_REQUESTS = metrics.counter(
+    'hooky_hook_requests_total', 'Inbound hook requests, by response code',
+    labels=('hook', 'code'))
+HOOK_SECONDS = metrics.histogram(
+    'hooky_hook_request_seconds', 'Time taken to respond to each hook',
+    labels=('hook',))
+HOOK_BYTES = metrics.histogram(
+    'hooky_hook_body_bytes', 'Size of the request bodies sent to each hook',
+    labels=('hook',), buckets=metrics.BYTE_BUCKETS)
+
 
 class HookConfigException(Exception):
     """Raised when an individual Hook is configured improperly."""
 
 
+# Whether this version of tornado can hand us request bodies as they arrive
+# (tornado 4.0 and later). Older versions always read the whole body first.
+STREAMING = hasattr(web, 'stream_request_body')
+
+
+class BodyReader(object):
+    """Collects a request body as it streams in, parsing it on the way.
+
+    Bodies with a feed parser (see hooky.translators.parsers) are parsed a
+    chunk at a time as they arrive. If that fails, the body is left to be
+    parsed as normal once it is all in.
+    """
+
+    def __init__(self, content_type, limit=0):
+        """Sets up the reader.
+
+        args:
+            content_type: Raw Content-Type header of the request, or None
+            limit: Largest body, in bytes, to collect (def: 0, no limit)
+        """
+        self.size = 0
+        self.limit = limit
+        self.parsed = None
+        self._chunks = []
+        self._feed = parsers.getFeedParser(content_type)
+
+    @property
+    def overflowed(self):
+        """Whether the body has gone over the limit"""
+        return bool(self.limit) and self.size > self.limit
+
+    def feed(self, chunk):
+        """Adds the next chunk of the body.
+
+        Once the body goes over the limit, the rest of it is counted but
+        thrown away, so that the request can still be answered with a 413.
+        """
+        self.size += len(chunk)
+        if self.overflowed:
+            self._chunks = []
+            self._feed = None
+            return
+
+        self._chunks.append(chunk)
+
+        if self._feed is not None:
+            try:
+                self._feed.feed(chunk)
+            except parsers.ParseError, e:
+                log.debug('Body could not be parsed as it arrived: %s' % e)
+                self._feed = None
+
+    def close(self):
+        """Finishes the body off.
+
+        returns:
+            The whole body. If it was parsed as it arrived, the result is
+            left in self.parsed.
+        """
+        if self._feed is not None:
+            try:
+                self.parsed = self._feed.close()
+            except parsers.ParseError, e:
+                log.debug('Body could not be parsed as it arrived: %s' % e)
+            self._feed = None
+
+        body, self._chunks = ''.join(self._chunks), []
+        return body
+
+
 class HookRootHandler(web.RequestHandler):
     """Serves up the /hook index page"""
 
-    def initialize(self, config):
+    def initialize(self, config, pages=None):
         """Stores the supplied config object for later use
 
         args:
             config: A hooky.config.base.BaseConfig conforming object
+            pages: A hooky.web.pages.Pages object to render with
+                   (def: Pages.instance())
         """
         log.debug('%s initialized %s with %s' % (self.__class__, self, config))
         self.config = config
-        self.loader = template.Loader('%s/templates' %
-                                      utils.getStaticPath())
+        if pages is None:
+            pages = pages_module.Pages.instance()
+        self.pages = pages
 
     def get(self):
         """Render the hook list web page"""
         hooks = self.config.getHookList()
-        self.write(self.loader.load('hook/index.tmpl').generate(hooks=hooks))
+        breakers = breaker.getBreakers()
+
+        # The page is only rendered again once the hooks or the breakers
+        # shown on it change
+        key = (tuple(hooks),
+               tuple((b.name, b.state, b.failures) for b in breakers))
+        self.write(self.pages.render('hook/index.tmpl', key=key,
+                                     hooks=hooks, breakers=breakers))
 
 
 class HookHandler(web.RequestHandler):
@@ -71,65 +169,207 @@ class HookHandler(web.RequestHandler):
     configured Translator objects.
 
     A single HookHandler is created to handle each inbound web request. The
-    appropriate Translator object is instantiated and called, and the client
-    waits until the Translator object is done doing its work before being given
-    a proper response code.
+    appropriate Translator objects are built and all of them are called
+    concurrently. The client waits until every Translator object is done
+    doing its work before being given a proper response code.
+
+    Optional settings in the hook section:
+
+      concurrency: Maximum number of Translators running at once for a
+                   single request (def: 0, no limit)
+      timeout: Number of seconds each Translator has to finish before it
+               is considered failed (def: 0, no timeout)
+      mode: 'sync' (the default) waits for the Translators as described
+            above. 'async' queues the request up on the DeliveryQueue and
+            responds right away, without waiting for the Translators.
+      max_body_bytes: Largest request body accepted, in bytes (def: the
+                      [general] max_body_bytes setting, or 0 for no limit)
+
+    Where tornado supports it (4.0 and later), request bodies are streamed
+    in, so that one over max_body_bytes is rejected before it is read, and
+    XML bodies are parsed as they arrive.
 
     Response Codes:
       200: All translations happened sucessfully
-      502: At least one translation failed 'upstream'
-      503: An internal application error occurred during translation
-
+      202: The request was queued for delivery (async mode)
+      207: Some translations failed, and some succeeded
+      413: The request body is larger than max_body_bytes
+      502: All translations failed
+      503: The delivery queue is full, or the request could not be
+           journaled (async mode)
     """
-    def initialize(self, config):
+    def initialize(self, config, queue=None, tracker=None, pages=None):
         """Stores the supplied config object for later use
 
         args:
             config: A hooky.config.base.BaseConfig conforming object
+            queue: A hooky.delivery.DeliveryQueue object for async hooks
+                   (def: DeliveryQueue.instance())
+            tracker: A hooky.shutdown.Tracker object to count requests with
+                     (def: Tracker.instance())
+            pages: A hooky.web.pages.Pages object to render with
+                   (def: Pages.instance())
         """
         log.debug('%s initialized %s with %s' % (self.__class__, self, config))
         self.config = config
-        self.loader = template.Loader('%s/templates' %
-                                      utils.getStaticPath())
+        # Both of these are falsy when empty, so check for None explicitly
+        if queue is None:
+            queue = delivery.DeliveryQueue.instance()
+        if tracker is None:
+            tracker = shutdown.Tracker.instance()
+        self.queue = queue
+        self.tracker = tracker
 
-    @gen.coroutine
-    def submitToTranslators(self, translators):
-        """Submits the work to the translators and handles the response.
+        if pages is None:
+            pages = pages_module.Pages.instance()
+        self.pages = pages
+
+        # Name of the hook being requested, once we know it exists
+        self.hook = None
 
-        This method calls out to the translator[0] object submit() method
-        and waits (asyncronously) for a response. When the response comes,
-        it parses it for success/failure and returns the appropriate data
-        to the end-user.
+        # Collects the body, when tornado streams it in. See prepare().
+        self.reader = None
+        self.parsed = None
+
+    def getBodyLimit(self, route):
+        """Returns the largest body, in bytes, accepted for a hook.
 
         args:
-            translators: A dictionary of Translator objects
+            route: The hooky.config.base.HookRoute object for the hook, or
+                   None if it does not exist
 
         returns:
-            response: A dictionary that contains a 'success' and 'message'
-                      key that describe the results. The 'success' key must
-                      be a Boolean. eg:
-
-                      {'success': True, 'message': 'OK' }
+            The limit, or 0 for no limit
         """
-        response = yield translators[0].submit(self.request)
+        limit = self.config.getGeneral().get('max_body_bytes', 0)
+        if route is not None:
+            limit = route.options.get('max_body_bytes', limit)
+        return int(limit or 0)
 
-        log.debug('Translator response: %s' % response)
+    def prepare(self):
+        """Turns away bodies that are too large, before they are handled.
+
+        With a streaming tornado this runs before the body has been read,
+        so a Content-Length over the limit is rejected without reading it.
+        """
         try:
-            success = response['success']
-            message = response['message']
-        except AttributeError, e:
-            log.error('Translator returned invalid results: %s' % e)
-            self.send_error(503)
-
-        if not success:
-            log.error('Translator returned failure: %s' % success)
+            route = self.config.getRoute(self.path_args[0])
+        except (ConfigException, IndexError):
+            # Unknown hooks are dealt with once the request is handled
+            route = None
+        limit = self.getBodyLimit(route)
+
+        length = self.request.headers.get('Content-Length')
+        if not STREAMING and self.request.body is not None:
+            length = len(self.request.body)
+
+        if limit and length is not None and int(length) > limit:
+            if route is not None:
+                self.hook = route.name
+            self._rejectBody(length, limit)
+            return
+
+        if STREAMING:
+            # Bodies sent without a Content-Length are counted as they come
+            # in, and turned away once they are all in. Tornado's own
+            # max_body_size would answer those with a 400 instead.
+            self.reader = BodyReader(self.request.headers.get('Content-Type'),
+                                     limit)
+
+    def _rejectBody(self, size, limit):
+        """Responds with a 413, for a body over the limit"""
+        log.warning('Rejected a %s byte body for %s, the limit is %s' %
+                    (size, self.request.path, limit))
+        self.set_status(413)
+        self.finish('Results: Request body is larger than %s bytes ' % limit)
+
+    def data_received(self, chunk):
+        """Handles the next chunk of a streamed request body"""
+        self.reader.feed(chunk)
+
+    def _readBody(self):
+        """Puts the streamed body back on the request, as tornado would have.
+
+        returns:
+            The body, if it was parsed as it arrived, or None
+        """
+        if self.reader is None:
+            return None
+
+        request = self.request
+        request.body = self.reader.close()
+        if request.method in ('POST', 'PATCH', 'PUT'):
+            httputil.parse_body_arguments(
+                request.headers.get('Content-Type', ''), request.body,
+                request.body_arguments, request.files)
+            for name, values in request.body_arguments.iteritems():
+                request.arguments.setdefault(name, []).extend(values)
+
+        parsed, self.reader = self.reader.parsed, None
+        return parsed
+
+    @gen.coroutine
+    def submitToTranslators(self, route):
+        """Submits the work to the translators and handles the response.
+
+        This method calls out to the submit() method of every Translator
+        configured for the hook, and waits (asyncronously) for all of them to
+        respond. When they have, it aggregates their success/failure and
+        returns the appropriate data to the end-user.
+
+        args:
+            route: A hooky.config.base.HookRoute object
+        """
+        # Wrap the request up once, so that every Translator shares the
+        # same parsed body rather than parsing it again itself.
+        request = context.RequestContext(self.request, route.name,
+                                         self.parsed)
+        results = yield delivery.dispatch(route, request)
+
+        succeeded = len([r for r in results if r['success']])
+        if succeeded == len(results):
+            self.set_status(200)
+        elif succeeded == 0:
+            log.error('All translators returned failure: %s' % results)
             self.set_status(502)
         else:
-            self.set_status(200)
+            log.error('Some translators returned failure: %s' % results)
+            self.set_status(207, reason='Multi-Status')
 
-        self.write("Results: %s " % message)
+        if len(results) == 1:
+            self.write("Results: %s " % results[0]['message'])
+        else:
+            self.write("Results:\n")
+            names = [spec.name for spec in route.translators]
+            for name, result in zip(names, results):
+                status = 'OK' if result['success'] else 'FAILED'
+                self.write("%s (%s): %s\n" %
+                           (name, status, result['message']))
         self.finish()
 
+    @gen.coroutine
+    def queueForTranslators(self, route):
+        """Queues the work up for the translators and responds immediately.
+
+        If the queue is journaled, the response is held back until the
+        request has been committed to disk.
+
+        args:
+            route: A hooky.config.base.HookRoute object
+        """
+        try:
+            yield self.queue.put(
+                route, context.RequestContext(self.request, route.name,
+                                              self.parsed))
+        except (delivery.QueueFullException, journal.JournalException), e:
+            log.error('Unable to queue request for %s: %s' % (route.name, e))
+            self.set_status(503)
+            self.finish("Results: %s " % e)
+            return
+
+        self.set_status(202)
+        self.finish("Results: Queued ")
+
     @gen.coroutine
     def handleInitialRequest(self, hook):
         """Handle the HTTPRequest object and serve up the appropriate response.
@@ -138,8 +378,36 @@ class HookHandler(web.RequestHandler):
         up a basic HTML form for the hook requested . Otherwise, we pass the
         request on to the translators configured for this webhook.
         """
-        # As long as a hook name is supplied, get the list of translators
-        translators = self.config.getHookConfig(hook)['translators']
+        # Count the request until it is done, so that a shutdown can wait
+        # for it to finish.
+        self.tracker.start()
+        try:
+            yield self._handleInitialRequest(hook)
+        finally:
+            self.tracker.finish()
+
+    @gen.coroutine
+    def _handleInitialRequest(self, hook):
+        # We're shutting down, so don't wait around for any more requests on
+        # this connection once this one is done.
+        if self.tracker.closing:
+            self.set_header('Connection', 'close')
+            self.request.connection.no_keep_alive = True
+
+        # As long as a hook name is supplied, look up its pre-built route
+        route = self.config.getRoute(hook)
+        self.hook = route.name
+
+        # A streamed body with no Content-Length can only be measured once
+        # it has all arrived
+        if self.reader is not None and self.reader.overflowed:
+            self._rejectBody(self.reader.size, self.reader.limit)
+            self.reader = None
+            return
+
+        # Put a streamed body back together, keeping it if it was parsed on
+        # the way in
+        self.parsed = self._readBody()
 
         # Determine whether or not individual arguments were passed via the
         # GET call. If no arguments were passed, render a generic page where
@@ -147,12 +415,27 @@ class HookHandler(web.RequestHandler):
         #
         if ((self.request.arguments == {} or self.request.arguments is None)
                 and self.request.body == ''):
-            data = {'name': hook, 'translators': translators}
-            self.write(self.loader.load('hook/submit.tmpl').generate(**data))
+            data = {'name': hook, 'translators': route.getTranslators()}
+            self.write(self.pages.render('hook/submit.tmpl', **data))
+            return
+
+        if route.options.get('mode', 'sync') == 'async':
+            log.debug('Queueing supplied data for translators: %s' % route)
+            yield self.queueForTranslators(route)
+            return
+
+        log.debug('Passing supplied data to translators: %s' % route)
+        yield self.submitToTranslators(route)
+
+    def on_finish(self):
+        # Only hooks that exist are counted, so that requests for random
+        # names can't create any number of metrics.
+        if self.hook is None:
             return
 
-        log.debug('Passing supplied data to translators: %s' % translators)
-        yield self.submitToTranslators(translators)
+        HOOK_REQUESTS.labels(self.hook, self.get_status()).inc()
+        HOOK_SECONDS.labels(self.hook).observe(self.request.request_time())
+        HOOK_BYTES.labels(self.hook).observe(len(self.request.body or ''))
 
     @gen.coroutine
     def get(self, hook):
@@ -169,3 +452,7 @@ class HookHandler(web.RequestHandler):
     def put(self, hook):
         # Pass the args into our translator
         yield self.handleInitialRequest(hook)
+
+
+if STREAMING:
+    HookHandler = web.stream_request_body(HookHandler)
@@ -0,0 +1,32 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc
+
+"""
+Serves the service metrics to Prometheus (or anything else that can read its
+text format) at /metrics.
+"""
+
+__author__ = 'matt@nextdoor.com (Matt Wise)'
+
+from tornado import web
+
+from hooky import metrics
+
+
+class MetricsHandler(web.RequestHandler):
+    """Serves up the /metrics page"""
+
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4')
+        self.write(metrics.expose())
@@ -0,0 +1,113 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Copyright 2013 Nextdoor.com, Inc.
+
+"""
+Renders the HTML pages of the web interface.
+
+A tornado template Loader compiles each template the first time it is
+loaded, and keeps the compiled version for next time. A single Pages object
+(and so a single Loader) is built for the whole application and handed to
+every handler, so that templates are only ever compiled once. They are all
+compiled up front by precompile(), rather than on the first request.
+
+Pages that only change along with some key (the /hook index only changes
+when the hooks or the state of the circuit breakers do) can also be kept
+once rendered, and served again for as long as the key stays the same.
+"""
+
+__author__ = 'Matt Wise (matt@nextdoor.com)'
+
+import logging
+
+from tornado import template
+
+from hooky import metrics
+from hooky import utils
+
+log = logging.getLogger(__name__)
+
+# Templates used by the web handlers, compiled by precompile()
+TEMPLATES = ('index.tmpl', 'hook/index.tmpl', 'hook/submit.tmpl')
+
+PAGE_RENDERS = metrics.counter(
+    'hooky_page_renders_total', 'Web pages rendered, by whether cached',
+    labels=('template', 'cached'))
+
+
+class Pages(object):
+    """Renders templates from one shared Loader, caching pages by key."""
+
+    def __init__(self, path=None, cache=True):
+        """Sets up the Loader. Call precompile() to compile the templates.
+
+        args:
+            path: Directory to load templates from
+                  (def: the templates in our static path)
+            cache: Whether to keep rendered pages that are given a key
+        """
+        if path is None:
+            path = '%s/templates' % utils.getStaticPath()
+        self.loader = template.Loader(path)
+        self.cache = cache
+
+        # Template name -> (key, page) of the last page rendered with a key
+        self._rendered = {}
+
+    @classmethod
+    def instance(cls):
+        """Returns a global Pages instance."""
+        if not hasattr(cls, '_instance'):
+            cls._instance = cls()
+        return cls._instance
+
+    def precompile(self, names=TEMPLATES):
+        """Compiles templates now, rather than when they are first used.
+
+        args:
+            names: Names of the templates to compile
+
+        raises:
+            IOError if a template is missing, or tornado's ParseError if one
+            is broken.
+        """
+        for name in names:
+            self.loader.load(name)
+        log.debug('Precompiled templates: %s' % ', '.join(names))
+
+    def render(self, template_name, key=None, **kwargs):
+        """Renders a template.
+
+        args:
+            template_name: Name of the template
+            key: Whatever the page depends on, besides the template.
+                 If supplied (and caching is on), the page is kept, and
+                 served again for as long as the key is the same.
+            kwargs: Arguments for the template
+
+        returns:
+            The rendered page
+        """
+        cacheable = self.cache and key is not None
+        if cacheable:
+            cached = self._rendered.get(template_name)
+            if cached is not None and cached[0] == key:
+                PAGE_RENDERS.labels(template_name, 'true').inc()
+                return cached[1]
+
+        page = self.loader.load(template_name).generate(**kwargs)
+        PAGE_RENDERS.labels(template_name, 'false').inc()
+
+        if cacheable:
+            self._rendered[template_name] = (key, page)
+        return page
@@ -18,21 +18,27 @@ Handles generating the root index page for web requests.
 
 __author__ = 'matt@nextdoor.com (Matt Wise)'
 
-from tornado import template
 from tornado import web
 
-from hooky import utils
-
+from hooky.web import pages as pages_module
 from hooky.version import __version__ as VERSION
 
 
 class RootHandler(web.RequestHandler):
     """Serves up the main / index page"""
 
-    def initialize(self):
-        """Log the initialization of this root handler"""
-        self.loader = template.Loader('%s/templates' %
-                                      utils.getStaticPath())
+    def initialize(self, pages=None):
+        """Stores the supplied Pages object for later use
+
+        args:
+            pages: A hooky.web.pages.Pages object to render with
+                   (def: Pages.instance())
+        """
+        if pages is None:
+            pages = pages_module.Pages.instance()
+        self.pages = pages
 
     def get(self):
-        self.write(self.loader.load('index.tmpl').generate(version=VERSION))
+        # Only the version goes into the page, so it never changes
+        self.write(self.pages.render('index.tmpl', key=VERSION,
+                                     version=VERSION))
@@ -1,8 +1,17 @@
+import os
+import shutil
+import tempfile
+
+import mock
 from tornado import testing
 
+from hooky import breaker
+from hooky import delivery
+from hooky import jsonbackend
 from hooky import runserver
 from hooky import utils
 from hooky.web import app
+from hooky.web import pages
 
 
 class TestApp(testing.AsyncHTTPTestCase):
@@ -40,9 +49,140 @@ class TestApp(testing.AsyncHTTPTestCase):
         response = self.wait()
         self.assertIn('githubToPost', response.body)
 
+    def testHookRootShowsBreakers(self):
+        """Test that the /hook handler lists the circuit breaker states"""
+        circuit = breaker.getBreaker('http://unittest.example.com/')
+        self.addCleanup(breaker.clearBreakers)
+        circuit.failure()
+        circuit.failure()
+        circuit.failure()
+        circuit.failure()
+        circuit.failure()
+
+        self.http_client.fetch(self.get_url('/hook'), self.stop)
+        response = self.wait()
+        self.assertIn('http://unittest.example.com/', response.body)
+        self.assertIn('<td>open</td>', response.body)
+
+    def testHookRootCached(self):
+        """Test that the /hook page is only rendered once while unchanged"""
+        rendered = pages.PAGE_RENDERS.labels('hook/index.tmpl', 'false')
+        cached = pages.PAGE_RENDERS.labels('hook/index.tmpl', 'true')
+        count = rendered.value
+
+        for i in xrange(3):
+            self.http_client.fetch(self.get_url('/hook'), self.stop)
+            self.assertIn('githubToPost', self.wait().body)
+
+        self.assertEquals(count + 1, rendered.value)
+        self.assertGreaterEqual(cached.value, 2)
+
     def testHookServesSubmitTemplate(self):
         """Test that the /hook/githubToPost handler works properly"""
         self.http_client.fetch(self.get_url('/hook/githubToPost'), self.stop)
         response = self.wait()
         self.assertIn('githubToPost', response.body)
         self.assertIn('name="Submit"', response.body)
+
+    def testMetrics(self):
+        """Test that /metrics serves per-hook metrics"""
+        self.http_client.fetch(self.get_url('/hook/githubToPost'), self.stop)
+        self.wait()
+
+        self.http_client.fetch(self.get_url('/metrics'), self.stop)
+        response = self.wait()
+        self.assertEquals(200, response.code)
+        self.assertTrue(response.headers['Content-Type'].startswith(
+            'text/plain'))
+        self.assertIn('# TYPE hooky_hook_request_seconds histogram',
+                      response.body)
+        self.assertIn('hooky_hook_requests_total{hook="githubToPost",'
+                      'code="200"}', response.body)
+
+
+class TestGetJournal(testing.unittest.TestCase):
+    def testNoJournal(self):
+        """Test that no journal is built unless one is configured"""
+        self.assertEquals(None, app.getJournal({}))
+
+    def testJournal(self):
+        """Test that the journal settings are read from [general]"""
+        j = app.getJournal({'journal': '/tmp/hooky-journal',
+                            'journal_fsync': 'always',
+                            'journal_fsync_interval': '0.5',
+                            'journal_segment_bytes': '1024'})
+        self.assertEquals('/tmp/hooky-journal', j.path)
+        self.assertEquals('always', j.fsync)
+        self.assertEquals(0.5, j.fsync_interval)
+        self.assertEquals(1024, j.segment_bytes)
+
+    def testWorkerJournal(self):
+        """Test that each worker process gets its own journal"""
+        j = app.getJournal({'journal': '/tmp/hooky-journal'}, task_id=2)
+        self.assertEquals('/tmp/hooky-journal/worker-2', j.path)
+
+
+class TestOrphanedJournals(testing.unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        for name in ('worker-0', 'worker-1', 'worker-2', 'worker-x'):
+            os.mkdir(os.path.join(self.path, name))
+        self.general = {'journal': self.path}
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _orphans(self, task_id, processes):
+        return [os.path.basename(path) for path in app.getOrphanedJournals(
+            self.general, task_id, processes)]
+
+    def testSingleProcess(self):
+        """Test that a single process adopts every worker's journal"""
+        self.assertEquals(['worker-0', 'worker-1', 'worker-2'],
+                          self._orphans(None, 1))
+
+    def testFewerWorkers(self):
+        """Test that worker 0 adopts the journals of workers now gone"""
+        self.assertEquals([os.path.basename(self.path), 'worker-2'],
+                          self._orphans(0, 2))
+        self.assertEquals([], self._orphans(1, 2))
+        self.assertEquals([], app.getOrphanedJournals({}, 0, 2))
+
+
+class TestReconfigure(testing.unittest.TestCase):
+    def setUp(self):
+        self.application = mock.Mock(
+            settings={'queue': delivery.DeliveryQueue(workers=1, size=1)})
+
+    def tearDown(self):
+        jsonbackend.configure()
+
+    def testApplied(self):
+        """Test that reloadable settings are applied"""
+        with mock.patch.object(app.jsonbackend, 'configure') as configure:
+            app.reconfigure(self.application, {},
+                            {'queue_workers': '4', 'queue_size': '20',
+                             'journal_retries': '5',
+                             'journal_retry_backoff': '0.5',
+                             'json_backend': 'stdlib'})
+        configure.assert_called_once_with('stdlib')
+
+        queue = self.application.settings['queue']
+        self.assertEquals((4, 20), (queue.workers, queue.size))
+        self.assertEquals((5, 0.5), (queue.retries, queue.retry_backoff))
+
+    def testUnchanged(self):
+        """Test that nothing is redone for settings that didn't change"""
+        with mock.patch.object(app.executor, 'configure') as configure:
+            app.reconfigure(self.application, {'executor': 'none'},
+                            {'executor': 'none'})
+        self.assertFalse(configure.called)
+
+    def testRestartOnly(self):
+        """Test that settings needing a restart are only warned about"""
+        with mock.patch.object(app.log, 'warning') as warning:
+            with mock.patch.object(app.clients, 'configure') as configure:
+                app.reconfigure(self.application, {'max_clients': 10},
+                                {'max_clients': 20})
+        self.assertFalse(configure.called)
+        self.assertEquals(1, warning.call_count)
@@ -1,11 +1,160 @@
-from tornado import web
-from tornado import testing
+import os
+import shutil
+import tempfile
+import time
+
+import mock
+from tornado import gen
 from tornado import httpclient
+from tornado import httpserver
+from tornado import httputil
+from tornado import ioloop
+from tornado import testing
+from tornado import web
+from tornado.testing import unittest
 
+from hooky import delivery
+from hooky import shutdown
 from hooky import utils
 from hooky import runserver
+from hooky.config import file
+from hooky.translators import base
+from hooky.translators import parsers
 from hooky.web import hook
 
+# Config used by the fan-out tests below. All of the translators are
+# DelayTranslator objects defined in this module.
+FANOUT_CONFIG = """
+[general]
+templates: templates
+max_body_bytes: 1000
+
+[all]
+type: hook
+translators: Ok, Ok2
+
+[mixed]
+type: hook
+translators: Ok, Fail
+
+[none]
+type: hook
+translators: Fail, Fail
+
+[slow]
+type: hook
+translators: Ok, Slow
+timeout: 0.1
+
+[parallel]
+type: hook
+translators: Delay, Delay2, Delay3
+
+[capped]
+type: hook
+translators: Delay, Delay2, Delay3
+concurrency: 1
+
+[queued]
+type: hook
+translators: Slow
+mode: async
+
+[limited]
+type: hook
+translators: Ok
+max_body_bytes: 10
+
+[Ok]
+type: translator
+translator: hooky.web.test.test_hook.DelayTranslator
+
+[Ok2]
+type: translator
+translator: hooky.web.test.test_hook.DelayTranslator
+
+[Fail]
+type: translator
+translator: hooky.web.test.test_hook.DelayTranslator
+success: false
+
+[Slow]
+type: translator
+translator: hooky.web.test.test_hook.DelayTranslator
+delay: 5
+
+[Delay]
+type: translator
+translator: hooky.web.test.test_hook.DelayTranslator
+delay: 0.2
+
+[Delay2]
+type: translator
+translator: hooky.web.test.test_hook.DelayTranslator
+delay: 0.2
+
+[Delay3]
+type: translator
+translator: hooky.web.test.test_hook.DelayTranslator
+delay: 0.2
+"""
+
+
+class DelayTranslator(base.BaseTranslator):
+    """Translator that waits a while, then succeeds or fails."""
+
+    # Number of DelayTranslators running right now, and the peak
+    running = 0
+    peak = 0
+
+    def __init__(self, delay=0, success=True):
+        self.delay = float(delay)
+        self.success = success
+
+    @gen.coroutine
+    def submit(self, request):
+        DelayTranslator.running += 1
+        DelayTranslator.peak = max(DelayTranslator.peak,
+                                   DelayTranslator.running)
+        try:
+            io_loop = ioloop.IOLoop.current()
+            yield gen.Task(io_loop.add_timeout, time.time() + self.delay)
+        finally:
+            DelayTranslator.running -= 1
+
+        raise gen.Return({'success': self.success,
+                          'message': 'done after %s' % self.delay})
+
+
+class TestBodyReader(unittest.TestCase):
+    def setUp(self):
+        source_path = '%s/test_data/sources' % utils.getRootPath()
+        self.xml = open('%s/shopify.xml' % source_path, 'r').read()
+
+    def _read(self, content_type, body):
+        """Feeds a body through a BodyReader in small chunks"""
+        reader = hook.BodyReader(content_type)
+        for i in xrange(0, len(body), 64):
+            reader.feed(body[i:i + 64])
+        self.assertEquals(len(body), reader.size)
+        self.assertEquals(body, reader.close())
+        return reader
+
+    def testParsesXML(self):
+        """Test that XML bodies are parsed as they arrive"""
+        reader = self._read('application/xml', self.xml)
+        self.assertEquals(parsers.parseXML(self.xml), reader.parsed)
+
+    def testBadXML(self):
+        """Test that a body that fails to parse is still collected"""
+        reader = self._read('application/xml', '<a><b></a>')
+        self.assertEquals(None, reader.parsed)
+
+    def testNoFeedParser(self):
+        """Test that other bodies are just collected"""
+        reader = self._read('application/json', '{"foo": "bar"}')
+        self.assertEquals(None, reader.parsed)
+
 
 class HookHandlerIntegrationTests(testing.AsyncHTTPTestCase):
     def get_app(self):
@@ -108,3 +257,206 @@ class HookHandlerIntegrationTests(testing.AsyncHTTPTestCase):
         self.http_client.fetch(req, self.stop)
         response = self.wait()
         self.assertEquals(200, response.code)
+
+
+class HookHandlerFanOutTests(testing.AsyncHTTPTestCase):
+    def get_app(self):
+        self.tmpdir = tempfile.mkdtemp()
+        cfg_file = os.path.join(self.tmpdir, 'config.ini')
+        open(cfg_file, 'w').write(FANOUT_CONFIG)
+        config = file.FileConfig(cfg_file)
+
+        DelayTranslator.peak = 0
+        DelayTranslator.running = 0
+        self.tracker = shutdown.Tracker()
+        return web.Application([
+            (r"/hook/(.*)", hook.HookHandler,
+             {'config': config, 'queue': delivery.DeliveryQueue(),
+              'tracker': self.tracker})])
+
+    def tearDown(self):
+        super(HookHandlerFanOutTests, self).tearDown()
+        shutil.rmtree(self.tmpdir)
+
+    def _post(self, hook, body='{"foo":"bar"}'):
+        """POSTs a simple JSON body to the supplied hook"""
+        req = httpclient.HTTPRequest(url=self.get_url('/hook/%s' % hook),
+                                     method='POST', body=body)
+        self.http_client.fetch(req, self.stop)
+        return self.wait(timeout=10)
+
+    def testAllSucceed(self):
+        """Every translator is called, and all succeeding returns a 200"""
+        response = self._post('all')
+        self.assertEquals(200, response.code)
+        self.assertIn('Ok (OK)', response.body)
+        self.assertIn('Ok2 (OK)', response.body)
+
+    def testSomeFail(self):
+        """A mix of success and failure returns a 207"""
+        response = self._post('mixed')
+        self.assertEquals(207, response.code)
+        self.assertIn('Ok (OK)', response.body)
+        self.assertIn('Fail (FAILED)', response.body)
+
+    def testAllFail(self):
+        """All translators failing returns a 502"""
+        response = self._post('none')
+        self.assertEquals(502, response.code)
+
+    def testTimeout(self):
+        """Translators that take longer than the timeout fail"""
+        start = time.time()
+        response = self._post('slow')
+        self.assertLess(time.time() - start, 2)
+        self.assertEquals(207, response.code)
+        self.assertIn('Slow (FAILED): Timed out', response.body)
+
+    def testConcurrent(self):
+        """Translators run at the same time, not one after the other"""
+        start = time.time()
+        response = self._post('parallel')
+        self.assertEquals(200, response.code)
+        self.assertEquals(3, DelayTranslator.peak)
+        self.assertLess(time.time() - start, 0.5)
+
+    def testConcurrencyCap(self):
+        """The per-hook concurrency setting limits the fan-out"""
+        response = self._post('capped')
+        self.assertEquals(200, response.code)
+        self.assertEquals(1, DelayTranslator.peak)
+
+    def testAsyncMode(self):
+        """Async hooks respond with a 202 without waiting for translators"""
+        start = time.time()
+        response = self._post('queued')
+        self.assertLess(time.time() - start, 2)
+        self.assertEquals(202, response.code)
+        self.assertIn('Queued', response.body)
+
+    def testBodyLimit(self):
+        """Bodies over the hook's max_body_bytes are turned away"""
+        response = self._post('limited')
+        self.assertEquals(413, response.code)
+        self.assertIn('larger than 10 bytes', response.body)
+        self.assertEquals(0, DelayTranslator.peak)
+
+        self.assertEquals(200, self._post('limited', '{}').code)
+
+    def testDefaultBodyLimit(self):
+        """Hooks without their own limit use the [general] one"""
+        self.assertEquals(200, self._post('all').code)
+        body = '{"foo": "%s"}' % ('x' * 1000)
+        self.assertEquals(413, self._post('all', body).code)
+
+    def testTracked(self):
+        """Requests are counted until their response is sent"""
+        req = httpclient.HTTPRequest(url=self.get_url('/hook/parallel'),
+                                     method='POST', body='{"foo":"bar"}')
+        self.http_client.fetch(req, self.stop)
+        self.io_loop.add_timeout(time.time() + 0.1, self.stop)
+        self.wait()
+        self.assertEquals(1, len(self.tracker))
+
+        response = self.wait(timeout=10)
+        self.assertEquals(200, response.code)
+        self.assertEquals(0, len(self.tracker))
+
+    def testClosing(self):
+        """Connections are not kept alive while shutting down"""
+        self.assertNotEquals('close', self._post('all').headers.get(
+            'Connection'))
+        self.tracker.closing = True
+        response = self._post('all')
+        self.assertEquals(200, response.code)
+        self.assertEquals('close', response.headers.get('Connection'))
+
+
+class HookHandlerStreamingTests(testing.AsyncTestCase):
+    """Drives a HookHandler the way a streaming tornado (4.0+) would.
+
+    The handler is built by hand on a fake connection, and prepare(),
+    data_received() and post() are called in turn, as tornado does for
+    handlers wrapped with stream_request_body.
+    """
+
+    def setUp(self):
+        super(HookHandlerStreamingTests, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        cfg_file = os.path.join(self.tmpdir, 'config.ini')
+        open(cfg_file, 'w').write(FANOUT_CONFIG)
+        self.config = file.FileConfig(cfg_file)
+        DelayTranslator.peak = 0
+        DelayTranslator.running = 0
+
+        patcher = mock.patch.object(hook, 'STREAMING', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(HookHandlerStreamingTests, self).tearDown()
+
+    def _handler(self, name, headers):
+        """Builds a handler for a POST to a hook, with no body read yet"""
+        self.connection = mock.Mock()
+        request = httpserver.HTTPRequest(
+            'POST', '/hook/%s' % name, connection=self.connection,
+            remote_ip='127.0.0.1',
+            headers=httputil.HTTPHeaders(headers))
+        request.body = None
+        handler = hook.HookHandler(
+            web.Application(), request, config=self.config,
+            queue=delivery.DeliveryQueue(), tracker=shutdown.Tracker())
+        handler.path_args = [name]
+        handler._transforms = []
+        return handler
+
+    def _written(self):
+        return ''.join(c[0][0] for c in self.connection.write.call_args_list)
+
+    @gen.coroutine
+    def _stream(self, handler, body, chunk_size=4):
+        """Streams a body into a handler, and then handles the request"""
+        handler.prepare()
+        if handler._finished:
+            return
+        for i in xrange(0, len(body), chunk_size):
+            handler.data_received(body[i:i + chunk_size])
+        yield handler.post(handler.path_args[0])
+
+    @testing.gen_test
+    def testStreamed(self):
+        """Test that a streamed body is put back together and handled"""
+        handler = self._handler('all', {'Content-Type': 'application/xml'})
+        yield self._stream(handler, '<a><b>1</b></a>')
+
+        self.assertEquals(200, handler.get_status())
+        self.assertEquals('<a><b>1</b></a>', handler.request.body)
+        self.assertEquals({'a': {'b': '1'}}, handler.parsed)
+        self.assertEquals(2, DelayTranslator.peak)
+
+    @testing.gen_test
+    def testContentLengthLimit(self):
+        """Test that a Content-Length over the limit is turned away early"""
+        handler = self._handler('limited', {'Content-Length': '11'})
+        yield self._stream(handler, 'x' * 11)
+
+        self.assertEquals(413, handler.get_status())
+        self.assertTrue(handler.reader is None)
+        self.assertIn('larger than 10 bytes', self._written())
+
+    @testing.gen_test
+    def testChunkedLimit(self):
+        """Test that a chunked body over the limit gets a 413, not a 400"""
+        handler = self._handler('limited', {'Transfer-Encoding': 'chunked'})
+        yield self._stream(handler, '{"foo": "%s"}' % ('x' * 100))
+
+        self.assertEquals(413, handler.get_status())
+        self.assertIn('larger than 10 bytes', self._written())
+        self.assertEquals(0, DelayTranslator.peak)
+        self.assertFalse(self.connection.set_max_body_size.called)
+
+        handler = self._handler('limited', {'Transfer-Encoding': 'chunked'})
+        yield self._stream(handler, '{}')
+        self.assertEquals(200, handler.get_status())
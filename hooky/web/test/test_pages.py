@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+
+from tornado import testing
+
+from hooky.web import pages
+
+
+class TestPages(testing.unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        with open(os.path.join(self.path, 'page.tmpl'), 'w') as f:
+            f.write('{{ name }}')
+
+    def _compiles(self, page):
+        """Counts how often page.tmpl is compiled while page renders"""
+        compiled = []
+        load = page.loader._create_template
+
+        def create(name):
+            compiled.append(name)
+            return load(name)
+
+        page.loader._create_template = create
+        return compiled
+
+    def testPrecompile(self):
+        """Test that the templates the handlers use are compiled up front"""
+        page = pages.Pages()
+        page.precompile()
+        self.assertEquals(sorted(pages.TEMPLATES),
+                          sorted(page.loader.templates))
+
+    def testPrecompileMissing(self):
+        """Test that a missing template is found at startup"""
+        page = pages.Pages(self.path)
+        self.assertRaises(IOError, page.precompile)
+
+    def testTemplateCompiledOnce(self):
+        """Test that a template is only compiled the first time it is used"""
+        page = pages.Pages(self.path)
+        compiled = self._compiles(page)
+        self.assertEquals('a', page.render('page.tmpl', name='a'))
+        self.assertEquals('b', page.render('page.tmpl', name='b'))
+        self.assertEquals(['page.tmpl'], compiled)
+
+    def testCachedByKey(self):
+        """Test that a page is only rendered again when its key changes"""
+        page = pages.Pages(self.path)
+        self.assertEquals('a', page.render('page.tmpl', key=1, name='a'))
+        self.assertEquals('a', page.render('page.tmpl', key=1, name='b'))
+        self.assertEquals('c', page.render('page.tmpl', key=2, name='c'))
+
+    def testCacheDisabled(self):
+        """Test that pages are always rendered with the cache turned off"""
+        page = pages.Pages(self.path, cache=False)
+        self.assertEquals('a', page.render('page.tmpl', key=1, name='a'))
+        self.assertEquals('b', page.render('page.tmpl', key=1, name='b'))
@@ -112,7 +112,10 @@ setup(
     setup_requires=[ 'setuptools', 'coverage', 'unittest2' ],
     install_requires=[
         'tornado',
-        'pystache',
+        # hooky.translators.extract walks pystache's parse tree, which has
+        # no public API, so stick to the versions it is tested with. Any
+        # node it doesn't recognize just turns off selective parsing.
+        'pystache>=0.5.4,<0.6',
         'xmltodict',
         'setuptools',
     ],